@@ -1,23 +1,136 @@
 '''
 A module with convenience functions for bitarray.
 
+The ``endian`` argument of each function refers to the order of the bit
+sequence (``'big'``: the first bit is the most significant bit, ``'little'``:
+the first bit is the least significant bit), independent of the endianness
+of the ``bitarray`` objects themselves.
+
+Batch versions of the conversions (``fromuint_many`` and ``touint_many``)
+operate on ``numpy`` arrays with one row of bits per value.
+
 '''
+import operator
+
 from bitarray import bitarray
+import numpy as np
+
+#: Lookup table to reverse the bit order within a byte, used with ``bytes.translate``
+reversed_bits_table = bytes(int('{:08b}'.format(i)[::-1], 2) for i in range(256))
+
+#: Maximum width of the precomputed bitarrays used by ``fromuint``
+small_nbits = 8
+
+#: Minimum width converted via ``int.to_bytes``/``int.from_bytes``, narrower
+#: values are faster to convert via a binary string
+large_nbits = 64
+
+# _small_bitarrays[<endian>][<nbits>][<val>], the bits of every value up to small_nbits wide
+_small_bitarrays = dict(
+    (endian, [
+        [bitarray('{:0{}b}'.format(val, nbits)[::1 if endian == 'big' else -1]) if nbits else bitarray()
+            for val in range(1 << nbits)]
+        for nbits in range(small_nbits + 1)])
+    for endian in ('big', 'little'))
+
+def _bitarray_endian(bits):
+    # ``endian`` is a method in older versions of bitarray and a property in newer ones
+    endian = bits.endian
+    return endian() if callable(endian) else endian
 
 def fromuint(val, nbits, endian='big'):
     try:
         if isinstance(nbits, slice):
             nbits = abs(nbits.stop - nbits.start)
+        if nbits <= small_nbits:
+            if 0 <= val < 1 << nbits:
+                return _small_bitarrays['big' if endian[0] == 'b' else 'little'][nbits][val].copy()
+        elif nbits >= large_nbits:
+            val = operator.index(val)
+            if 0 <= val and not val >> nbits:
+                nbytes = (nbits + 7) // 8
+                bits = bitarray(endian='big')
+                if endian[0] == 'b':
+                    bits.frombytes(val.to_bytes(nbytes, 'big'))
+                    del bits[:8*nbytes - nbits]
+                else:
+                    bits.frombytes(val.to_bytes(nbytes, 'little').translate(reversed_bits_table))
+                    del bits[nbits:]
+                return bits
         if endian[0] == 'b':
-            string = bin(val)[2:].zfill(nbits)
-            return bitarray(string)
-        string = bin(val)[-1:1:-1].ljust(nbits,'0')
-        return bitarray(string)
+            return bitarray(bin(val)[2:].zfill(nbits))
+        return bitarray(bin(val)[-1:1:-1].ljust(nbits,'0'))
     except TypeError:
         return val
 
 def touint(bits, endian='big'):
-    bin_string = bits.to01()
+    nbits = len(bits)
+    if 0 < nbits <= 8:
+        byte = bits.tobytes()[0]
+        if _bitarray_endian(bits) == 'little':
+            byte = reversed_bits_table[byte]
+        if endian[0] == 'b':
+            return byte >> (8 - nbits)
+        return reversed_bits_table[byte]
+    if nbits < large_nbits:
+        if endian[0] == 'b':
+            return int(bits.to01(), 2)
+        return int(bits.to01()[::-1], 2)
+    data = bits.tobytes()
+    if endian[0] == 'b':
+        if _bitarray_endian(bits) == 'little':
+            data = data.translate(reversed_bits_table)
+        return int.from_bytes(data, 'big') >> (-nbits % 8)
+    if _bitarray_endian(bits) == 'big':
+        data = data.translate(reversed_bits_table)
+    return int.from_bytes(data, 'little')
+
+def fromuint_many(vals, nbits, endian='big'):
+    '''
+    Convert an array of unsigned integers into bits, batch version of
+    ``fromuint``. Values wider than ``nbits`` are truncated.
+
+    :param vals: array-like of unsigned integers (up to 64 bits)
+
+    :param nbits: number of bits for each value (or a ``slice`` with the width)
+
+    :param endian: order of the bits in each row
+
+    :returns: ``numpy`` array of ``uint8`` 0/1 values with shape ``(len(vals), nbits)``
+
+    '''
+    if isinstance(nbits, slice):
+        nbits = abs(nbits.stop - nbits.start)
+    vals = np.asarray(vals, dtype=np.uint64).reshape(-1)
+    if endian[0] == 'b':
+        vals_bytes = vals.astype('>u8').view(np.uint8).reshape(-1, 8)
+        return np.unpackbits(vals_bytes, axis=1, bitorder='big')[:, 64-nbits:]
+    vals_bytes = vals.astype('<u8').view(np.uint8).reshape(-1, 8)
+    return np.unpackbits(vals_bytes, axis=1, bitorder='little')[:, :nbits]
+
+def touint_many(bits, endian='big'):
+    '''
+    Convert many sequences of bits into unsigned integers, batch version of
+    ``touint``.
+
+    :param bits: 2D array-like of 0/1 values with one row per value (up to 64 columns), or a sequence of equal-length ``bitarray`` objects
+
+    :param endian: order of the bits in each row
+
+    :returns: ``numpy`` array of ``uint64``
+
+    '''
+    if len(bits) and isinstance(bits[0], bitarray):
+        all_bits = bitarray(endian='big')
+        for row in bits:
+            all_bits.extend(row)
+        bits = np.frombuffer(all_bits.unpack(), dtype=np.uint8).reshape(len(bits), -1)
+    bits = np.asarray(bits, dtype=np.uint8)
+    if bits.ndim == 1:
+        bits = bits.reshape(1, -1) if len(bits) else bits.reshape(0, 0)
+    padded = np.zeros((bits.shape[0], 64), dtype=np.uint8)
     if endian[0] == 'b':
-        return int(bin_string, 2)
-    return int(bin_string[::-1], 2)
+        padded[:, 64-bits.shape[1]:] = bits
+        return np.packbits(padded, axis=1, bitorder='big').view('>u8').reshape(-1).astype(np.uint64)
+    padded[:, :bits.shape[1]] = bits
+    return np.packbits(padded, axis=1, bitorder='little').view('<u8').reshape(-1).astype(np.uint64)
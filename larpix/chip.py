@@ -1,4 +1,5 @@
 from .key import Key
+from . import bitarrayhelper as bah
 from .configuration import Configuration_v1, Configuration_v2, Configuration_v2b, Configuration_Lightpix_v1
 from .packet import Packet_v1, Packet_v2
 
@@ -100,6 +101,35 @@ class Chip(object):
             packets.append(packet)
         return packets
 
+    def get_configuration_packet_array(self, packet_type, registers=None):
+        '''
+        Return a ``PacketArray`` to read or write (depending on
+        ``packet_type``) the specified configuration registers (or all
+        registers by default). Equivalent to ``get_configuration_packets``,
+        but builds all of the packets at once. Only valid for v2 asics.
+
+        '''
+        if self.asic_version == 1:
+            raise ValueError('PacketArray is only valid for v2 asics')
+        conf = self.config
+        if registers is None:
+            registers = range(conf.num_registers)
+        register_address, data = conf.some_data(registers)
+        if packet_type == Packet_v2.CONFIG_WRITE_PACKET:
+            register_data = bah.touint_many(data, endian=Packet_v2.endian)
+        elif packet_type == Packet_v2.CONFIG_READ_PACKET:
+            register_data = 0
+        else:
+            raise ValueError('incorrect packet_type for configuration packets')
+        return Packet_v2.from_arrays(
+            packet_type=packet_type,
+            chip_id=self.chip_id,
+            register_address=register_address,
+            register_data=register_data,
+            io_group=self.io_group,
+            io_channel=self.io_channel
+            )
+
     def get_configuration_write_packets(self, registers=None):
         '''
         Return a list of Packet objects to write corresponding to the specified
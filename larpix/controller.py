@@ -10,7 +10,7 @@ from . import configs
 from .key import Key
 from .chip import Chip
 from .configuration import Configuration_v1, Configuration_v2, Configuration_Lightpix_v1
-from .packet import Packet_v1, Packet_v2, PacketCollection
+from .packet import Packet_v1, Packet_v2, PacketCollection, dedupe
 from . import bitarrayhelper as bah
 
 
@@ -1272,7 +1272,7 @@ class Controller(object):
                 (register, (None, None))
                 for register in chip_registers]))
             for chip_key, chip_registers in registers.items()])
-        for packet in self.reads[-1]:
+        for packet in dedupe(self.reads[-1].packets):
             packet_key = packet.chip_key
             if (hasattr(packet, 'CONFIG_READ_PACKET') and packet.packet_type == packet.CONFIG_READ_PACKET):
                 register_address = packet.register_address
@@ -13,7 +13,8 @@ Packet-like objects and an HDF5 data file. ``from_file`` can be used to
 load up the full file all at once or just a subset of rows (supposing
 the full file was too big to fit in memory). To access the data most
 efficiently, do not rely on ``from_file`` and instead perform analysis
-directly on the HDF5 data file.
+directly on the HDF5 data file, or use ``iter_file`` to read the file in
+chunks of rows (as ``numpy`` arrays or ``PacketArray`` objects).
 
 File Header
 -----------
@@ -57,6 +58,29 @@ File Data
 The file data is saved in HDF5 datasets, and the specific data format
 depends on the LArPix+HDF5 version.
 
+Packet index
+^^^^^^^^^^^^
+
+For versions 2.3 and later, an optional index of the ``packets`` dataset can
+be written by ``HDF5Writer`` (or ``to_file``) with ``index=True``. The index
+is used by ``select`` to read only the parts of the ``packets`` dataset that
+can contain the requested chips or time range. The index is stored in the
+``/_index`` HDF5 group, which has a ``block_size`` attribute with the
+maximum number of rows in each indexed row range, and two datasets:
+
+    - ``ranges``: one row per range of rows in the ``packets`` dataset,
+      with fields ``start`` and ``stop`` (``u8``) giving the row range and
+      ``timestamp_min``, ``timestamp_max`` (``u8``),
+      ``receipt_timestamp_min``, and ``receipt_timestamp_max`` (``u4``)
+      giving the range of the ``timestamp`` and ``receipt_timestamp``
+      fields in the row range
+
+    - ``chip_keys``: one row per chip in each range of rows, with fields
+      ``range`` (``u8``) giving the row in ``ranges`` and ``io_group``,
+      ``io_channel``, and ``chip_id`` (``u1``) giving the chip key
+
+Once a file has an index, it is kept up to date by ``HDF5Writer``.
+
 Version 2.4 description
 ^^^^^^^^^^^^^^^^^^^^^^^
 
@@ -347,11 +371,13 @@ import multiprocessing
 
 import h5py
 import numpy as np
+from numpy.lib import recfunctions
 import struct
 
-from larpix.larpix import Packet_v1, Packet_v2, TimestampPacket, MessagePacket, SyncPacket, TriggerPacket, Chip, Configuration_Lightpix_v1, Key
+from larpix.larpix import Packet_v1, Packet_v2, CompactPacket_v1, CompactPacket_v2, PacketView, TimestampPacket, MessagePacket, SyncPacket, TriggerPacket, PacketArray, Chip, Configuration_Lightpix_v1, Key
 from larpix.logger import Logger
 from .. import bitarrayhelper as bah
+from ..packet.packet_array import _encode_aux_words
 _max_config_registers = Configuration_Lightpix_v1.num_registers
 
 #: The most recent / up-to-date LArPix+HDF5 format version
@@ -444,6 +470,29 @@ dtypes['2.4']['configs'] = [
     ('registers','({},)u1'.format(_max_config_registers))
 ]
 
+#: The dtype specification of the optional packet index datasets (see
+#: ``HDF5Writer``).
+#:
+#: Structure: ``{dset_name: [structured dtype fields]}``
+index_dtypes = {
+    'ranges': [
+        ('start','u8'),
+        ('stop','u8'),
+        ('timestamp_min','u8'),
+        ('timestamp_max','u8'),
+        ('receipt_timestamp_min','u4'),
+        ('receipt_timestamp_max','u4'),
+        ],
+    'chip_keys': [
+        ('range','u8'),
+        ('io_group','u1'),
+        ('io_channel','u1'),
+        ('chip_id','u1'),
+        ]
+    }
+#: Default maximum number of rows in each range of the packet index
+default_index_block_size = 65536
+
 #: A map between attribute name and "column index" in the structured
 #: dtypes.
 #:
@@ -610,7 +659,7 @@ def _format_packets_packet_v2_0(pkt, version='2.0', dset='packets', *args, **kwa
     encoded_packet = _format_packets_packet_v1_0(pkt, version=version, dset=dset)
     if encoded_packet is not None:
         encoded_packet[dtype_property_index_lookup[version][dset]['packet_type']] = pkt.packet_type
-        if isinstance(pkt, Packet_v2) and pkt.fifo_diagnostics_enabled:
+        if isinstance(pkt, (Packet_v2, CompactPacket_v2)) and pkt.fifo_diagnostics_enabled:
             encoded_packet[dtype_property_index_lookup[version][dset]['fifo_diagnostics_enabled']] = 1
     return encoded_packet
 
@@ -721,8 +770,8 @@ def _format_configs_chip_v2_4(chip, version='2.4', dset='configs', timestamp=0,
     row['io_channel'] = chip.io_channel
     row['chip_id'] = chip.chip_id
     endian='big' if chip.asic_version == 1 else 'little'
-    for i,bits in enumerate(chip.config.all_data()):
-        row['registers'][0,i] = bah.touint(bits, endian=endian)
+    registers = bah.touint_many(chip.config.all_data(), endian=endian)
+    row['registers'][0,:len(registers)] = registers
     return row
 
 def _parse_configs_v2_4(row, asic_version, *args, **kwargs):
@@ -746,12 +795,14 @@ _format_method_lookup = {
     '0.0': {
         'raw_packet': {
             Packet_v1: _format_raw_packet_v0_0,
+            CompactPacket_v1: _format_raw_packet_v0_0,
             TimestampPacket: _format_raw_packet_v0_0
         }
     },
     '1.0': {
         'packets': {
             Packet_v1: _format_packets_packet_v1_0,
+            CompactPacket_v1: _format_packets_packet_v1_0,
             TimestampPacket: _format_packets_packet_v1_0,
             MessagePacket: _format_packets_packet_v1_0
         },
@@ -762,6 +813,8 @@ _format_method_lookup = {
     '2.0': {
         'packets': {
             Packet_v2: _format_packets_packet_v2_0,
+            CompactPacket_v2: _format_packets_packet_v2_0,
+            PacketView: _format_packets_packet_v2_0,
             TimestampPacket: _format_packets_packet_v2_0,
             MessagePacket: _format_packets_packet_v2_0
         },
@@ -772,6 +825,8 @@ _format_method_lookup = {
     '2.1': {
         'packets': {
             Packet_v2: _format_packets_packet_v2_1,
+            CompactPacket_v2: _format_packets_packet_v2_1,
+            PacketView: _format_packets_packet_v2_1,
             TimestampPacket: _format_packets_packet_v2_1,
             MessagePacket: _format_packets_packet_v2_1
         },
@@ -782,6 +837,8 @@ _format_method_lookup = {
     '2.2': {
         'packets': {
             Packet_v2: _format_packets_packet_v2_1,
+            CompactPacket_v2: _format_packets_packet_v2_1,
+            PacketView: _format_packets_packet_v2_1,
             TimestampPacket: _format_packets_packet_v2_1,
             MessagePacket: _format_packets_packet_v2_1,
             SyncPacket: _format_packets_packet_v2_2,
@@ -794,6 +851,8 @@ _format_method_lookup = {
     '2.3': {
         'packets': {
             Packet_v2: _format_packets_packet_v2_3,
+            CompactPacket_v2: _format_packets_packet_v2_3,
+            PacketView: _format_packets_packet_v2_3,
             TimestampPacket: _format_packets_packet_v2_3,
             MessagePacket: _format_packets_packet_v2_3,
             SyncPacket: _format_packets_packet_v2_3,
@@ -806,6 +865,8 @@ _format_method_lookup = {
     '2.4': {
         'packets': {
             Packet_v2: _format_packets_packet_v2_3,
+            CompactPacket_v2: _format_packets_packet_v2_3,
+            PacketView: _format_packets_packet_v2_3,
             TimestampPacket: _format_packets_packet_v2_3,
             MessagePacket: _format_packets_packet_v2_3,
             SyncPacket: _format_packets_packet_v2_3,
@@ -862,78 +923,174 @@ def _encode_packet(packet, version, packet_dset_name):
         return(tuple(encoded_packet))
     return False
 
-def to_file(filename, packet_list=None, chip_list=None, mode='a', version=None, workers=None):
+#: Format versions that ``PacketArray`` objects can be written to
+#: without converting to packet objects
+columnar_versions = ('2.3', '2.4')
+
+def _encode_packet_array(packets, version, direction=0):
     '''
-    Save the given packets to the given file.
+    Vectorized equivalent of ``_encode_packet`` for all of the packets in a
+    ``PacketArray``, returns a structured array with the ``packets`` dtype
+
+    '''
+    encoded_packets = np.zeros((len(packets),), dtype=dtypes[version]['packets'])
+    larpix_packets = packets.aux_type == 0
+    for name in encoded_packets.dtype.names:
+        if name in PacketArray.fields:
+            values = getattr(packets, name)
+            if values is not None:
+                encoded_packets[name] = values
+    encoded_packets['io_group'] = packets.io_group
+    encoded_packets['io_channel'] = np.where(larpix_packets, packets.io_channel, 0)
+    encoded_packets['receipt_timestamp'] = np.where(larpix_packets, packets.receipt_timestamp, 0)
+    encoded_packets['valid_parity'] = packets.has_valid_parity() & larpix_packets
+    encoded_packets['fifo_diagnostics_enabled'] = larpix_packets & bool(packets.fifo_diagnostics_enabled)
+    encoded_packets['direction'] = np.where(larpix_packets, np.asarray(direction), 0)
+    return encoded_packets
+
+def _to_packet_array(packet_list):
+    '''
+    Convert a list of ``Packet_v2`` (and ``TimestampPacket``, ``SyncPacket``,
+    or ``TriggerPacket``) objects to a ``PacketArray``, so that it can be
+    encoded with ``_encode_packet_array``. Returns ``None`` if the list
+    contains any other packet types, or LArPix packets with different
+    ``fifo_diagnostics_enabled`` settings.
 
-    This method can be used to update an existing file.
+    '''
+    fifo_diagnostics_enabled = set()
+    for packet in packet_list:
+        if isinstance(packet, (Packet_v2, CompactPacket_v2)):
+            fifo_diagnostics_enabled.add(bool(packet.fifo_diagnostics_enabled))
+        elif not isinstance(packet, (TimestampPacket, SyncPacket, TriggerPacket)):
+            return None
+    if not packet_list or len(fifo_diagnostics_enabled) > 1:
+        return None
+    packet_array = PacketArray.from_packets(packet_list)
+    if fifo_diagnostics_enabled:
+        packet_array.fifo_diagnostics_enabled = fifo_diagnostics_enabled.pop()
+    return packet_array
+
+class HDF5Writer(object):
+    '''
+    Writes packets and chip configurations to a LArPix+HDF5 file that is
+    kept open between writes. E.g.::
+
+        with HDF5Writer('output.h5') as writer:
+            for packets in packet_batches:
+                writer.append(packets)
+            writer.append_configs(chips)
+
+    ``to_file`` opens the file, checks the header, and resizes the datasets
+    on each call. ``HDF5Writer`` does that once, and grows the datasets
+    geometrically (by ``growth_factor``) as packets are appended. The unused
+    rows at the end of the datasets are removed by ``flush`` (unless
+    ``trim=False``) and ``close``, so the file should not be read before one
+    of them is called.
+
+    The packets that can be appended are the same as for ``to_file``.
 
     :param filename: the name of the file to save to
-    :param packet_list: any iterable of objects of type ``Packet``,
-        ``TimestampPacket``, ``SyncPacket``, or ``TriggerPacket``.
-    :param chip_list: any iterable of objects of type ``Chip``.
     :param mode: optional, the "file mode" to open the data file
         (default: ``'a'``)
-    :param version: optional, the LArPix+HDF5 format version to use. If
-        writing a new file and version is unspecified or ``None``,
-        the latest version will be used. If writing an existing file
-        and version is unspecified or ``None``, the existing file's
-        version will be used. If writing an existing file and version
-        is specified and does not exactly match the existing file's
-        version, a ``RuntimeError`` will be raised. (default: ``None``)
+    :param version: optional, the LArPix+HDF5 format version to use (see
+        ``to_file``, default: ``None``)
+    :param chunk_size: optional, the HDF5 chunk length (in rows) of newly
+        created datasets (default: ``None``, chosen by ``h5py``)
+    :param compression: optional, the HDF5 compression filter of newly
+        created datasets, e.g. ``'gzip'`` or ``'lzf'`` (default: ``None``)
+    :param compression_opts: optional, options for the compression filter
+        (default: ``None``)
+    :param growth_factor: optional, the factor to grow a dataset by when it
+        is full. A value of ``1`` resizes the datasets exactly (default:
+        ``2``)
+    :param index: optional, if ``True`` write an index of the packets
+        dataset for ``select`` (for versions in ``columnar_versions``).
+        Packets already in the file are indexed when it is opened. If the
+        file already has an index, it is always updated (default:
+        ``False``)
+    :param index_block_size: optional, the maximum number of rows in each
+        range of a new index (default: ``default_index_block_size``)
 
     '''
-    if packet_list is None: packet_list = []
-    if chip_list is None: chip_list = []
-    if workers is None:
-      workers = max(min(os.cpu_count(), int(len(packet_list)//10000)),1)
-
-    with h5py.File(filename, mode) as f:
-        # Create header
-        if '_header' not in f.keys():
-            header = f.create_group('_header')
-            if version is None:
-                version = latest_version
-            header.attrs['version'] = version
-            header.attrs['created'] = time.time()
-        else:
-            header = f['_header']
-            file_version = header.attrs['version']
-            if version is None:
-                version = file_version
-            elif header.attrs['version'] != version:
-                raise RuntimeError('Incompatible versions: existing: %s, '
-                    'specified: %s' % (file_version, version))
-        header.attrs['modified'] = time.time()
-
-        # Create datasets
-        if version == '0.0':
-            packet_dset_name = 'raw_packet'
-        else:
-            packet_dset_name = 'packets'
-            direction_index = (
-                    dtype_property_index_lookup[version]['packets']
-                    ['direction'])
-            if version[0] == '2':
-                packet_type_index = (
-                        dtype_property_index_lookup[version]['packets']
-                        ['packet_type'])
-                fifo_diagnostics_enabled_index = (
-                        dtype_property_index_lookup[version]['packets']
-                        ['fifo_diagnostics_enabled'])
-                trigger_type_index = (
-                        dtype_property_index_lookup[version]['packets']
-                        ['trigger_type'])
-                dataword_index = (
-                        dtype_property_index_lookup[version]['packets']
-                        ['dataword'])
-        packet_dtype = dtypes[version][packet_dset_name]
-        if packet_dset_name not in f.keys():
-            packet_dset = f.create_dataset(packet_dset_name, shape=(len(packet_list),),
-                    maxshape=(None,), dtype=packet_dtype)
-            if version[0] == '1' or version[0] == '2':
-                if version[-1] == '2' and version[0] == '2':
-                    packet_dset.attrs['packet_types'] = '''
+    def __init__(self, filename, mode='a', version=None, chunk_size=None,
+            compression=None, compression_opts=None, growth_factor=2,
+            index=False, index_block_size=default_index_block_size):
+        self.filename = filename
+        self.mode = mode
+        self.growth_factor = growth_factor
+        self.index = index
+        self.index_block_size = index_block_size
+        self._dataset_kwargs = dict(
+            chunks=(chunk_size,) if chunk_size else True,
+            compression=compression,
+            compression_opts=compression_opts
+            )
+        self._file = None
+        self._datasets = dict()
+        self._sizes = dict()
+        self.version = version
+        self.open()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def is_open(self):
+        return self._file is not None
+
+    def open(self):
+        '''
+        Open the file, create the header and datasets if needed
+
+        '''
+        if self.is_open:
+            return
+        f = h5py.File(self.filename, self.mode)
+        try:
+            if '_header' not in f.keys():
+                header = f.create_group('_header')
+                if self.version is None:
+                    self.version = latest_version
+                header.attrs['version'] = self.version
+                header.attrs['created'] = time.time()
+            else:
+                header = f['_header']
+                file_version = header.attrs['version']
+                if self.version is None:
+                    self.version = file_version
+                elif file_version != self.version:
+                    raise RuntimeError('Incompatible versions: existing: %s, '
+                        'specified: %s' % (file_version, self.version))
+            header.attrs['modified'] = time.time()
+
+            if self.version == '0.0':
+                self.packet_dset_name = 'raw_packet'
+            else:
+                self.packet_dset_name = 'packets'
+            self._open_dataset(f, self.packet_dset_name)
+            if self.version != '0.0':
+                self._open_dataset(f, 'messages')
+            if self.version >= '2.4':
+                self._open_dataset(f, 'configs')
+            if '_index' in f.keys() or (self.index and self.version in columnar_versions):
+                self._open_index(f)
+        except:
+            f.close()
+            raise
+        self._file = f
+
+    def _open_dataset(self, f, dset_name, dtype=None):
+        if dset_name not in f:
+            if dtype is None:
+                dtype = dtypes[self.version][dset_name]
+            dset = f.create_dataset(dset_name, shape=(0,), maxshape=(None,),
+                dtype=dtype, **self._dataset_kwargs)
+            if dset_name == 'packets':
+                if self.version == '2.2':
+                    dset.attrs['packet_types'] = '''
 0: 'data',
 1: 'test',
 2: 'config write',
@@ -944,7 +1101,7 @@ def to_file(filename, packet_list=None, chip_list=None, mode='a', version=None,
 7: 'trigger,
 '''
                 else:
-                    packet_dset.attrs['packet_types'] = '''
+                    dset.attrs['packet_types'] = '''
 0: 'data',
 1: 'test',
 2: 'config write',
@@ -952,68 +1109,473 @@ def to_file(filename, packet_list=None, chip_list=None, mode='a', version=None,
 4: 'timestamp',
 5: 'message',
 '''
-            start_index = 0
+        self._datasets[dset_name] = f[dset_name]
+        self._sizes[dset_name] = f[dset_name].shape[0]
+
+    def _open_index(self, f):
+        '''
+        Open (or create) the index datasets and index any packets that are
+        not yet indexed
+
+        '''
+        if self.version not in columnar_versions:
+            raise RuntimeError('cannot index version {}'.format(self.version))
+        if '_index' not in f.keys():
+            f.create_group('_index').attrs['block_size'] = self.index_block_size
+        self.index = True
+        self.index_block_size = int(f['_index'].attrs['block_size'])
+        for dset_name, dtype in index_dtypes.items():
+            self._open_dataset(f, '_index/' + dset_name, dtype=dtype)
+        ranges = self._datasets['_index/ranges']
+        start_index = int(ranges[-1]['stop']) if len(ranges) else 0
+        packet_dset = self._datasets[self.packet_dset_name]
+        for chunk_start in range(start_index, self._sizes[self.packet_dset_name], self.index_block_size):
+            self._write_index(packet_dset[chunk_start:chunk_start+self.index_block_size], chunk_start)
+
+    def _write_index(self, rows, start_index):
+        '''
+        Add the rows written to the packets dataset at ``start_index`` to the
+        index
+
+        '''
+        ranges, chip_keys = [], []
+        range_index = self._sizes['_index/ranges']
+        for block_start in range(0, len(rows), self.index_block_size):
+            block = rows[block_start:block_start+self.index_block_size]
+            ranges.append((
+                start_index + block_start, start_index + block_start + len(block),
+                block['timestamp'].min(), block['timestamp'].max(),
+                block['receipt_timestamp'].min(), block['receipt_timestamp'].max()
+                ))
+            packed_keys = np.unique(_packed_chip_keys(block))
+            block_keys = np.zeros(packed_keys.shape, dtype=index_dtypes['chip_keys'])
+            block_keys['range'] = range_index + len(ranges) - 1
+            block_keys['io_group'] = packed_keys >> 16
+            block_keys['io_channel'] = (packed_keys >> 8) & 0xFF
+            block_keys['chip_id'] = packed_keys & 0xFF
+            chip_keys.append(block_keys)
+        self._write('_index/ranges', np.array(ranges, dtype=index_dtypes['ranges']))
+        if chip_keys:
+            self._write('_index/chip_keys', np.concatenate(chip_keys))
+
+    def _write_packets(self, rows):
+        start_index = self._sizes[self.packet_dset_name]
+        self._write(self.packet_dset_name, rows)
+        if self.index and len(rows):
+            self._write_index(rows, start_index)
+
+    def _write(self, dset_name, rows):
+        '''
+        Write rows to the end of a dataset, growing the dataset if needed
+
+        '''
+        if not len(rows):
+            return
+        dset = self._datasets[dset_name]
+        start_index = self._sizes[dset_name]
+        end_index = start_index + len(rows)
+        if end_index > dset.shape[0]:
+            dset.resize(max(end_index, int(dset.shape[0] * self.growth_factor)), axis=0)
+        dset[start_index:end_index] = rows
+        self._sizes[dset_name] = end_index
+
+    def reserve(self, n_rows, dset_name=None):
+        '''
+        Preallocate space for at least ``n_rows`` more rows in a dataset, so
+        that it is not resized while they are appended. Unused rows are
+        removed by ``flush`` and ``close``.
+
+        :param n_rows: the number of rows to reserve
+        :param dset_name: optional, the dataset to grow (default: ``None``,
+            the packets dataset)
+
+        '''
+        dset_name = self.packet_dset_name if dset_name is None else dset_name
+        dset = self._datasets[dset_name]
+        end_index = self._sizes[dset_name] + int(n_rows)
+        if end_index > dset.shape[0]:
+            dset.resize(end_index, axis=0)
+
+    def append(self, packet_list, workers=None, direction=0):
+        '''
+        Write packets to the end of the file
+
+        :param packet_list: any iterable of objects of type ``Packet``,
+            ``TimestampPacket``, ``SyncPacket``, or ``TriggerPacket``, a
+            ``PacketArray`` (see ``to_file``), or a numpy structured array of
+            already encoded rows of the packets dataset
+        :param workers: optional, the number of processes to use to encode a
+            list of packets (see ``to_file``)
+        :param direction: optional, the ``direction`` stored for the LArPix
+            packets in a ``PacketArray``, either a single value or one per
+            packet (default: ``0``)
+
+        Lists of ``Packet_v2`` and timestamp, sync, and trigger packets are
+        converted to a ``PacketArray`` and encoded in a single batch (for the
+        versions in ``columnar_versions``).
+
+        '''
+        version = self.version
+        if isinstance(packet_list, np.ndarray):
+            packet_dtype = dtypes[version][self.packet_dset_name]
+            if packet_list.dtype != packet_dtype:
+                raise ValueError('packet rows must have dtype {}, got {}'.format(
+                    packet_dtype, packet_list.dtype))
+            self._write_packets(packet_list)
+            return
+        columnar = isinstance(packet_list, PacketArray)
+        if columnar and version not in columnar_versions:
+            packet_list = packet_list.to_packets()
+            columnar = False
+        if columnar:
+            self._write_packets(_encode_packet_array(packet_list, version, direction=direction))
+            return
+        if version in columnar_versions:
+            packet_array = _to_packet_array(packet_list)
+            if packet_array is not None:
+                self._write_packets(_encode_packet_array(packet_array, version,
+                    direction=[getattr(packet, 'direction', 0) or 0 for packet in packet_list]))
+                return
+
+        if workers is None:
+            workers = max(min(os.cpu_count(), int(len(packet_list)//10000)),1)
+        if workers > 1:
+            packet_args = zip(packet_list, [version]*len(packet_list), [self.packet_dset_name]*len(packet_list))
+            with multiprocessing.Pool(workers) as p:
+                encoded_packets = list(filter(bool, p.starmap(_encode_packet, packet_args)))
         else:
-            packet_dset = f[packet_dset_name]
-            start_index = packet_dset.shape[0]
-            packet_dset.resize(start_index + len(packet_list), axis=0)
+            encoded_packets = list(filter(bool, [_encode_packet(packet, version, self.packet_dset_name) for packet in packet_list]))
+        self._write_packets(np.array(encoded_packets,
+            dtype=dtypes[version][self.packet_dset_name]))
 
         if version != '0.0':
             message_dset_name = 'messages'
-            message_dtype = dtypes[version][message_dset_name]
-            if message_dset_name not in f.keys():
-                message_dset = f.create_dataset(message_dset_name,
-                        shape=(0,), maxshape=(None,),
-                        dtype=message_dtype)
-                message_start_index = 0
-            else:
-                message_dset = f[message_dset_name]
-                message_start_index = message_dset.shape[0]
-
-        if version >= '2.4':
-            configs_dset_name = 'configs'
-            configs_dtype = dtypes[version][configs_dset_name]
-            if configs_dset_name not in f.keys():
-                configs_dset = f.create_dataset(configs_dset_name,
-                    shape=(0,), maxshape=(None,),
-                    dtype=configs_dtype)
-                configs_start_index = 0
-            else:
-                configs_dset = f[configs_dset_name]
-                configs_start_index = configs_dset.shape[0]
-            if chip_list:
-                configs_dset.attrs['asic_version'] = str(chip_list[-1].asic_version)
-
-        # Fill dataset
-        encoded_packets = []
-        messages = []
+            messages = []
+            for packet in packet_list:
+                if packet.__class__ in _format_method_lookup[version].get(message_dset_name, tuple()):
+                    encoded_message = _format_method_lookup[version][message_dset_name][packet.__class__](packet, counter=self._sizes[message_dset_name] + len(messages))
+                    messages.append(encoded_message)
+            self._write(message_dset_name, np.array(messages,
+                dtype=dtypes[version][message_dset_name]))
+
+    def append_configs(self, chip_list):
+        '''
+        Write chip configurations to the end of the file (for format
+        versions 2.4 and later)
+
+        :param chip_list: any iterable of objects of type ``Chip``
+
+        '''
+        chip_list = list(chip_list)
+        if self.version < '2.4' or not chip_list:
+            return
+        configs_dset_name = 'configs'
+        self._datasets[configs_dset_name].attrs['asic_version'] = str(chip_list[-1].asic_version)
+        timestamp = time.time()
         configs = []
+        for chip in chip_list:
+            encoded_config = _format_method_lookup[self.version][configs_dset_name][chip.__class__](chip, counter=self._sizes[configs_dset_name] + len(configs), timestamp=timestamp)
+            configs.append(encoded_config)
+        self._write(configs_dset_name, np.concatenate(configs))
+
+    def flush(self, trim=True):
+        '''
+        Remove the unused rows at the end of the datasets and flush the file
+        to disk
+
+        :param trim: optional, if ``False`` only flush the file, keeping the
+            unused rows for the next appends (default: ``True``)
+
+        '''
+        if not self.is_open:
+            return
+        if trim:
+            for dset_name, dset in self._datasets.items():
+                if dset.shape[0] != self._sizes[dset_name]:
+                    dset.resize(self._sizes[dset_name], axis=0)
+            self._file['_header'].attrs['modified'] = time.time()
+        self._file.flush()
+
+    def close(self):
+        '''
+        Flush and close the file
+
+        '''
+        if not self.is_open:
+            return
+        try:
+            self.flush()
+        finally:
+            self._file.close()
+            self._file = None
+            self._datasets = dict()
+            self._sizes = dict()
+
+def to_file(filename, packet_list=None, chip_list=None, mode='a', version=None, workers=None, direction=0, index=False):
+    '''
+    Save the given packets to the given file.
 
-        if workers > 1:
-            packet_args = zip(packet_list, [version]*len(packet_list), [packet_dset_name]*len(packet_list))
-            with multiprocessing.Pool(workers) as p:
-                encoded_packets = list(filter(bool, p.starmap(_encode_packet, packet_args)))
+    This method can be used to update an existing file. To write many
+    batches of packets to the same file, use an ``HDF5Writer``.
+
+    :param filename: the name of the file to save to
+    :param packet_list: any iterable of objects of type ``Packet``,
+        ``TimestampPacket``, ``SyncPacket``, or ``TriggerPacket``, or a
+        ``PacketArray``. For the versions in ``columnar_versions``, a
+        ``PacketArray`` is encoded with vectorized field extraction and
+        written in a single slice, without creating packet objects.
+    :param chip_list: any iterable of objects of type ``Chip``.
+    :param mode: optional, the "file mode" to open the data file
+        (default: ``'a'``)
+    :param version: optional, the LArPix+HDF5 format version to use. If
+        writing a new file and version is unspecified or ``None``,
+        the latest version will be used. If writing an existing file
+        and version is unspecified or ``None``, the existing file's
+        version will be used. If writing an existing file and version
+        is specified and does not exactly match the existing file's
+        version, a ``RuntimeError`` will be raised. (default: ``None``)
+    :param workers: optional, the number of processes to use to encode a
+        list of packets (default: one per 10000 packets, up to the number
+        of CPUs)
+    :param direction: optional, the ``direction`` stored for the LArPix
+        packets in a ``PacketArray``, which has no per-packet direction
+        (default: ``0``)
+    :param index: optional, if ``True`` write an index of the packets for
+        ``select`` (see ``HDF5Writer``, default: ``False``)
+
+    '''
+    if packet_list is None: packet_list = []
+    if chip_list is None: chip_list = []
+    with HDF5Writer(filename, mode=mode, version=version, growth_factor=1, index=index) as writer:
+        writer.append(packet_list, workers=workers, direction=direction)
+        writer.append_configs(chip_list)
+
+def _resolve_version(f, version):
+    '''
+    Check the requested format ``version`` against the version of the open
+    file ``f`` (see ``from_file``) and return the version to use
+
+    '''
+    file_version = f['_header'].attrs['version']
+    if version is None:
+        version = file_version
+    elif version[0] == '~':
+        file_major, _, file_minor = file_version.split('.')
+        version_major, _, version_minor = version.split('.')
+        version_major = version_major[1:]
+        if (file_major != version_major
+                or file_minor < version_minor):
+            raise RuntimeError('Incompatible versions: existing: %s, '
+                'specified: %s' % (file_version, version))
         else:
-            encoded_packets = list(filter(bool, [_encode_packet(packet, version, packet_dset_name) for packet in packet_list]))
-
-        for i, packet in enumerate(packet_list):
-            if version != '0.0' and packet.__class__ in _format_method_lookup[version].get(message_dset_name, tuple()):
-                encoded_message = _format_method_lookup[version][message_dset_name][packet.__class__](packet, counter=message_start_index + len(messages))
-                messages.append(encoded_message)
-
-        for i,chip in enumerate(chip_list):
-            if version >= '2.4':
-                encoded_config = _format_method_lookup[version][configs_dset_name][chip.__class__](chip, counter=configs_start_index + len(configs), timestamp=header.attrs['modified'])
-                configs.append(encoded_config)
-
-        if encoded_packets:
-            packet_dset[start_index:] = encoded_packets
-        if version != '0.0' and messages:
-            message_dset.resize(message_start_index + len(messages), axis=0)
-            message_dset[message_start_index:] = messages
-        if version >= '2.4' and configs:
-            configs_dset.resize(configs_start_index + len(configs), axis=0)
-            configs_dset[configs_start_index:] = np.concatenate(configs)
+            version = file_version
+    elif version == file_version:
+        pass
+    else:
+        raise RuntimeError('Incompatible versions: existing: %s, '
+            'specified: %s' % (file_version, version))
+
+    if version not in dtypes:
+        raise RuntimeError('Unknown version: %s' % version)
+    return version
+
+def _packed_chip_keys(rows):
+    return (rows['io_group'].astype(np.uint32) << np.uint32(16)) \
+        | (rows['io_channel'].astype(np.uint32) << np.uint32(8)) \
+        | rows['chip_id'].astype(np.uint32)
+
+def _convert_rows(rows, output, version, dset_name, message_dset):
+    if output == 'packet_array':
+        return _rows_to_packet_array(rows)
+    elif output == 'packets':
+        packets = [_parse_method_lookup[version][dset_name](row, message_dset) for row in rows]
+        return [packet for packet in packets if packet is not None]
+    return rows
+
+def _packet_word_bits(name, values):
+    bit_slice = getattr(Packet_v2, name + '_bits')
+    mask = np.uint64((1 << (bit_slice.stop - bit_slice.start)) - 1)
+    return (values.astype(np.uint64) & mask) << np.uint64(bit_slice.start)
+
+def _rows_to_packet_array(rows):
+    '''
+    Convert rows of a v2.3+ ``packets`` dataset into a ``PacketArray``.
+    Message rows are skipped.
+
+    '''
+    rows = rows[rows['packet_type'] != 5]
+    larpix_packets = rows['packet_type'] < 4
+    fifo_diagnostics = (rows['fifo_diagnostics_enabled'] != 0) & larpix_packets
+    words = np.zeros(rows.shape, dtype=PacketArray.words_dtype)
+    for name in ('packet_type', 'chip_id', 'channel_id', 'first_packet',
+            'dataword', 'trigger_type', 'local_fifo', 'shared_fifo',
+            'downstream_marker', 'parity'):
+        words |= _packet_word_bits(name, rows[name])
+    words |= np.where(fifo_diagnostics,
+        _packet_word_bits('fifo_diagnostics_timestamp', rows['timestamp'])
+        | _packet_word_bits('local_fifo_events', rows['local_fifo_events'])
+        | _packet_word_bits('shared_fifo_events', rows['shared_fifo_events']),
+        _packet_word_bits('timestamp', rows['timestamp']))
+    aux_type = np.where(larpix_packets, 0, rows['packet_type'])
+    packets = PacketArray(
+        np.where(larpix_packets, words, _encode_aux_words(aux_type,
+            rows['timestamp'], rows['trigger_type'], rows['dataword'])),
+        io_group=rows['io_group'],
+        io_channel=rows['io_channel'],
+        receipt_timestamp=rows['receipt_timestamp'],
+        aux_type=aux_type
+        )
+    if np.any(fifo_diagnostics) and np.all(fifo_diagnostics[larpix_packets]):
+        packets.fifo_diagnostics_enabled = True
+    return packets
+
+def iter_file(filename, chunk_size=65536, fields=None, where=None,
+        output='array', start=None, end=None, version=None):
+    '''
+    Read the packets in the given file in chunks, without loading the full
+    file into memory. E.g. to histogram the ADC values of the data packets
+    in a large file::
+
+        for rows in iter_file(filename, fields=('dataword',),
+                where=lambda rows: rows['packet_type'] == 0):
+            counts += np.bincount(rows['dataword'], minlength=256)
+
+    Each chunk is read as a single contiguous slice of ``chunk_size`` rows
+    of the packets dataset (fewer rows are yielded if ``where`` is
+    used). The ``messages`` dataset is read once at the start.
+
+    :param filename: the name of the file to read
+    :param chunk_size: optional, the number of rows to read at a time
+        (default: ``65536``)
+    :param fields: optional, a sequence of dataset field names to read. Only
+        applies if ``output`` is ``'array'`` (default: ``None``, read all
+        fields)
+    :param where: optional, a function that takes a chunk of rows (a
+        ``numpy`` structured array with all fields) and returns a boolean
+        mask of the rows to keep (default: ``None``, keep all rows)
+    :param output: optional, the type of each chunk. ``'array'`` gives
+        the ``numpy`` structured array of the rows, ``'packet_array'`` a
+        ``PacketArray`` (only for the versions in ``columnar_versions``;
+        message rows are skipped), and ``'packets'`` a ``list`` of packet
+        objects as in ``from_file`` (default: ``'array'``)
+    :param start: optional, the index of the first row to read
+    :param end: optional, the index after the last row to read
+    :param version: optional, the format version (see ``from_file``)
+
+    :yields: a chunk of packets of the type specified by ``output``
+
+    '''
+    if output not in ('array', 'packet_array', 'packets'):
+        raise ValueError('invalid output type {}'.format(output))
+    if fields is not None and output != 'array':
+        raise ValueError('fields can only be selected with output=\'array\'')
+    with h5py.File(filename, 'r') as f:
+        version = _resolve_version(f, version)
+        if output == 'packet_array' and version not in columnar_versions:
+            raise RuntimeError('cannot read version {} into a PacketArray'.format(version))
+        dset_name = 'raw_packet' if version == '0.0' else 'packets'
+        dset = f[dset_name]
+        message_dset = None
+        if output == 'packets' and version != '0.0':
+            message_dset = f['messages'][:]
+        if fields is not None and where is None:
+            dset = dset.fields(list(fields))
+        start, end, _ = slice(start, end).indices(f[dset_name].shape[0])
+        for chunk_start in range(start, end, chunk_size):
+            rows = dset[chunk_start:min(chunk_start + chunk_size, end)]
+            if where is not None:
+                rows = rows[where(rows)]
+                if fields is not None:
+                    rows = recfunctions.repack_fields(rows[list(fields)])
+            yield _convert_rows(rows, output, version, dset_name, message_dset)
+
+def select(filename, chip_keys=None, t_range=None, t_field='timestamp',
+        output='array', chunk_size=65536, version=None):
+    '''
+    Read the packets from the given chips and/or within a time range. E.g.::
+
+        rows = select(filename, chip_keys=['1-1-12'], t_range=(1000, 2000))
+
+    If the file has a packet index (see ``HDF5Writer``), only the row ranges
+    of the ``packets`` dataset that can contain the selected packets are
+    read. Otherwise, the full dataset is scanned in chunks.
+
+    :param filename: the name of the file to read
+    :param chip_keys: optional, an iterable of chip keys (``Key`` objects or
+        keystrings) to select (default: ``None``, all chips)
+    :param t_range: optional, a tuple of ``(min, max)`` to select packets with
+        ``min <= t_field < max``. Either limit can be ``None`` (default:
+        ``None``, all times)
+    :param t_field: optional, the field to apply ``t_range`` to,
+        ``'timestamp'`` or ``'receipt_timestamp'`` (default:
+        ``'timestamp'``)
+    :param output: optional, ``'array'``, ``'packet_array'``, or
+        ``'packets'`` (see ``iter_file``, default: ``'array'``)
+    :param chunk_size: optional, the maximum number of rows to read at a
+        time (default: ``65536``)
+    :param version: optional, the format version (see ``from_file``)
+
+    :returns: the selected packets, of the type specified by ``output``
+
+    '''
+    if output not in ('array', 'packet_array', 'packets'):
+        raise ValueError('invalid output type {}'.format(output))
+    if t_field not in ('timestamp', 'receipt_timestamp'):
+        raise ValueError('invalid time field {}'.format(t_field))
+    t_min, t_max = t_range if t_range is not None else (None, None)
+    if chip_keys is not None:
+        chip_keys = np.array([Key(chip_key).packed for chip_key in chip_keys],
+            dtype=np.uint32)
+
+    def row_mask(rows):
+        mask = np.ones(rows.shape, dtype=bool)
+        if chip_keys is not None:
+            mask &= np.isin(_packed_chip_keys(rows), chip_keys)
+        if t_min is not None:
+            mask &= rows[t_field] >= t_min
+        if t_max is not None:
+            mask &= rows[t_field] < t_max
+        return mask
+
+    with h5py.File(filename, 'r') as f:
+        version = _resolve_version(f, version)
+        if version not in columnar_versions:
+            raise RuntimeError('cannot select from version {}'.format(version))
+        dset = f['packets']
+        message_dset = f['messages'][:] if output == 'packets' else None
+
+        row_ranges = [(0, dset.shape[0])]
+        if '_index' in f:
+            ranges = f['_index/ranges'][:]
+            indexed_stop = int(ranges[-1]['stop']) if len(ranges) else 0
+            range_mask = np.ones(ranges.shape, dtype=bool)
+            if t_min is not None:
+                range_mask &= ranges[t_field + '_max'] >= t_min
+            if t_max is not None:
+                range_mask &= ranges[t_field + '_min'] < t_max
+            if chip_keys is not None:
+                index_keys = f['_index/chip_keys'][:]
+                range_mask &= np.isin(np.arange(len(ranges)),
+                    index_keys['range'][np.isin(_packed_chip_keys(index_keys), chip_keys)])
+            row_ranges = [(int(start), int(stop)) for start, stop
+                in zip(ranges['start'][range_mask], ranges['stop'][range_mask])]
+            if indexed_stop < dset.shape[0]:
+                row_ranges.append((indexed_stop, dset.shape[0]))
+
+        # merge adjacent row ranges into contiguous reads
+        merged_ranges = []
+        for start, stop in row_ranges:
+            if merged_ranges and merged_ranges[-1][1] == start:
+                merged_ranges[-1] = (merged_ranges[-1][0], stop)
+            else:
+                merged_ranges.append((start, stop))
+
+        selected = [np.zeros((0,), dtype=dset.dtype)]
+        for start, stop in merged_ranges:
+            for chunk_start in range(start, stop, chunk_size):
+                rows = dset[chunk_start:min(chunk_start + chunk_size, stop)]
+                selected.append(rows[row_mask(rows)])
+        return _convert_rows(np.concatenate(selected), output, version, 'packets', message_dset)
 
 def from_file(filename, version=None, start=None, end=None, load_configs=None):
     '''
@@ -1043,27 +1605,7 @@ def from_file(filename, version=None, start=None, end=None, load_configs=None):
 
     '''
     with h5py.File(filename, 'r') as f:
-        file_version = f['_header'].attrs['version']
-        if version is None:
-            version = file_version
-        elif version[0] == '~':
-            file_major, _, file_minor = file_version.split('.')
-            version_major, _, version_minor = version.split('.')
-            version_major = version_major[1:]
-            if (file_major != version_major
-                    or file_minor < version_minor):
-                raise RuntimeError('Incompatible versions: existing: %s, '
-                    'specified: %s' % (file_version, version))
-            else:
-                version = file_version
-        elif version == file_version:
-            pass
-        else:
-            raise RuntimeError('Incompatible versions: existing: %s, '
-                'specified: %s' % (file_version, version))
-
-        if version not in dtypes:
-            raise RuntimeError('Unknown version: %s' % version)
+        version = _resolve_version(f, version)
 
         if version == '0.0':
             dset_name = 'raw_packet'
@@ -1074,14 +1616,11 @@ def from_file(filename, version=None, start=None, end=None, load_configs=None):
             message_dset_name = 'messages'
             message_props = (
                     dtype_property_index_lookup[version][message_dset_name])
-            message_dset = f[message_dset_name]
+            message_dset = f[message_dset_name][:]
 
         props = dtype_property_index_lookup[version][dset_name]
         packets = []
-        if start is None and end is None:
-            dset_iter = f[dset_name]
-        else:
-            dset_iter = f[dset_name][start:end]
+        dset_iter = f[dset_name][start:end]
         for row in dset_iter:
             pkt = _parse_method_lookup[version][dset_name](row, message_dset)
             if pkt is not None:
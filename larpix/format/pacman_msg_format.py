@@ -41,6 +41,20 @@ the ``format(pkts, msg_type)`` and ``parse(msg, io_group=None)`` methods. E.g.::
     packets = pacman_msg_fmt.parse(msg, io_group=1) # [Packet_v2(b'\x00\x00\x00\x00\x00\x00\x00\x00')]
     packets[0].io_group # 1
 
+When reading large amounts of data, ``parse(msg, io_group=1, lazy=True)`` parses
+the data words into ``PacketView`` objects which decode the packet fields from
+``msg`` on demand, rather than copying each packet out of the message.
+
+To parse many messages at once without creating a python object for each
+packet, use ``parse_to_array(msgs, io_groups)``, which returns a
+``PacketArray`` with the same content as ``parse``::
+
+    packets = pacman_msg_fmt.parse_to_array([msg0, msg1], io_groups=1) # <PacketArray with N packets>
+    packets.timestamp[packets.packet_type == 4] # header timestamp of each message
+
+Similarly, ``format_array(words, io_channels)`` builds a message directly from
+an array of packet words, e.g. from the ``words`` of a ``PacketArray``.
+
 Note that no ``io_group`` data is contained within a pacman message. This means
 that when formatting messages, packets' ``io_group`` field is ignored, and when
 parsing messages, an ``io_group`` value needs to be specified at the time of
@@ -50,8 +64,12 @@ parsing.
 import struct
 from bidict import bidict
 import time
+import itertools
 
-from larpix import Packet_v2, TriggerPacket, SyncPacket, TimestampPacket
+import numpy as np
+
+from larpix import Packet_v2, CompactPacket_v2, PacketView, TriggerPacket, SyncPacket, TimestampPacket, PacketArray
+from larpix.packet.packet_array import _encode_aux_words, _timestamp_packet_type
 
 #: Most up-to-date message format version.
 latest_version = '0.0'
@@ -115,6 +133,25 @@ word_struct_table = dict([
     (word_type, struct.Struct(word_fmt))
     for word_type, word_fmt in word_fmt_table.items()
     ])
+#: ``numpy`` dtype of the message header
+msg_header_dtype = np.dtype(dict(
+    names=['msg_type', 'timestamp', 'words'],
+    formats=['S1', '<u4', '<u2'],
+    offsets=[0, 1, 6],
+    itemsize=HEADER_LEN
+    ))
+#: ``numpy`` dtype covering the DATA, TRIG, and SYNC word layouts (fields
+#: overlap, so only the fields corresponding to the ``word_type`` are valid)
+word_dtype = np.dtype(dict(
+    names=['word_type', 'io_channel', 'receipt_timestamp', 'packet',
+        'trigger_type', 'sync_type', 'clk_source', 'timestamp'],
+    formats=['u1', 'u1', '<u4', '<u8', 'u1', 'u1', 'u1', '<u4'],
+    offsets=[0, 1, 2, 8, 1, 1, 2, 4],
+    itemsize=WORD_LEN
+    ))
+_receipt_timestamp_struct = struct.Struct('<L')
+_receipt_timestamp_offset = 2
+_packet_offset = 8
 
 def format_header(msg_type, msg_words):
     '''
@@ -169,10 +206,47 @@ def format_msg(msg_type, msg_words):
     ``msg_words`` should be a list of tuples that can be unpacked and passed into ``format_word``
 
     '''
-    bytestream = format_header(msg_type, len(msg_words))
+    bytestream = bytearray(format_header(msg_type, len(msg_words)))
     for msg_word in msg_words:
         bytestream += format_word(msg_type, *msg_word)
-    return bytestream
+    return bytes(bytestream)
+
+def format_array(words, io_channels=0, msg_type='REQ', receipt_timestamps=0):
+    '''
+    Generates a message of ``msg_type`` from an array of 64-bit LArPix packet
+    words, without creating packet objects. For ``'REQ'`` messages, each
+    packet is formatted as a ``'TX'`` word, and for ``'DATA'`` messages as a
+    ``'DATA'`` word. E.g. to send the packets in a ``PacketArray``::
+
+        msg = format_array(packet_array.words, packet_array.io_channel)
+
+    The message is written into a single preallocated buffer, so this is
+    much faster than ``format_msg`` for large messages.
+
+    :param words: array-like of 64-bit packet words
+
+    :param io_channels: array-like or scalar ``io_channel`` of each packet (optional, default: ``0``)
+
+    :param msg_type: ``'REQ'`` or ``'DATA'`` (optional, default: ``'REQ'``)
+
+    :param receipt_timestamps: array-like or scalar receipt timestamp of each packet, only used for ``'DATA'`` messages (optional, default: ``0``)
+
+    :returns: message bytestring
+
+    '''
+    if msg_type not in ('REQ', 'DATA'):
+        raise ValueError('invalid message type for packet words {}'.format(msg_type))
+    words = np.atleast_1d(np.asarray(words, dtype=np.uint64))
+    buffer = np.zeros(HEADER_LEN + WORD_LEN * len(words), dtype=np.uint8)
+    msg_header_struct.pack_into(buffer, 0, msg_type_table[msg_type],
+        int(time.time()), len(words))
+    msg_words = buffer[HEADER_LEN:].view(word_dtype)
+    msg_words['word_type'] = WORD_TYPE_DATA[0]
+    msg_words['io_channel'] = io_channels
+    if msg_type == 'DATA':
+        msg_words['receipt_timestamp'] = receipt_timestamps
+    msg_words['packet'] = words
+    return buffer.tobytes()
 
 def parse_msg(msg):
     '''
@@ -194,14 +268,14 @@ def _replace_none(obj, attr, default=0):
     return getattr(obj, attr) if getattr(obj, attr) is not None else default
 
 def _packet_data_req(pkt, *args):
-    if isinstance(pkt, Packet_v2):
+    if isinstance(pkt, (Packet_v2, CompactPacket_v2)):
         return ('TX',
                 _replace_none(pkt,'io_channel'),
                 pkt.bytes())
     return tuple()
 
 def _packet_data_data(pkt, ts_pacman, *args):
-    if isinstance(pkt, Packet_v2):
+    if isinstance(pkt, (Packet_v2, CompactPacket_v2)):
         return ('DATA',
                 _replace_none(pkt,'io_channel'),
                 pkt.receipt_timestamp if hasattr(pkt,'receipt_timestamp') else ts_pacman,
@@ -222,9 +296,16 @@ def format(packets, msg_type='REQ', ts_pacman=0):
     Converts larpix packets into a single PACMAN message.
     The message header is automatically generated.
 
-    Note:: For request messages, this method only formats ``Packet_v2`` objects. For data messages, this method only formats ``Packet_v2``, ``SyncPacket``, and ``TriggerPacket`` objects.
+    Note:: For request messages, this method only formats ``Packet_v2`` (or ``CompactPacket_v2``) objects. For data messages, this method only formats ``Packet_v2``, ``CompactPacket_v2``, ``SyncPacket``, and ``TriggerPacket`` objects.
 
     '''
+    if msg_type == 'REQ':
+        packets = [packet for packet in packets if isinstance(packet, (Packet_v2, CompactPacket_v2))]
+        return format_array(
+            [packet.as_int() for packet in packets],
+            [_replace_none(packet, 'io_channel') for packet in packets],
+            msg_type='REQ')
+
     get_data = _packet_data_req
     if msg_type == 'DATA':
         get_data = _packet_data_data
@@ -236,7 +317,7 @@ def format(packets, msg_type='REQ', ts_pacman=0):
         word_datas.append(word_data)
     return format_msg(msg_type, word_datas)
 
-def parse(msg, io_group=None):
+def parse(msg, io_group=None, lazy=False):
     '''
     Converts a PACMAN message into larpix packets
 
@@ -245,7 +326,13 @@ def parse(msg, io_group=None):
     trigger words are parsed into ``TriggerPacket`` objects,
     and sync words are parsed into ``SyncPacket`` objects.
 
+    If ``lazy`` is ``True``, data words are instead parsed into
+    ``PacketView`` objects that reference ``msg`` (so ``msg`` should not be
+    modified while the packets are in use).
+
     '''
+    if lazy:
+        return _parse_lazy(msg, io_group)
     packets = list()
     header, word_datas = parse_msg(msg)
     packets.append(TimestampPacket(timestamp=header[1]))
@@ -257,18 +344,210 @@ def parse(msg, io_group=None):
             packet.receipt_timestamp = word_data[2]
             packet.io_group = io_group
             packet.io_channel = word_data[1]
-        elif word_data[0] == 'TRIG':
-            packet = TriggerPacket(trigger_type=word_data[1], timestamp=word_data[2])
-            packet.io_group = io_group
-        elif word_data[0] == 'SYNC':
-            packet = SyncPacket(sync_type=word_data[1], clk_source=word_data[2] & 0x01, timestamp=word_data[3])
+        else:
+            packet = _parse_word_data(word_data, io_group)
+        if packet is not None:
+            packets.append(packet)
+    return packets
+
+def _parse_word_data(word_data, io_group):
+    packet = None
+    if word_data[0] == 'TRIG':
+        packet = TriggerPacket(trigger_type=word_data[1], timestamp=word_data[2])
+        packet.io_group = io_group
+    elif word_data[0] == 'SYNC':
+        packet = SyncPacket(sync_type=word_data[1], clk_source=word_data[2] & 0x01, timestamp=word_data[3])
+        packet.io_group = io_group
+    return packet
+
+def _parse_lazy(msg, io_group):
+    msg_view = memoryview(msg)
+    header = parse_header(msg_view)
+    packets = list()
+    packets.append(TimestampPacket(timestamp=header[1]))
+    packets[0].io_group = io_group
+    has_receipt_timestamp = header[0] == 'DATA'
+    data_word_type = WORD_TYPE_DATA[0]
+    for idx in range(HEADER_LEN,len(msg_view),WORD_LEN):
+        if msg_view[idx] == data_word_type:
+            packet = PacketView(msg_view, idx + _packet_offset)
             packet.io_group = io_group
+            packet.io_channel = msg_view[idx+1]
+            if has_receipt_timestamp:
+                packet.receipt_timestamp = _receipt_timestamp_struct.unpack_from(
+                    msg_view, idx + _receipt_timestamp_offset)[0]
+        else:
+            packet = _parse_word_data(parse_word(header[0], msg_view[idx:idx+WORD_LEN]), io_group)
         if packet is not None:
             packets.append(packet)
     return packets
 
+def _check_types(types):
+    if types is None:
+        return tuple(word_type_table['DATA'])
+    types = tuple(types)
+    for word_type in types:
+        if word_type not in word_type_table['DATA']:
+            raise ValueError('invalid word type {}'.format(word_type))
+    return types
+
+def parse_to_array(msgs, io_groups=None, types=None, headers=True, check_parity=False):
+    '''
+    Converts one or many PACMAN messages into a single ``PacketArray``
+
+    This is a vectorized equivalent of ``parse``: the message words are
+    read directly into a ``word_dtype`` array and split by word type,
+    rather than being parsed one by one. Each message header is stored as a
+    timestamp packet (type code ``4``), followed by the data, trigger, and
+    sync words of the message. Other word types are skipped, as in
+    ``parse``.
+
+    :param msgs: a PACMAN message bytestring, or a sequence of messages
+
+    :param io_groups: ``io_group`` of each message, either a single value or a sequence with one value per message (optional, default: ``None``)
+
+    :param types: word types to keep, any of ``'DATA'``, ``'TRIG'``, and ``'SYNC'`` (optional, default: ``None``, keep all)
+
+    :param headers: if ``True``, include a timestamp packet for each message header (optional, default: ``True``)
+
+    :param check_parity: if ``True``, also return the parity check of each packet from ``PacketArray.has_valid_parity`` (optional, default: ``False``)
+
+    :returns: ``PacketArray``, or tuple of ``PacketArray`` and boolean ``numpy`` array (``True`` where the packet has valid parity) if ``check_parity`` is ``True``
+
+    '''
+    packets = _parse_to_array(msgs, io_groups=io_groups, types=types, headers=headers)
+    if check_parity:
+        return packets, packets.has_valid_parity()
+    return packets
+
+def _parse_to_array(msgs, io_groups=None, types=None, headers=True):
+    types = _check_types(types)
+    if isinstance(msgs, (bytes, bytearray, memoryview)):
+        msgs = [msgs]
+    if io_groups is None or np.ndim(io_groups) == 0:
+        io_groups = [io_groups] * len(msgs)
+    if len(io_groups) != len(msgs):
+        raise ValueError('io_groups length mismatch: expected {}, got {}'.format(
+            len(msgs), len(io_groups)))
+    if not len(msgs):
+        return PacketArray()
+
+    msg_headers = np.concatenate([
+        np.frombuffer(msg, dtype=msg_header_dtype, count=1) for msg in msgs])
+    words = [np.frombuffer(msg, dtype=word_dtype, offset=HEADER_LEN) for msg in msgs]
+    msg_index = np.repeat(np.arange(len(msgs)), [len(msg_words) for msg_words in words])
+    words = np.concatenate(words)
+
+    is_data_msg = msg_headers['msg_type'] == MSG_TYPE_DATA
+    io_groups = np.array([io_group or 0 for io_group in io_groups],
+        dtype=PacketArray.io_group_dtype)
+
+    # select the words that are converted to packets
+    word_type = words['word_type']
+    data_mask = (word_type == WORD_TYPE_DATA[0]) & ('DATA' in types)
+    trig_mask = (word_type == WORD_TYPE_TRIG[0]) & is_data_msg[msg_index] & ('TRIG' in types)
+    sync_mask = (word_type == WORD_TYPE_SYNC[0]) & is_data_msg[msg_index] & ('SYNC' in types)
+    keep = data_mask | trig_mask | sync_mask
+    words, msg_index = words[keep], msg_index[keep]
+    data_mask, trig_mask, sync_mask = data_mask[keep], trig_mask[keep], sync_mask[keep]
+
+    aux_type = np.zeros(words.shape, dtype=PacketArray.aux_type_dtype)
+    aux_type[trig_mask] = TriggerPacket.packet_type
+    aux_type[sync_mask] = SyncPacket.packet_type
+    type_byte = np.where(trig_mask, words['trigger_type'], words['sync_type'])
+    packet_words = np.where(data_mask, words['packet'],
+        _encode_aux_words(aux_type, words['timestamp'], type_byte, words['clk_source']))
+    io_channel = np.where(data_mask, words['io_channel'], 0)
+    receipt_timestamp = np.where(data_mask & is_data_msg[msg_index],
+        words['receipt_timestamp'], 0)
+
+    if not headers:
+        return PacketArray(
+            packet_words,
+            io_group=io_groups[msg_index],
+            io_channel=io_channel,
+            receipt_timestamp=receipt_timestamp,
+            aux_type=aux_type
+            )
+
+    # insert each message header before the words of the message
+    header_pos = np.searchsorted(msg_index, np.arange(len(msgs)))
+    header_aux_type = np.full(len(msgs), _timestamp_packet_type, dtype=aux_type.dtype)
+    return PacketArray(
+        np.insert(packet_words, header_pos,
+            _encode_aux_words(header_aux_type, msg_headers['timestamp'])),
+        io_group=np.insert(io_groups[msg_index], header_pos, io_groups),
+        io_channel=np.insert(io_channel, header_pos, 0),
+        receipt_timestamp=np.insert(receipt_timestamp, header_pos, 0),
+        aux_type=np.insert(aux_type, header_pos, header_aux_type)
+        )
+
+def iter_parse(msgs, io_groups=None, types=None, headers=True, chunk_size=65536, check_parity=False):
+    '''
+    Converts a stream of PACMAN messages into ``PacketArray`` chunks
+
+    Messages are consumed lazily from ``msgs`` and parsed in batches with
+    ``parse_to_array``, so the memory used is independent of the total
+    number of messages. Word types that are not in ``types`` are dropped
+    before any packets are created. E.g. to convert only the data words of
+    a file::
+
+        for chunk in iter_parse(msgs, io_groups, types=('DATA',), headers=False):
+            print(len(chunk), chunk.timestamp.max())
+
+    :param msgs: iterable of PACMAN message bytestrings
 
+    :param io_groups: ``io_group`` of each message, either a single value or an iterable with one value per message (optional, default: ``None``)
 
+    :param types: word types to keep, any of ``'DATA'``, ``'TRIG'``, and ``'SYNC'`` (optional, default: ``None``, keep all)
 
+    :param headers: if ``True``, include a timestamp packet for each message header (optional, default: ``True``)
 
+    :param chunk_size: number of packets in each chunk, all chunks except the last have exactly this length (optional, default: ``65536``)
 
+    :param check_parity: if ``True``, also yield the parity check of each chunk (see ``parse_to_array``) (optional, default: ``False``)
+
+    :yields: ``PacketArray`` of at most ``chunk_size`` packets, or tuple of ``PacketArray`` and boolean ``numpy`` parity check array if ``check_parity`` is ``True``
+
+    '''
+    for packets in _iter_parse(msgs, io_groups=io_groups, types=types, headers=headers, chunk_size=chunk_size):
+        if check_parity:
+            yield packets, packets.has_valid_parity()
+        else:
+            yield packets
+
+def _iter_parse(msgs, io_groups=None, types=None, headers=True, chunk_size=65536):
+    types = _check_types(types)
+    if chunk_size < 1:
+        raise ValueError('chunk_size must be positive')
+    if io_groups is None or np.ndim(io_groups) == 0:
+        io_groups = itertools.repeat(io_groups)
+
+    pending = []
+    n_pending = 0
+    batch_msgs, batch_io_groups = [], []
+    n_batch_words = 0
+    for msg, io_group in zip(msgs, io_groups):
+        batch_msgs.append(msg)
+        batch_io_groups.append(io_group)
+        n_batch_words += (len(msg) - HEADER_LEN) // WORD_LEN + 1
+        if n_batch_words < chunk_size:
+            continue
+        packets = _parse_to_array(batch_msgs, batch_io_groups, types=types, headers=headers)
+        batch_msgs, batch_io_groups = [], []
+        n_batch_words = 0
+        pending.append(packets)
+        n_pending += len(packets)
+        if n_pending < chunk_size:
+            continue
+        packets = PacketArray.concatenate(pending)
+        n_chunks = len(packets) // chunk_size
+        for i in range(n_chunks):
+            yield packets[i*chunk_size:(i+1)*chunk_size]
+        pending = [packets[n_chunks*chunk_size:]]
+        n_pending = len(pending[0])
+    if batch_msgs:
+        pending.append(_parse_to_array(batch_msgs, batch_io_groups, types=types, headers=headers))
+    packets = PacketArray.concatenate(pending)
+    for i in range(0, len(packets), chunk_size):
+        yield packets[i:i+chunk_size]
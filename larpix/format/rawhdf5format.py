@@ -24,6 +24,13 @@ the same length as the ``msgs`` list and passed into the file at the same time::
     rd['msgs'] # [b'message from 1', b'message from 2']
     rd['msg_headers']['io_groups'] # [1, 2]
 
+When writing many batches of messages to the same file, a ``RawFileWriter``
+keeps the file open between writes, rather than reopening it for each call
+to ``to_rawfile``::
+
+    with RawFileWriter('raw.h5') as writer:
+        writer.append(msgs, msg_headers={'io_groups': io_groups})
+
 File versioning
 ---------------
 
@@ -96,8 +103,35 @@ case, to convert to the standard ``larpix.format.hdf5format``::
 but as always, the most efficient means of accessing the data is to operate on
 the data itself, rather than converting between types.
 
-Metadata (v0.0)
----------------
+Reading messages without copying
+--------------------------------
+
+For version 0.1 files, the messages are read from the file as a single
+contiguous block of bytes. With ``copy=False``, ``from_rawfile`` returns each
+message as a ``memoryview`` of this block rather than as a new bytestring,
+which can be passed directly to ``larpix.format.pacman_msg_format.parse_to_array``::
+
+    rd = from_rawfile('raw.h5', copy=False)
+    packets = parse_to_array(rd['msgs'], rd['msg_headers']['io_groups'])
+
+Following a file while it is written
+------------------------------------
+
+To monitor a file that is being written to by another process (e.g. the raw
+file worker of ``larpix.io.PACMAN_IO``), use a ``RawFileTailer``. This keeps
+a single SWMR handle to the file open and only reads the messages that have
+been added since the last read::
+
+    with RawFileTailer('raw.h5') as tailer:
+        for rd in tailer.follow(timeout=10):
+            rd['msgs'] # new messages since last iteration
+            rd['msg_headers']['io_groups']
+
+With ``parse=True``, each new block of messages is instead parsed into a
+``larpix.packet.PacketArray``.
+
+Metadata (v0.0, v0.1)
+---------------------
 The group ``meta`` contains file metadata stored as attributes:
 
     - ``created``: ``float``, unix timestamp since the 1970 epoch in seconds indicating when file was first created
@@ -118,6 +152,19 @@ The hdf5 format contains two datasets ``msgs`` and ``msg_headers``:
 
         - ``'io_group'``: ``uint1`` representing the ``io_group`` associated with each message
 
+Datasets (v0.1)
+---------------
+Version 0.1 stores all of the message bytestrings in a single flat dataset,
+which is faster to write and read than the variable-length dataset of v0.0.
+The hdf5 format contains three datasets ``msgs``, ``msg_offsets``, and
+``msg_headers``:
+
+    - ``msgs``: shape ``(M,)``; ``uint1`` bytes of all messages, one after another
+
+    - ``msg_offsets``: shape ``(N,)``; ``uint8`` offset in ``msgs`` of the end of each message. Message ``i`` is ``msgs[msg_offsets[i-1]:msg_offsets[i]]`` (starting at ``0`` for the first message)
+
+    - ``msg_headers``: shape ``(N,)``; same as in v0.0
+
 '''
 import time
 import warnings
@@ -129,7 +176,7 @@ import h5py
 import numpy as np
 
 #: Most up-to-date raw larpix hdf5 format version.
-latest_version = '0.0'
+latest_version = '0.1'
 
 #: Description of the datasets and their dtypes used in each version of the raw larpix hdf5 format.
 #:
@@ -140,8 +187,37 @@ dataset_dtypes = {
         'msg_headers': np.dtype([
             ('io_groups','u1')
             ])
+    },
+    '0.1': {
+        'msgs': np.dtype('u1'),
+        'msg_offsets': np.dtype('u8'),
+        'msg_headers': np.dtype([
+            ('io_groups','u1')
+            ])
     }
 }
+
+#: HDF5 chunk length of the flat message bytes dataset (v0.1 and later).
+#: Larger chunks make for much faster writes than the ``h5py`` default.
+msgs_chunk_size = 2**16
+
+#: Dataset with one row per message in each version of the raw larpix hdf5 format
+msg_count_dsets = {
+    '0.0': 'msgs',
+    '0.1': 'msg_offsets'
+}
+
+def _store_msgs_v0_1(msgs, version, offset=0):
+    msg_bytes = np.frombuffer(b''.join(msgs), dtype=dataset_dtypes[version]['msgs'])
+    msg_offsets = offset + np.cumsum([len(msg) for msg in msgs], dtype=dataset_dtypes[version]['msg_offsets'])
+    return msg_bytes, msg_offsets
+
+def _parse_msgs_v0_1(msg_bytes, msg_offsets, version, copy=True):
+    buffer = memoryview(msg_bytes.tobytes())
+    starts = np.r_[0, msg_offsets[:-1]] if len(msg_offsets) else msg_offsets
+    if copy:
+        return [bytes(buffer[start:end]) for start, end in zip(starts.tolist(), msg_offsets.tolist())]
+    return [buffer[start:end] for start, end in zip(starts.tolist(), msg_offsets.tolist())]
 def _store_msgs_v0_0(msgs, version):
     msg_dtype = np.dtype('u1')
     arr_dtype = dataset_dtypes[version]['msgs']
@@ -213,87 +289,244 @@ def _parse_msg_headers(msg_headers, version):
     '''
     return _parse_msg_headers_v0_0(msg_headers, version)
 
-def to_rawfile(filename, msgs=None, version=None, msg_headers=None, io_version=None):
+def _read_msgs_v0_1(msgs_dset, msg_offsets_dset, selection, version, copy=True):
     '''
-    Write a list of bytestring messages to an hdf5 file. If the file exists,
-    the messages will appended to the end of the dataset.
+    Read the messages selected by a slice or boolean mask from a v0.1 file
+    with a single contiguous read of the ``msgs`` dataset
 
-    :param filename: desired filename for the file to write or update
+    '''
+    if isinstance(selection, slice):
+        start, end, _ = selection.indices(len(msg_offsets_dset))
+        end = max(start, end)
+        msg_offsets = msg_offsets_dset[start:end]
+        byte_start = int(msg_offsets_dset[start-1]) if start > 0 and end > start else 0
+        if not len(msg_offsets):
+            return []
+        msg_bytes = msgs_dset[byte_start:int(msg_offsets[-1])]
+        return _parse_msgs_v0_1(msg_bytes, msg_offsets - np.uint64(byte_start), version, copy=copy)
+    all_offsets = msg_offsets_dset[:]
+    all_starts = np.r_[0, all_offsets[:-1]].astype(all_offsets.dtype)
+    indices = np.flatnonzero(selection)
+    if not len(indices):
+        return []
+    byte_start = int(all_starts[indices[0]])
+    msg_bytes = msgs_dset[byte_start:int(all_offsets[indices[-1]])]
+    buffer = memoryview(msg_bytes.tobytes())
+    msgs = [buffer[int(all_starts[i]) - byte_start:int(all_offsets[i]) - byte_start] for i in indices]
+    if copy:
+        return [bytes(msg) for msg in msgs]
+    return msgs
+
+class RawFileWriter(object):
+    '''
+    Writes messages to a raw hdf5 file that is kept open (in SWMR mode)
+    between writes. E.g.::
 
-    :param msgs: iterable of variable-length bytestrings to write to the file. If ``None`` specified, will only create file and update metadata.
+        with RawFileWriter('raw.h5') as writer:
+            for msgs, io_groups in msg_batches:
+                writer.append(msgs, msg_headers={'io_groups': io_groups})
 
-    :param version: a string of major.minor version desired. If ``None`` specified, will use the latest file format version (if new file) or version in file (if updating an existing file).
+    ``to_rawfile`` opens the file and checks the metadata on each call,
+    ``RawFileWriter`` does this once. The datasets are flushed after each
+    write, so the file can be read (e.g. with a ``RawFileTailer``) while
+    it is being written.
 
-    :param msg_headers: a dict of iterables to associate with each message header. Iterables must be same length as ``msgs``. If ``None`` specified, will use a default value of ``0`` for each message. Keys are dtype field names specified in ``dataset_dtypes[version]['msg_headers'].names``
+    :param filename: desired filename for the file to write or update
 
-    :param io_version: optional metadata to associate with file corresponding to the io format version of the bytestring messages. Throws ``RuntimeError`` if version incompatibility encountered in an existing file.
+    :param version: a string of major.minor version desired. If ``None`` specified, will use the latest file format version (if new file) or version in file (if updating an existing file).
 
-    '''
-    now = time.time()
-    with h5py.File(filename, 'a', libver='latest') as f:
-        if 'meta' not in f.keys():
-            # new file
-            version = latest_version if version is None else version
-            f.create_group('meta')
-            f['meta'].attrs['version'] = version
-            f['meta'].attrs['created'] = now
-            f['meta'].attrs['modified'] = now
-            if io_version is not None:
-                f['meta'].attrs['io_version'] = io_version
-
-            # get current position in file
-            curr_idx = 0
-
-            # create datasets
-            f.create_dataset('msgs', shape=(0,), maxshape=(None,), compression='gzip', dtype=dataset_dtypes[version]['msgs'])
-            f.create_dataset('msg_headers', shape=(0,), maxshape=(None,), compression='gzip', dtype=dataset_dtypes[version]['msg_headers'])
-
-            f.swmr_mode = True
-        else:
-            # existing file
-            f.swmr_mode = True
+    :param io_version: optional metadata to associate with file corresponding to the io format version of the bytestring messages. Throws ``AssertionError`` if version incompatibility encountered in an existing file.
 
-            file_version = f['meta'].attrs['version']
-            assert (file_version == version) or (version is None), \
-                'Version mismatch! file: {}, requested: {}'.format(file_version, version)
-            version = file_version
-            assert (io_version is None) or ('io_version' in f['meta'].attrs.keys() and f['meta'].attrs['io_version'].split('.')[0] == io_version.split('.')[0] and f['meta'].attrs['io_version'].split('.')[-1] >= io_version.split('.')[-1]), 'IO version mismatch! file: {}, requested {}'.format(f['meta'].attrs['io_version'], io_version)
+    :param compression: optional, the HDF5 compression filter of newly created datasets. ``None`` disables compression, which allows much faster writes at the expense of file size (default: ``'gzip'``)
 
-            f['meta'].attrs['modified'] = now
+    :param compression_opts: optional, options for the compression filter (default: ``None``)
 
-        # update data
-        if msgs is not None:
-            headers = dict()
-            for key in msg_headers:
-                headers[key] = msg_headers[key]
-                if key not in dataset_dtypes[version]['msg_headers'].names:
-                    raise RuntimeError('Encountered unknown message header key {}'.format(key))
-            for key in dataset_dtypes[version]['msg_headers'].names:
-                if key not in headers:
-                    headers[key] = np.zeros(len(msgs))
-                assert len(headers[key]) == len(msgs), 'Data length mismatch! msgs is length {}, but msg_headers field {} is length {}'.format(len(msgs),key,len(headers[key]))
-
-            # resize datasets
-            curr_idx = len(f['msgs'])
-            f['msgs'].resize((curr_idx+len(msgs),))
-            f['msg_headers'].resize((curr_idx+len(msgs),))
+    '''
+    def __init__(self, filename, version=None, io_version=None, compression='gzip', compression_opts=None):
+        self.filename = filename
+        self.version = version
+        self.io_version = io_version
+        self.compression = compression
+        self.compression_opts = compression_opts
+        self._f = None
+        self.open()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def is_open(self):
+        return self._f is not None
+
+    def open(self):
+        '''
+        Open the file, create the metadata and datasets if needed
+
+        '''
+        if self.is_open:
+            return
+        now = time.time()
+        f = h5py.File(self.filename, 'a', libver='latest')
+        try:
+            if 'meta' not in f.keys():
+                # new file
+                self.version = latest_version if self.version is None else self.version
+                f.create_group('meta')
+                f['meta'].attrs['version'] = self.version
+                f['meta'].attrs['created'] = now
+                f['meta'].attrs['modified'] = now
+                if self.io_version is not None:
+                    f['meta'].attrs['io_version'] = self.io_version
+
+                # create datasets
+                for dset_name, dtype in dataset_dtypes[self.version].items():
+                    chunks = (msgs_chunk_size,) if dset_name == 'msgs' and self.version != '0.0' else True
+                    f.create_dataset(dset_name, shape=(0,), maxshape=(None,), dtype=dtype, chunks=chunks,
+                        compression=self.compression, compression_opts=self.compression_opts)
+
+                f.swmr_mode = True
+            else:
+                # existing file
+                f.swmr_mode = True
 
-            # store in file
+                file_version = f['meta'].attrs['version']
+                assert (file_version == self.version) or (self.version is None), \
+                    'Version mismatch! file: {}, requested: {}'.format(file_version, self.version)
+                self.version = file_version
+                io_version = self.io_version
+                assert (io_version is None) or ('io_version' in f['meta'].attrs.keys() and f['meta'].attrs['io_version'].split('.')[0] == io_version.split('.')[0] and f['meta'].attrs['io_version'].split('.')[-1] >= io_version.split('.')[-1]), 'IO version mismatch! file: {}, requested {}'.format(f['meta'].attrs['io_version'], io_version)
+
+                f['meta'].attrs['modified'] = now
+        except:
+            f.close()
+            raise
+        self._f = f
+
+    def _msg_headers_array(self, msg_headers, n_msgs):
+        if msg_headers is None:
+            msg_headers = dict()
+        headers = dict()
+        for key in msg_headers:
+            headers[key] = msg_headers[key]
+            if key not in dataset_dtypes[self.version]['msg_headers'].names:
+                raise RuntimeError('Encountered unknown message header key {}'.format(key))
+        for key in dataset_dtypes[self.version]['msg_headers'].names:
+            if key not in headers:
+                headers[key] = np.zeros(n_msgs)
+            assert len(headers[key]) == n_msgs, 'Data length mismatch! msgs is length {}, but msg_headers field {} is length {}'.format(n_msgs,key,len(headers[key]))
+        return _store_msg_headers(
+            headers,
+            version=self.version
+            )
+
+    def append(self, msgs, msg_headers=None):
+        '''
+        Write messages to the end of the file
+
+        :param msgs: iterable of variable-length bytestrings to write to the file
+
+        :param msg_headers: a dict of iterables to associate with each message header (see ``to_rawfile``)
+
+        '''
+        msgs = list(msgs)
+        if self.version == '0.0':
+            f = self._f
+            msg_headers_array = self._msg_headers_array(msg_headers, len(msgs))
+            curr_idx = len(f['msgs'])
             msgs_array = _store_msgs(
                 msgs,
-                version=version
+                version=self.version
                 )
-            msg_headers_array = _store_msg_headers(
-                msg_headers,
-                version=version
-                )
-
+            f['msgs'].resize((curr_idx+len(msgs),))
             f['msgs'][curr_idx:curr_idx + len(msgs_array)] = msgs_array
+            f['msg_headers'].resize((curr_idx+len(msgs),))
             f['msg_headers'][curr_idx:curr_idx + len(msg_headers_array)] = msg_headers_array
-
-        # flush
+            self.flush()
+        else:
+            msg_bytes, msg_ends = _store_msgs_v0_1(msgs, version=self.version)
+            self.append_bytes(msg_bytes, msg_ends, msg_headers)
+
+    def append_bytes(self, msg_bytes, msg_ends, msg_headers=None):
+        '''
+        Write messages that are stored one after another in a single buffer
+        to the end of the file. For v0.1 files, the buffer is written as-is
+        without splitting it into messages.
+
+        :param msg_bytes: ``uint8`` array (or bytes-like object) of all of the messages
+
+        :param msg_ends: array of the offset of the end of each message in ``msg_bytes``
+
+        :param msg_headers: a dict of iterables to associate with each message header (see ``to_rawfile``)
+
+        '''
+        msg_bytes = np.frombuffer(msg_bytes, dtype='u1') if not isinstance(msg_bytes, np.ndarray) else msg_bytes
+        msg_ends = np.asarray(msg_ends, dtype=dataset_dtypes['0.1']['msg_offsets'])
+        if self.version == '0.0':
+            buffer = msg_bytes.tobytes()
+            starts = np.r_[0, msg_ends[:-1]] if len(msg_ends) else msg_ends
+            self.append([buffer[start:end] for start, end in zip(starts.tolist(), msg_ends.tolist())], msg_headers)
+            return
+        f = self._f
+        msg_headers_array = self._msg_headers_array(msg_headers, len(msg_ends))
+        curr_idx = len(f['msg_offsets'])
+        # write (and flush) the message bytes before the offsets, so
+        # that SWMR readers never see an offset past the end of msgs
+        byte_idx = len(f['msgs'])
+        f['msgs'].resize((byte_idx+len(msg_bytes),))
+        f['msgs'][byte_idx:byte_idx + len(msg_bytes)] = msg_bytes
         f['msgs'].flush()
-        f['msg_headers'].flush()
+        f['msg_offsets'].resize((curr_idx+len(msg_ends),))
+        f['msg_offsets'][curr_idx:curr_idx + len(msg_ends)] = msg_ends + np.uint64(byte_idx)
+        f['msg_headers'].resize((curr_idx+len(msg_ends),))
+        f['msg_headers'][curr_idx:curr_idx + len(msg_headers_array)] = msg_headers_array
+        self.flush()
+
+    def flush(self):
+        '''
+        Flush the datasets to the file, so that they are visible to readers
+
+        '''
+        if not self.is_open:
+            return
+        for dset_name in dataset_dtypes[self.version]:
+            self._f[dset_name].flush()
+
+    def close(self):
+        '''
+        Flush and close the file
+
+        '''
+        if not self.is_open:
+            return
+        try:
+            self._f['meta'].attrs['modified'] = time.time()
+            self.flush()
+        finally:
+            self._f.close()
+            self._f = None
+
+def to_rawfile(filename, msgs=None, version=None, msg_headers=None, io_version=None):
+    '''
+    Write a list of bytestring messages to an hdf5 file. If the file exists,
+    the messages will appended to the end of the dataset.
+
+    :param filename: desired filename for the file to write or update
+
+    :param msgs: iterable of variable-length bytestrings to write to the file. If ``None`` specified, will only create file and update metadata.
+
+    :param version: a string of major.minor version desired. If ``None`` specified, will use the latest file format version (if new file) or version in file (if updating an existing file).
+
+    :param msg_headers: a dict of iterables to associate with each message header. Iterables must be same length as ``msgs``. If ``None`` specified, will use a default value of ``0`` for each message. Keys are dtype field names specified in ``dataset_dtypes[version]['msg_headers'].names``
+
+    :param io_version: optional metadata to associate with file corresponding to the io format version of the bytestring messages. Throws ``RuntimeError`` if version incompatibility encountered in an existing file.
+
+    '''
+    with RawFileWriter(filename, version=version, io_version=io_version) as writer:
+        if msgs is not None:
+            writer.append(msgs, msg_headers=msg_headers)
 
 def _synchronize(attempts, *dsets):
     if len(dsets) <= 1:
@@ -326,8 +559,9 @@ def len_rawfile(filename, attempts=1):
     for _ in range(_file_read_reattempts):
         try:
             with h5py.File(filename, 'r', swmr=True, libver='latest') as f:
-                _synchronize(attempts, f['msgs'], f['msg_headers'])
-                return len(f['msgs'])
+                msg_count_dset = f[msg_count_dsets[f['meta'].attrs['version']]]
+                _synchronize(attempts, msg_count_dset, f['msg_headers'])
+                return len(msg_count_dset)
         except OSError as e:
             if e.errno is None:
                 warnings.warn(str(e) + '\ntrying again...', RuntimeWarning)
@@ -336,7 +570,7 @@ def len_rawfile(filename, attempts=1):
                 raise e
     raise err
 
-def from_rawfile(filename, start=None, end=None, version=None, io_version=None, msg_headers_only=False, mask=None, attempts=1):
+def from_rawfile(filename, start=None, end=None, version=None, io_version=None, msg_headers_only=False, mask=None, attempts=1, copy=True):
     '''
     Read a chunk of bytestring messages from an existing file
 
@@ -356,6 +590,8 @@ def from_rawfile(filename, start=None, end=None, version=None, io_version=None,
 
     :param attempts: a parameter only relevant if file is being actively written to by another process, specifies number of refreshes to try if a synchronized state between the datasets is not achieved. A value less than ``0`` busy blocks until a synchronized state is achieved. A value greater than ``0`` tries to achieve synchronization a max of ``attempts`` before throwing a ``RuntimeError``. And a value of ``0`` does not attempt to synchronize (not recommended).
 
+    :param copy: if ``False``, the messages of a v0.1 file are returned as ``memoryview`` slices of a single buffer rather than as separate bytestrings (default: ``True``). Has no effect for v0.0 files.
+
     :returns: ``dict`` with keys for ``'created'``, ``'modified'``, ``'version'``, and ``'io_version'`` metadata, along with ``'msgs'`` (a ``list`` of bytestring messages) and ``'msg_headers'`` (a dict with message header field name: ``list`` of message header field data, 1 per message)
 
     '''
@@ -381,16 +617,22 @@ def from_rawfile(filename, start=None, end=None, version=None, io_version=None,
                 io_version = file_io_version
 
                 # check to make sure that the msgs and headers dsets are synchronized
-                _synchronize(attempts, f['msgs'], f['msg_headers'])
+                msg_count_dset = f[msg_count_dsets[file_version]]
+                _synchronize(attempts, msg_count_dset, f['msg_headers'])
 
                 # define chunk of data to load
                 start = int(start) if start is not None else 0
-                end = int(end) if end is not None else len(f['msgs'])
+                end = int(end) if end is not None else len(msg_count_dset)
                 mask = mask if mask is not None else slice(start,end)
 
                 # get data from file
                 msg_headers = _parse_msg_headers(f['msg_headers'][mask], version)
-                msgs = _parse_msgs(f['msgs'][mask], version) if not msg_headers_only else None
+                msgs = None
+                if not msg_headers_only and file_version == '0.0':
+                    msgs = _parse_msgs(f['msgs'][mask], version)
+                elif not msg_headers_only:
+                    f['msgs'].id.refresh()
+                    msgs = _read_msgs_v0_1(f['msgs'], f['msg_offsets'], mask, version, copy=copy)
 
                 return dict(
                     created=created,
@@ -408,3 +650,167 @@ def from_rawfile(filename, start=None, end=None, version=None, io_version=None,
                 raise e
         raise err
 
+
+class RawFileTailer(object):
+    '''
+    Incrementally read new messages from a raw hdf5 file that is being
+    actively written to by another process.
+
+    Unlike repeated calls to ``len_rawfile`` and ``from_rawfile``, a single
+    SWMR file handle is kept open and only the datasets are refreshed on each
+    read. Only messages that are present in both the message and message
+    header datasets are returned, so no synchronization retries are needed.
+
+    :param filename: raw hdf5 file to read
+
+    :param start: message index to start reading from (default = ``0``). If a value less than 0 is specified, index is relative to the end of the file at the time it is opened.
+
+    :param parse: if ``True``, new messages are returned as a ``larpix.packet.PacketArray`` (parsed with ``larpix.format.pacman_msg_format.parse_to_array``) rather than as a ``dict`` of messages and message headers (default = ``False``)
+
+    :param poll_interval: time in seconds to sleep between checks for new data in ``follow()``. Sets the maximum latency between a message being written to the file and it being returned (default = ``0.1``)
+
+    :param max_msgs: maximum number of messages to return from a single read (default = ``None``, no limit)
+
+    :param copy: passed to the message reader, see ``from_rawfile``
+
+    '''
+    def __init__(self, filename, start=0, parse=False, poll_interval=0.1, max_msgs=None, copy=True):
+        self.filename = filename
+        self.start = start
+        self.parse = parse
+        self.poll_interval = poll_interval
+        self.max_msgs = max_msgs
+        self.copy = copy
+
+        self.position = None
+        self.version = None
+        self.io_version = None
+        self._f = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __iter__(self):
+        return self.follow()
+
+    @property
+    def is_open(self):
+        return self._f is not None
+
+    def open(self):
+        '''
+        Open the file in SWMR read mode. Called automatically on first read.
+
+        '''
+        if self.is_open:
+            return
+        err = None
+        for _ in range(_file_read_reattempts):
+            try:
+                self._f = h5py.File(self.filename, 'r', swmr=True, libver='latest')
+                break
+            except OSError as e:
+                if e.errno is None:
+                    warnings.warn(str(e) + '\ntrying again...', RuntimeWarning)
+                    err = e
+                else:
+                    raise e
+        else:
+            raise err
+        self.version = self._f['meta'].attrs['version']
+        self.io_version = self._f['meta'].attrs['io_version'] \
+            if 'io_version' in self._f['meta'].attrs.keys() else None
+        if self.position is None:
+            self.position = int(self.start)
+            if self.position < 0:
+                self.position = max(self.refresh() + self.position, 0)
+
+    def close(self):
+        '''
+        Close the file handle. The current read position is retained, so
+        a subsequent read will re-open the file and continue from it.
+
+        '''
+        if self.is_open:
+            self._f.close()
+            self._f = None
+
+    def refresh(self):
+        '''
+        Refresh the file datasets to pick up newly written data
+
+        :returns: ``int`` number of complete messages now in the file
+
+        '''
+        self.open()
+        # refresh in the opposite order to which they are written, so that
+        # each dataset is at least as up-to-date as the one before it
+        self._f['msg_headers'].id.refresh()
+        n_headers = len(self._f['msg_headers'])
+        msg_count_dset = self._f[msg_count_dsets[self.version]]
+        msg_count_dset.id.refresh()
+        if self.version != '0.0':
+            self._f['msgs'].id.refresh()
+        return min(n_headers, len(msg_count_dset))
+
+    def available(self):
+        '''
+        :returns: ``int`` number of messages written to the file that have not yet been read
+
+        '''
+        return max(self.refresh() - self.position, 0)
+
+    def read(self, max_msgs=None):
+        '''
+        Read any new messages since the last read. Does not block.
+
+        :param max_msgs: maximum number of messages to read, if ``None`` uses ``self.max_msgs``
+
+        :returns: ``dict`` with ``'msgs'`` and ``'msg_headers'`` as in ``from_rawfile`` or, if ``parse=True``, a ``PacketArray``. Empty if no new messages are available.
+
+        '''
+        max_msgs = self.max_msgs if max_msgs is None else max_msgs
+        end = self.refresh()
+        if max_msgs is not None:
+            end = min(end, self.position + max_msgs)
+        end = max(end, self.position)
+        selection = slice(self.position, end)
+
+        msg_headers = _parse_msg_headers(self._f['msg_headers'][selection], self.version)
+        if self.version == '0.0':
+            msgs = _parse_msgs(self._f['msgs'][selection], self.version)
+        else:
+            msgs = _read_msgs_v0_1(self._f['msgs'], self._f['msg_offsets'], selection, self.version, copy=self.copy)
+        self.position = end
+
+        if self.parse:
+            from larpix.format.pacman_msg_format import parse_to_array
+            return parse_to_array(msgs, io_groups=msg_headers['io_groups'])
+        return dict(
+            msgs=msgs,
+            msg_headers=msg_headers
+            )
+
+    def follow(self, timeout=None):
+        '''
+        Generator that yields blocks of new messages as they are written to
+        the file (see ``read()``). Sleeps for ``poll_interval`` seconds
+        whenever no new messages are available.
+
+        :param timeout: stop iterating after no new messages have been seen for ``timeout`` seconds. If ``None``, iterates until the generator is closed
+
+        '''
+        last_data = time.time()
+        while True:
+            data = self.read()
+            if len(data if self.parse else data['msgs']):
+                yield data
+                last_data = time.time()
+                continue
+            if timeout is not None and time.time() > last_data + timeout:
+                return
+            time.sleep(self.poll_interval)
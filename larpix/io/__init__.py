@@ -4,3 +4,4 @@ from larpix.io.serialport import *
 from larpix.io.multizmq_io import *
 from larpix.io.zmq_io import *
 from larpix.io.pacman_io import *
+from larpix.io.async_pacman_io import *
@@ -0,0 +1,305 @@
+import asyncio
+import zmq
+import zmq.asyncio
+import bidict
+from collections import defaultdict
+
+from larpix.io import IO
+from larpix.io.pacman_io import PACMAN_IO
+import larpix.format.pacman_msg_format as pacman_msg_format
+
+class AsyncPACMAN_IO(IO):
+    '''
+    An ``asyncio`` interface to a network of PACMAN boards, equivalent to
+    ``PACMAN_IO``.
+
+    Each request to a PACMAN board is a coroutine, so requests to different
+    io groups can run concurrently from a single event loop, e.g.::
+
+        io = AsyncPACMAN_IO('io/pacman.json')
+        async def read_all(regs):
+            return await asyncio.gather(*[io.get_reg(reg, io_group=io_group)
+                for reg in regs for io_group in io.io_groups])
+
+    Requests to the same io group are sent one at a time, in the order they
+    were made (as with ``PACMAN_IO``, a reply is received for each request).
+
+    Incoming data messages can be read with ``empty_queue`` or iterated
+    over as they arrive::
+
+        io.start_listening()
+        async for msg, io_group in io:
+            packets = pacman_msg_format.parse(msg, io_group=io_group)
+
+    This class uses the same io configuration files as ``PACMAN_IO``. Unlike
+    ``PACMAN_IO``, it does not write raw files or use the ``PACMAN_IO``
+    optimization flags, other than ``group_packets_by_io_group``,
+    ``interleave_packets_by_io_channel``, ``double_send_packets``,
+    ``disable_packet_parsing``, and ``lazy_packet_parsing``.
+
+    '''
+    default_filepath = PACMAN_IO.default_filepath
+    max_msg_length = PACMAN_IO.max_msg_length
+    cmdserver_port = PACMAN_IO.cmdserver_port
+    dataserver_port = PACMAN_IO.dataserver_port
+    _valid_config_classes = ['PACMAN_IO', 'AsyncPACMAN_IO']
+
+    group_packets_by_io_group = True
+    interleave_packets_by_io_channel = True
+    double_send_packets = False
+    disable_packet_parsing = False
+    lazy_packet_parsing = False
+
+    def __init__(self, config_filepath=None, hwm=20000, relaxed=True, timeout=-1):
+        super(AsyncPACMAN_IO, self).__init__()
+        self.load(config_filepath)
+
+        self.context = zmq.asyncio.Context()
+        self.senders = bidict.bidict()
+        self.receivers = bidict.bidict()
+        for address in self._io_group_table.inv:
+            self.senders[address] = self.context.socket(zmq.REQ)
+            self.receivers[address] = self.context.socket(zmq.SUB)
+        self.hwm = hwm
+        self.timeout = timeout
+        for receiver in self.receivers.values():
+            receiver.set_hwm(self.hwm)
+            receiver.setsockopt(zmq.CONNECT_TIMEOUT,max(timeout,0))
+            receiver.setsockopt(zmq.LINGER,0)
+        for sender in self.senders.values():
+            if relaxed:
+                sender.setsockopt(zmq.REQ_RELAXED,True)
+            sender.setsockopt(zmq.LINGER,0)
+            sender.setsockopt(zmq.CONNECT_TIMEOUT,max(timeout,0))
+            sender.setsockopt(zmq.RCVTIMEO,timeout)
+            sender.setsockopt(zmq.SNDTIMEO,timeout)
+        for address in self._io_group_table.inv:
+            send_address = 'tcp://' + address + ':' + self.cmdserver_port
+            receive_address = 'tcp://' + address + ':' + self.dataserver_port
+            self.senders[address].connect(send_address)
+            self.receivers[address].connect(receive_address)
+        self._sender_replies = defaultdict(list)
+        self._sender_locks = defaultdict(asyncio.Lock)
+        self.send_errors = dict()
+        self.poller = zmq.asyncio.Poller()
+        for receiver in self.receivers.values():
+            self.poller.register(receiver, zmq.POLLIN)
+
+    @property
+    def io_groups(self):
+        '''
+        List of the io groups in the io configuration
+
+        '''
+        return list(self._io_group_table)
+
+    async def _request(self, address, msg):
+        '''
+        Send a request message to an address and wait for the reply
+
+        :returns: reply message bytestring
+
+        '''
+        async with self._sender_locks[address]:
+            await self.senders[address].send(msg)
+            reply = await self.senders[address].recv()
+        self._sender_replies[address].append(reply)
+        return reply
+
+    async def _for_each_io_group(self, method, *args, **kwargs):
+        io_groups = self.io_groups
+        values = await asyncio.gather(*[method(*args, io_group=io_group, **kwargs) for io_group in io_groups])
+        return dict(zip(io_groups, values))
+
+    async def send(self, packets):
+        '''
+        Sends request messages to PACMAN boards to send designated
+        packets. Messages to different io groups are sent concurrently.
+
+        If sending to some io groups fails, the messages to the other io
+        groups are still sent, and a ``RuntimeError`` is raised afterwards.
+        The errors for each io group are stored in the ``send_errors``
+        attribute.
+
+        '''
+        msg_packets = list()
+        if self.group_packets_by_io_group:
+            grouped_packets = PACMAN_IO._group_by_attr(packets, 'io_group')
+            for io_group, packets in grouped_packets.items():
+                msg_packets.append(packets)
+        else:
+            for packet in packets:
+                msg_packets.append([packet])
+
+        if self.interleave_packets_by_io_channel and self.group_packets_by_io_group:
+            msg_packets = [PACMAN_IO._interleave_by_attr(packets, 'io_channel') for packets in msg_packets]
+
+        if self.double_send_packets:
+            msg_packets = [packets for packets in msg_packets for _ in range(2)]
+
+        address_msgs = defaultdict(list)
+        for packets in msg_packets:
+            address = self._io_group_table[packets[0].io_group]
+            for i in range(0, len(packets), self.max_msg_length):
+                msg_len = min(len(packets)-i, self.max_msg_length)
+                address_msgs[address].append(pacman_msg_format.format(packets[i:i+msg_len], msg_type='REQ'))
+
+        async def send_msgs(address, msgs):
+            for msg in msgs:
+                await self._request(address, msg)
+
+        addresses = list(address_msgs)
+        results = await asyncio.gather(*[send_msgs(address, address_msgs[address]) for address in addresses], return_exceptions=True)
+        self.send_errors = dict([(self._io_group_table.inv[address], result)
+            for address, result in zip(addresses, results) if isinstance(result, Exception)])
+        if self.send_errors:
+            raise RuntimeError('Failed to send to io_group(s) {}: {}'.format(
+                sorted(self.send_errors), ', '.join([str(error) for error in self.send_errors.values()])))
+
+    def start_listening(self):
+        '''
+        Start keeping msgs from data server
+
+        '''
+        if self.is_listening:
+            raise RuntimeError('Already listening')
+        super(AsyncPACMAN_IO, self).start_listening()
+        for receiver in self.receivers.values():
+            receiver.setsockopt(zmq.SUBSCRIBE, b'')
+
+    def stop_listening(self):
+        '''
+        Stop keeping msgs from data server
+
+        '''
+        if not self.is_listening:
+            raise RuntimeError('Already not listening')
+        super(AsyncPACMAN_IO, self).stop_listening()
+        for receiver in self.receivers.values():
+            receiver.setsockopt(zmq.UNSUBSCRIBE, b'')
+
+    async def empty_queue(self):
+        '''
+        Fetch and parse waiting packets on pacman data sockets, without
+        waiting for new messages
+
+        returns tuple of list of packets, full bytestream of all messages
+
+        '''
+        packets = []
+        bytestream_list = list()
+        io_group_list = list()
+        for address, receiver in self.receivers.items():
+            n_recv = 0
+            while n_recv < self.hwm:
+                try:
+                    message = await receiver.recv(zmq.NOBLOCK)
+                except zmq.Again:
+                    break
+                n_recv += 1
+                bytestream_list.append(message)
+                io_group_list.append(self._io_group_table.inv[address])
+        bytestream = b''
+        if not self.disable_packet_parsing:
+            for message, io_group in zip(bytestream_list, io_group_list):
+                packets += pacman_msg_format.parse(message, io_group=io_group, lazy=self.lazy_packet_parsing)
+            bytestream = b''.join(bytestream_list)
+        return packets, bytestream
+
+    async def iter_messages(self, timeout=None):
+        '''
+        Asynchronous generator over incoming data messages, as they arrive
+
+        :param timeout: stop iterating after no messages have been received for ``timeout`` seconds. If ``None``, iterates until the generator is closed
+
+        :yields: tuple of message bytestring, ``io_group``
+
+        '''
+        poll_timeout = int(timeout * 1000) if timeout is not None else None
+        while True:
+            events = await self.poller.poll(poll_timeout)
+            if not events:
+                return
+            for receiver, _ in events:
+                io_group = self._io_group_table.inv[self.receivers.inv[receiver]]
+                try:
+                    while True:
+                        yield await receiver.recv(zmq.NOBLOCK), io_group
+                except zmq.Again:
+                    pass
+
+    def __aiter__(self):
+        return self.iter_messages()
+
+    def cleanup(self):
+        '''
+        Close the ZMQ objects to prevent a memory leak.
+
+        This method is only required if you plan on instantiating a new
+        ``AsyncPACMAN_IO`` object.
+
+        '''
+        for address in self.senders.keys():
+            self.senders[address].close(linger=0)
+            self.receivers[address].close(linger=0)
+        self.context.term()
+
+    async def transact(self, words, io_group=None):
+        '''
+        Performs several register operations with a single request message
+        to a PACMAN board (see ``PACMAN_IO.transact``)
+
+        :param words: list of register operations, each either ``('READ', reg)``, ``('WRITE', reg, val)``, or ``('PING',)``
+
+        :param io_group: ``io_group`` to send the transaction to. If ``None``, the transaction is sent to all io groups concurrently
+
+        :returns: list with the result of each operation. If no ``io_group`` is specified, returns a ``dict`` of ``io_group, results``
+
+        '''
+        if io_group is None:
+            return await self._for_each_io_group(self.transact, words)
+        msg = PACMAN_IO._format_transaction(words)
+        reply = await self._request(self._io_group_table[io_group], msg)
+        return PACMAN_IO._parse_transaction(words, reply)
+
+    async def set_reg(self, reg, val, io_group=None):
+        '''
+        Set a 32-bit register in the pacman PL
+
+        The reply is not checked, use ``transact`` to raise an error if the
+        write fails.
+
+        '''
+        if io_group is None:
+            return await self._for_each_io_group(self.set_reg, reg, val)
+        await self._request(self._io_group_table[io_group], PACMAN_IO._format_transaction([('WRITE',reg,val)]))
+
+    async def get_reg(self, reg, io_group=None):
+        '''
+        Read a 32-bit register from the pacman PL
+
+        If no ``io_group`` is specified, returns a ``dict`` of ``io_group, reg_value``
+        else returns reg_value
+
+        '''
+        if io_group is None:
+            return await self._for_each_io_group(self.get_reg, reg)
+        return (await self.transact([('READ',reg)], io_group=io_group))[0]
+
+    async def ping(self, io_group=None):
+        '''
+        Send a ping message
+
+        If no ``io_group`` is specified, returns a ``dict`` of ``io_group, response``
+        else returns response
+
+        '''
+        if io_group is None:
+            return await self._for_each_io_group(self.ping)
+        try:
+            return (await self.transact([('PING',)], io_group=io_group))[0]
+        except zmq.ZMQError as e:
+            print('IO error on {}: {}'.format(io_group,e))
+        except RuntimeError:
+            pass
+        return False
@@ -2,14 +2,15 @@ import itertools
 import zmq
 import bidict
 import time
-from collections import defaultdict
+from collections import defaultdict, deque
 import multiprocessing
-import sys
-if sys.version_info[0] >= 3:
-    from queue import Empty
-else:
-    from Queue import Empty
+from multiprocessing import shared_memory
+import threading
+import atexit
 import os
+import warnings
+
+import numpy as np
 
 from larpix.io import IO
 from larpix.configs import load
@@ -17,6 +18,178 @@ import larpix.format.pacman_msg_format as pacman_msg_format
 import larpix.format.rawhdf5format as rawhdf5format
 from larpix import Packet_v2
 
+class _SharedMessageRing(object):
+    '''
+    A single-producer, single-consumer queue of messages for passing data to
+    another process without pickling. The message bytes are copied into a
+    ring of bytes in shared memory, and the end position and ``io_group`` of
+    each message into a second ring of message entries.
+
+    The number of messages and bytes that have been written and read are
+    kept in a synchronized shared array, which is only updated once per
+    call to ``put`` or ``get``.
+
+    :param size: size of the byte ring
+
+    :param max_msgs: size of the message entry ring
+
+    '''
+    _written_msgs, _written_bytes, _read_msgs, _read_bytes = range(4)
+
+    def __init__(self, size, max_msgs):
+        self.size = int(size)
+        self.max_msgs = int(max_msgs)
+        self._data = shared_memory.SharedMemory(create=True, size=self.size)
+        self._ends = shared_memory.SharedMemory(create=True, size=self.max_msgs * 8)
+        self._io_groups = shared_memory.SharedMemory(create=True, size=self.max_msgs)
+        self._counters = multiprocessing.Array('Q', 4)
+        self._closed = multiprocessing.Event()
+        self._data_ready = multiprocessing.Event()
+        self._space_freed = multiprocessing.Event()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_views', None)
+        return state
+
+    @property
+    def views(self):
+        if not hasattr(self, '_views'):
+            self._views = (
+                np.ndarray((self.size,), dtype='u1', buffer=self._data.buf),
+                np.ndarray((self.max_msgs,), dtype='u8', buffer=self._ends.buf),
+                np.ndarray((self.max_msgs,), dtype='u1', buffer=self._io_groups.buf)
+                )
+        return self._views
+
+    @property
+    def closed(self):
+        return self._closed.is_set()
+
+    def _counter_values(self):
+        with self._counters.get_lock():
+            return tuple(self._counters[:])
+
+    def put(self, msgs, io_groups, timeout=None):
+        '''
+        Copy messages into the ring, waiting for space if it is full.
+        Messages that are larger than the ring, or that do not fit before
+        the timeout, are dropped.
+
+        :param msgs: list of bytes-like messages
+
+        :param io_groups: ``io_group`` of each message
+
+        :param timeout: max time in seconds to wait for space in the ring, if ``None`` waits indefinitely. Once the timeout is reached, the remaining messages are dropped without waiting
+
+        :returns: number of messages dropped
+
+        '''
+        data, ends, io_group_ring = self.views
+        written_msgs, written_bytes, read_msgs, read_bytes = self._counter_values()
+        n_written = 0
+        n_dropped = 0
+        start = time.time()
+        timed_out = False
+        for msg, io_group in zip(msgs, io_groups):
+            n_bytes = len(msg)
+            if n_bytes > self.size:
+                n_dropped += 1
+                continue
+            while written_bytes + n_bytes - read_bytes > self.size or written_msgs + 1 - read_msgs > self.max_msgs:
+                if n_written:
+                    self._publish(written_msgs, written_bytes)
+                    n_written = 0
+                if timed_out or (timeout is not None and time.time() > start + timeout):
+                    timed_out = True
+                    break
+                self._space_freed.wait(0.1)
+                self._space_freed.clear()
+                _, _, read_msgs, read_bytes = self._counter_values()
+            if timed_out:
+                n_dropped += 1
+                continue
+            pos = written_bytes % self.size
+            first = min(n_bytes, self.size - pos)
+            if first == n_bytes:
+                self._data.buf[pos:pos+n_bytes] = msg
+            else:
+                msg_view = memoryview(msg)
+                self._data.buf[pos:] = msg_view[:first]
+                self._data.buf[0:n_bytes-first] = msg_view[first:]
+            written_bytes += n_bytes
+            ends[written_msgs % self.max_msgs] = written_bytes
+            io_group_ring[written_msgs % self.max_msgs] = io_group
+            written_msgs += 1
+            n_written += 1
+        if n_written:
+            self._publish(written_msgs, written_bytes)
+        return n_dropped
+
+    def _publish(self, written_msgs, written_bytes):
+        with self._counters.get_lock():
+            self._counters[self._written_msgs] = written_msgs
+            self._counters[self._written_bytes] = written_bytes
+        self._data_ready.set()
+
+    def wait(self, timeout=None):
+        '''
+        Wait until new messages are put in the ring (or the ring is closed)
+
+        :returns: ``True`` if woken up before the timeout
+
+        '''
+        if self.closed:
+            return True
+        ready = self._data_ready.wait(timeout)
+        self._data_ready.clear()
+        return ready
+
+    def get(self):
+        '''
+        Copy all available messages out of the ring
+
+        :returns: tuple of ``uint8`` array of the message bytes, array of the end offset of each message, and array of the ``io_group`` of each message
+
+        '''
+        data, ends, io_group_ring = self.views
+        written_msgs, written_bytes, read_msgs, read_bytes = self._counter_values()
+        entries = np.arange(read_msgs, written_msgs) % self.max_msgs
+        msg_ends = ends[entries] - np.uint64(read_bytes)
+        msg_io_groups = io_group_ring[entries]
+        start, end = read_bytes % self.size, read_bytes % self.size + (written_bytes - read_bytes)
+        if end <= self.size:
+            msg_bytes = data[start:end].copy()
+        else:
+            msg_bytes = np.concatenate([data[start:], data[:end - self.size]])
+        with self._counters.get_lock():
+            self._counters[self._read_msgs] = written_msgs
+            self._counters[self._read_bytes] = written_bytes
+        self._space_freed.set()
+        return msg_bytes, msg_ends, msg_io_groups
+
+    def open(self):
+        self._closed.clear()
+
+    def close(self):
+        '''
+        Mark the ring as closed, to signal the consumer to stop
+
+        '''
+        self._closed.set()
+        self._data_ready.set()
+
+    def unlink(self):
+        '''
+        Release the shared memory (should only be called by the process that
+        created the ring)
+
+        '''
+        self.__dict__.pop('_views', None)
+        for shm in (self._data, self._ends, self._io_groups):
+            shm.close()
+            shm.unlink()
+
 class PACMAN_IO(IO):
     '''
     The PACMAN_IO object interfaces with a network of PACMAN
@@ -26,7 +199,7 @@ class PACMAN_IO(IO):
     formatted messages to/from the PACMAN boards. If you want more
     info on how messages are formatted, see ``larpix.format.pacman_msg_format``.
 
-    The PACMAN_IO object has five flags for optimizing communications
+    The PACMAN_IO object has eight flags for optimizing communications
     which you may or may not want to enable:
 
         - ``group_packets_by_io_group``
@@ -34,6 +207,9 @@ class PACMAN_IO(IO):
         - ``double_send_packets``
         - ``enable_raw_file_writing``
         - ``disable_packet_parsing``
+        - ``lazy_packet_parsing``
+        - ``enable_receiver_thread``
+        - ``concurrent_send``
 
     To enable each option set the flag to ``True``; to disable, set to
     ``False``.
@@ -44,10 +220,15 @@ class PACMAN_IO(IO):
 
         - The ``double_send_packets`` option is disabled by default and duplicates each packet sent to the PACMAN by a call to ``send()``. This is potentially useful for working around the 512 bug when you need to insure that a packet reaches a chip, but you don't care about introducing extra packets into the system (i.e. when configuring chips).
 
-        - The ``enable_raw_file_writing`` option will directly dump data to a larpix raw hdf5 formatted file. This is used as a more performant means of logging data (see ``larpix.format.rawhdf5format``). The data file name can be accessed or changed via the ``raw_filename`` attribute, or can be set when creating the ``PACMAN_IO`` object with the ``raw_directory`` and ``raw_filename`` keyword args.
+        - The ``enable_raw_file_writing`` option will directly dump data to a larpix raw hdf5 formatted file. This is used as a more performant means of logging data (see ``larpix.format.rawhdf5format``). The data file name can be accessed or changed via the ``raw_filename`` attribute, or can be set when creating the ``PACMAN_IO`` object with the ``raw_directory`` and ``raw_filename`` keyword args. The received messages are copied into a shared memory buffer of ``raw_buffer_size`` bytes (and up to ``raw_buffer_max_msgs`` messages), from which a separate process writes them to the file, keeping it open until ``join`` is called. If the buffer is full, ``empty_queue`` waits up to ``raw_buffer_timeout`` seconds for the file writer to catch up; messages that still do not fit are not written to the file, and are counted in the ``raw_dropped_msgs`` attribute (with a ``RuntimeWarning``). Set ``raw_buffer_timeout`` to ``None`` to wait indefinitely instead. The file datasets are compressed with ``raw_file_compression`` (``'gzip'`` by default); set it to ``None`` for the highest write rates.
 
         - The ``disable_packet_parsing`` option will skip converting PACMAN messages into ``larpix.packet`` types. Thus if ``disable_packet_parsing=True``, every call to ``empty_queue`` will return ``[], b''``. Typically used in conjunction with ``enable_raw_file_writing``, this allows the PACMAN_IO class to read data much faster.
 
+        - The ``lazy_packet_parsing`` option is disabled by default and parses received data words into ``larpix.packet.PacketView`` objects rather than ``Packet_v2`` objects. Each ``PacketView`` references the received message and decodes its fields on demand, which avoids copying each packet when only a few fields of each packet are used.
+
+        - The ``enable_receiver_thread`` option is disabled by default and, when set before calling ``start_listening``, receives messages on a background thread rather than only during calls to ``empty_queue``. The thread continuously polls the data sockets and stores the received messages in a ring buffer of up to ``receiver_buffer_size`` messages, so that bursts of data are not dropped by ZMQ between calls to ``empty_queue``. ``empty_queue`` then only swaps out the buffer. If the buffer fills, the oldest messages are discarded; the ``dropped_msgs`` and ``backlogged_msgs`` attributes count the messages discarded so far and the messages currently waiting in the buffer.
+
+        - The ``concurrent_send`` option is disabled by default and sends the messages for each io group in a call to ``send`` concurrently. Each io group still receives its messages in order, but the next message to an io group is sent as soon as the reply to the previous one arrives, rather than after the replies from all other io groups. If sending to some io groups fails (or times out), the messages to the other io groups are still sent, and a ``RuntimeError`` is raised afterwards. The errors for each io group of the last call to ``send`` are stored in the ``send_errors`` attribute.
 
     '''
     default_filepath = 'io/pacman.json'
@@ -62,6 +243,17 @@ class PACMAN_IO(IO):
     double_send_packets = False
     enable_raw_file_writing = False
     disable_packet_parsing = False
+    lazy_packet_parsing = False
+    enable_receiver_thread = False
+    concurrent_send = False
+
+    receiver_buffer_size = 200000
+    receiver_poll_interval = 0.1
+
+    raw_buffer_size = 2**26
+    raw_buffer_max_msgs = 2**20
+    raw_buffer_timeout = 10
+    raw_file_compression = 'gzip'
 
     _base_ctrl_reg = 0x10
     _clk_ctrl_reg = 0x1010
@@ -91,6 +283,7 @@ class PACMAN_IO(IO):
             self.senders[address] = self.context.socket(zmq.REQ)
             self.receivers[address] = self.context.socket(zmq.SUB)
         self.hwm = hwm
+        self.timeout = timeout
         for receiver in self.receivers.values():
             receiver.set_hwm(self.hwm)
             receiver.setsockopt(zmq.CONNECT_TIMEOUT,max(timeout,0))
@@ -109,17 +302,27 @@ class PACMAN_IO(IO):
             self.senders[address].connect(send_address)
             self.receivers[address].connect(receive_address)
         self._sender_replies = defaultdict(list)
+        self.send_errors = dict()
         self.poller = zmq.Poller()
         for receiver in self.receivers.values():
             self.poller.register(receiver, zmq.POLLIN)
 
-        self._raw_file_queue = multiprocessing.Queue()
+        self._receiver_thread = None
+        self._receiver_stop = threading.Event()
+        self._receiver_lock = threading.Lock()
+        self._receiver_buffer = deque(maxlen=self.receiver_buffer_size)
+        self.received_msgs = 0
+        self.dropped_msgs = 0
+
+        self._raw_file_ring = None
+        self._raw_file_worker = None
+        self.raw_dropped_msgs = 0
         self.raw_filename = os.path.join(
             raw_directory,
             raw_filename if raw_filename is not None \
                 else time.strftime(self.default_raw_filename_fmt)
         )
-        self._launch_raw_file_worker()
+        atexit.register(self.join)
 
     def send(self, packets):
         '''
@@ -153,7 +356,7 @@ class PACMAN_IO(IO):
             msg_packets = doubled_msg_packets
 
         # convert packets to messages
-        resp_addresses = list()
+        address_msgs = list()
         for packets in msg_packets:
             io_group = packets[0].io_group
             for i in range(0, len(packets), self.max_msg_length):
@@ -161,8 +364,74 @@ class PACMAN_IO(IO):
                 msg_len = min(len(packets)-i, self.max_msg_length)
                 msg = pacman_msg_format.format(packets[i:i+msg_len], msg_type='REQ')
                 address = self._io_group_table[io_group]
-                self.senders[address].send(msg)
-                self._sender_replies[address].append(self.senders[address].recv())
+                address_msgs.append((address, msg))
+
+        if self.concurrent_send:
+            self._send_concurrent(address_msgs)
+            return
+        for address, msg in address_msgs:
+            self.senders[address].send(msg)
+            self._sender_replies[address].append(self.senders[address].recv())
+
+    def _send_concurrent(self, address_msgs):
+        '''
+        Send messages to each address without waiting for the replies from
+        the other addresses. Each address has at most one message in flight,
+        so the messages (and replies) for an address stay in order.
+
+        :param address_msgs: list of ``(address, msg)`` tuples
+
+        '''
+        pending = defaultdict(deque)
+        for address, msg in address_msgs:
+            pending[address].append(msg)
+        poller = zmq.Poller()
+        deadlines = dict()
+        errors = dict()
+
+        def send_next(address):
+            sender = self.senders[address]
+            try:
+                sender.send(pending[address].popleft())
+            except zmq.ZMQError as e:
+                errors[address] = e
+                pending[address].clear()
+                return
+            deadlines[address] = time.time() + self.timeout / 1000 if self.timeout >= 0 else None
+            poller.register(sender, zmq.POLLIN)
+
+        def fail(address, error):
+            errors[address] = error
+            pending[address].clear()
+            del deadlines[address]
+            poller.unregister(self.senders[address])
+
+        for address in list(pending):
+            send_next(address)
+        while deadlines:
+            timeouts = [deadline - time.time() for deadline in deadlines.values() if deadline is not None]
+            poll_timeout = max(int(min(timeouts) * 1000), 0) if timeouts else None
+            events = dict(poller.poll(poll_timeout))
+            for address in list(deadlines):
+                sender = self.senders[address]
+                if sender in events:
+                    try:
+                        reply = sender.recv()
+                    except zmq.ZMQError as e:
+                        fail(address, e)
+                        continue
+                    self._sender_replies[address].append(reply)
+                    del deadlines[address]
+                    poller.unregister(sender)
+                    if pending[address]:
+                        send_next(address)
+                elif deadlines[address] is not None and time.time() >= deadlines[address]:
+                    fail(address, zmq.Again('Timed out waiting for reply'))
+
+        self.send_errors = dict([(self._io_group_table.inv[address], error) for address, error in errors.items()])
+        if self.send_errors:
+            raise RuntimeError('Failed to send to io_group(s) {}: {}'.format(
+                sorted(self.send_errors), ', '.join([str(error) for error in self.send_errors.values()])))
 
     def start_listening(self):
         '''
@@ -174,6 +443,8 @@ class PACMAN_IO(IO):
         super(PACMAN_IO, self).start_listening()
         for receiver in self.receivers.values():
             receiver.setsockopt(zmq.SUBSCRIBE, b'')
+        if self.enable_receiver_thread:
+            self._start_receiver_thread()
 
     def stop_listening(self):
         '''
@@ -183,9 +454,62 @@ class PACMAN_IO(IO):
         if not self.is_listening:
             raise RuntimeError('Already not listening')
         super(PACMAN_IO, self).stop_listening()
+        self._stop_receiver_thread()
         for receiver in self.receivers.values():
             receiver.setsockopt(zmq.UNSUBSCRIBE, b'')
 
+    @property
+    def backlogged_msgs(self):
+        '''
+        Number of messages received by the receiver thread that are waiting
+        for the next call to ``empty_queue``
+
+        '''
+        return len(self._receiver_buffer)
+
+    def _start_receiver_thread(self):
+        if self._receiver_thread is not None:
+            return
+        with self._receiver_lock:
+            if self._receiver_buffer.maxlen != self.receiver_buffer_size:
+                self._receiver_buffer = deque(self._receiver_buffer, maxlen=self.receiver_buffer_size)
+        self._receiver_stop.clear()
+        self._receiver_thread = threading.Thread(target=self._receiver)
+        self._receiver_thread.daemon = True
+        self._receiver_thread.start()
+
+    def _stop_receiver_thread(self):
+        if self._receiver_thread is None:
+            return
+        self._receiver_stop.set()
+        self._receiver_thread.join()
+        self._receiver_thread = None
+
+    def _receiver(self):
+        '''
+        Receiver thread target, moves messages from the data sockets into the
+        receiver buffer until ``_receiver_stop`` is set. While it is running,
+        the data sockets are only used by this thread.
+
+        '''
+        poller = zmq.Poller()
+        for receiver in self.receivers.values():
+            poller.register(receiver, zmq.POLLIN)
+        timeout = int(self.receiver_poll_interval * 1000)
+        while not self._receiver_stop.is_set():
+            for socket, _ in poller.poll(timeout):
+                address = self.receivers.inv[socket]
+                messages = list()
+                while len(messages) < self.hwm:
+                    try:
+                        messages.append((socket.recv(zmq.NOBLOCK, copy=False), address))
+                    except zmq.Again:
+                        break
+                with self._receiver_lock:
+                    self.received_msgs += len(messages)
+                    self.dropped_msgs += max(len(self._receiver_buffer) + len(messages) - self._receiver_buffer.maxlen, 0)
+                    self._receiver_buffer.extend(messages)
+
     @staticmethod
     def _group_by_attr(packets, attr):
         '''
@@ -224,13 +548,22 @@ class PACMAN_IO(IO):
 
         returns tuple of list of packets, full bytestream of all messages
 
+        If ``enable_receiver_thread`` is set, the messages are instead taken
+        from the receiver thread's buffer (see class description).
+
         '''
         packets = []
         address_list = list()
         bytestream_list = list()
         bytestream = b''
         n_recv = 0
-        while self.poller.poll(0) and n_recv < self.hwm:
+        if self._receiver_thread is not None or len(self._receiver_buffer):
+            with self._receiver_lock:
+                received, self._receiver_buffer = self._receiver_buffer, deque(maxlen=self._receiver_buffer.maxlen)
+            for frame, address in received:
+                bytestream_list.append(frame.bytes)
+                address_list.append(address)
+        while self._receiver_thread is None and self.poller.poll(0) and n_recv < self.hwm:
             events = dict(self.poller.poll(0))
             for socket, n_events in events.items():
                 for _ in range(n_events):
@@ -240,12 +573,16 @@ class PACMAN_IO(IO):
                     address_list += [self.receivers.inv[socket]]
         if not self.disable_packet_parsing:
             for message, address in zip(bytestream_list, address_list):
-                packets += pacman_msg_format.parse(message, io_group=self._io_group_table.inv[address])
+                packets += pacman_msg_format.parse(message, io_group=self._io_group_table.inv[address], lazy=self.lazy_packet_parsing)
             bytestream = b''.join(bytestream_list)
-        if self.enable_raw_file_writing:
-            self._raw_file_queue.put((bytestream_list, [self._io_group_table.inv[address] for address in address_list]))
-            if not self._raw_file_worker.is_alive():
+        if self.enable_raw_file_writing and bytestream_list:
+            if self._raw_file_worker is None or not self._raw_file_worker.is_alive():
                 self._launch_raw_file_worker()
+            n_dropped = self._raw_file_ring.put(bytestream_list, [self._io_group_table.inv[address] for address in address_list], timeout=self.raw_buffer_timeout)
+            if n_dropped:
+                self.raw_dropped_msgs += n_dropped
+                warnings.warn('{} messages not written to raw file {} ({} dropped so far)'.format(
+                    n_dropped, self.raw_filename, self.raw_dropped_msgs), RuntimeWarning)
 
         return packets,bytestream
 
@@ -254,46 +591,57 @@ class PACMAN_IO(IO):
         Close the ZMQ objects to prevent a memory leak.
 
         This method is only required if you plan on instantiating a new
-        ``PACMAN_IO`` object.
+        ``PACMAN_IO`` object. Any received data is also written to the raw
+        file and the file is closed (see ``join``).
 
         '''
+        self._stop_receiver_thread()
+        self.join()
         for address in self.senders.keys():
             self.senders[address].close(linger=0)
             self.receivers[address].close(linger=0)
         self.context.term()
+        atexit.unregister(self.join)
 
     @staticmethod
-    def _to_raw_file(queue_, filename, timeout=1, max_msgs=100000):
-        start_time = time.time()
-        while (time.time() < start_time + timeout or not queue_.empty()):
-            # wait for data
-            try:
-                msgs, io_groups = queue_.get(timeout=timeout)
-            except Empty:
-                continue
-            # buffer data
-            while len(msgs) < max_msgs:
-                try:
-                    new_msgs, new_io_groups = queue_.get(False)
-                    msgs.extend(new_msgs)
-                    io_groups.extend(new_io_groups)
-                except Empty:
+    def _to_raw_file(ring, filename, compression='gzip', poll_interval=1):
+        '''
+        Raw file worker process target, writes the messages from the
+        shared memory ring to the raw file until the ring is closed (or the
+        parent process exits). The file is kept open while running.
+
+        '''
+        parent = multiprocessing.parent_process()
+        with rawhdf5format.RawFileWriter(filename, io_version=pacman_msg_format.latest_version, compression=compression) as writer:
+            while True:
+                closed = ring.closed or (parent is not None and not parent.is_alive())
+                ring.wait(poll_interval)
+                msg_bytes, msg_ends, io_groups = ring.get()
+                if len(msg_ends):
+                    writer.append_bytes(msg_bytes, msg_ends, msg_headers={'io_groups': io_groups})
+                elif closed:
                     break
-            # write to file
-            if len(msgs):
-                rawhdf5format.to_rawfile(filename, msgs=msgs, msg_headers={'io_groups': io_groups}, io_version=pacman_msg_format.latest_version)
-                start_time = time.time()
 
     def _launch_raw_file_worker(self):
-        self._raw_file_worker = multiprocessing.Process(target=self._to_raw_file, args=(self._raw_file_queue, self.raw_filename))
+        if self._raw_file_ring is None:
+            self._raw_file_ring = _SharedMessageRing(self.raw_buffer_size, self.raw_buffer_max_msgs)
+        self._raw_file_ring.open()
+        self._raw_file_worker = multiprocessing.Process(target=self._to_raw_file, args=(self._raw_file_ring, self.raw_filename, self.raw_file_compression))
         self._raw_file_worker.start()
 
     def join(self):
         '''
-        Wait for raw file worker to finish
+        Wait for raw file worker to write all of the received data and
+        close the file
 
         '''
-        self._raw_file_worker.join()
+        if self._raw_file_worker is not None:
+            self._raw_file_ring.close()
+            self._raw_file_worker.join()
+            self._raw_file_worker = None
+        if self._raw_file_ring is not None:
+            self._raw_file_ring.unlink()
+            self._raw_file_ring = None
 
     @property
     def raw_filename(self):
@@ -302,19 +650,87 @@ class PACMAN_IO(IO):
     @raw_filename.setter
     def raw_filename(self,value):
         if hasattr(self,'_raw_filename') \
-                and value != self._raw_filename \
-                and self._raw_file_worker.is_alive():
+                and value != self._raw_filename:
             self.join()
         self._raw_filename = value
 
+    @staticmethod
+    def _format_transaction(words):
+        '''
+        Converts a list of register operations into a REQ message
+
+        '''
+        msg_words = list()
+        for word in words:
+            if word[0] == 'READ':
+                msg_words.append(('READ', word[1], 0))
+            elif word[0] in ('WRITE', 'PING'):
+                msg_words.append(tuple(word))
+            else:
+                raise ValueError('Invalid transaction word type {}'.format(word[0]))
+        return pacman_msg_format.format_msg('REQ', msg_words)
+
+    @staticmethod
+    def _parse_transaction(words, reply):
+        '''
+        Converts the REP message to a transaction into a list of values,
+        1 per word
+
+        '''
+        reply_words = pacman_msg_format.parse_msg(reply)[1]
+        for reply_word in reply_words:
+            if reply_word[0] == 'ERR':
+                raise RuntimeError('Error received from server: {}'.format(reply_word[1:]))
+        if len(reply_words) != len(words):
+            raise RuntimeError('Error received from server: expected {} words, got {}'.format(len(words), len(reply_words)))
+        values = list()
+        for word, reply_word in zip(words, reply_words):
+            if word[0] == 'PING' and reply_word[0] == 'PONG':
+                values.append(True)
+            elif word[0] == reply_word[0] and word[0] in ('READ', 'WRITE'):
+                values.append(reply_word[-1])
+            else:
+                raise RuntimeError('Error received from server')
+        return values
+
+    def transact(self, words, io_group=None):
+        '''
+        Performs several register operations with a single request message
+        (and a single round trip) to a PACMAN board. E.g.::
+
+            io.transact([('WRITE', reg, val), ('READ', reg)], io_group=1)
+            # [val, <new reg value>]
+
+        The operations are performed in order.
+
+        :param words: list of register operations, each either ``('READ', reg)``, ``('WRITE', reg, val)``, or ``('PING',)``
+
+        :param io_group: ``io_group`` to send the transaction to. If ``None``, the transaction is sent to all io groups concurrently
+
+        :returns: list with the result of each operation: the register value for ``'READ'``, the value written for ``'WRITE'``, and ``True`` for ``'PING'``. If no ``io_group`` is specified, returns a ``dict`` of ``io_group, results``
+
+        '''
+        msg = self._format_transaction(words)
+        if io_group is None:
+            addresses = [self._io_group_table[io_group] for io_group in self._io_group_table]
+            self._send_concurrent([(address, msg) for address in addresses])
+            return dict([(self._io_group_table.inv[address], self._parse_transaction(words, self._sender_replies[address][-1])) for address in addresses])
+        addr = self._io_group_table[io_group]
+        self.senders[addr].send(msg)
+        self._sender_replies[addr].append(self.senders[addr].recv())
+        return self._parse_transaction(words, self._sender_replies[addr][-1])
+
     def set_reg(self, reg, val, io_group=None):
         '''
         Set a 32-bit register in the pacman PL
 
+        The reply is not checked, use ``transact`` to raise an error if the
+        write fails.
+
         '''
         if io_group is None:
             return dict([(io_group,self.set_reg(reg, val, io_group=io_group)) for io_group in self._io_group_table])
-        msg = pacman_msg_format.format_msg('REQ',[('WRITE',reg,val)])
+        msg = self._format_transaction([('WRITE',reg,val)])
         addr = self._io_group_table[io_group]
         self.senders[addr].send(msg)
         self._sender_replies[addr].append(self.senders[addr].recv())
@@ -329,14 +745,7 @@ class PACMAN_IO(IO):
         '''
         if io_group is None:
             return dict([(io_group, self.get_reg(reg, io_group=io_group)) for io_group in self._io_group_table])
-        msg = pacman_msg_format.format_msg('REQ',[('READ',reg,0)])
-        addr = self._io_group_table[io_group]
-        self.senders[addr].send(msg)
-        self._sender_replies[addr].append(self.senders[addr].recv())
-        msg_data = pacman_msg_format.parse_msg(self._sender_replies[addr][-1])
-        if msg_data[1][0][0] == 'READ':
-            return msg_data[1][0][-1]
-        raise RuntimeError('Error received from server')
+        return self.transact([('READ',reg)], io_group=io_group)[0]
 
     def ping(self, io_group=None):
         '''
@@ -348,18 +757,35 @@ class PACMAN_IO(IO):
         '''
         if io_group is None:
             return dict([(io_group, self.ping(io_group=io_group)) for io_group in self._io_group_table])
-        msg = pacman_msg_format.format_msg('REQ',[('PING',)])
-        addr = self._io_group_table[io_group]
         try:
-            self.senders[addr].send(msg)
-            self._sender_replies[addr].append(self.senders[addr].recv())
-            msg_data = pacman_msg_format.parse_msg(self._sender_replies[addr][-1])
-            if msg_data[1][0][0] == 'PONG':
-                return True
+            return self.transact([('PING',)], io_group=io_group)[0]
         except zmq.ZMQError as e:
             print('IO error on {}: {}'.format(io_group,e))
+        except RuntimeError:
+            pass
         return False
 
+    def _read_adc(self, v_adc_reg, i_adc_reg, io_group, words=tuple()):
+        '''
+        Reads a pair of voltage and current ADCs, after performing ``words``
+        in the same transaction
+
+        '''
+        values = self.transact(list(words) + [('READ',v_adc_reg),('READ',i_adc_reg)], io_group=io_group)
+        return self._adc2mv(values[-2]), self._adc2ma(values[-1])
+
+    def _set_dac(self, dac_reg, dac, v_adc_reg, i_adc_reg, io_group, settling_time):
+        '''
+        Writes a DAC value then reads back a pair of voltage and current
+        ADCs, in a single transaction if there is no ``settling_time``
+
+        '''
+        if not settling_time:
+            return self._read_adc(v_adc_reg, i_adc_reg, io_group, words=[('WRITE',dac_reg,dac)])
+        self.set_reg(dac_reg, dac, io_group=io_group)
+        time.sleep(settling_time)
+        return self._read_adc(v_adc_reg, i_adc_reg, io_group)
+
     def get_vddd(self, io_group=None):
         '''
         Gets PACMAN VDDD voltage
@@ -370,9 +796,7 @@ class PACMAN_IO(IO):
         '''
         if io_group is None:
             return dict([(io_group, self.get_vddd(io_group=io_group)) for io_group in self._io_group_table])
-        mv = self._adc2mv(self.get_reg(self._vddd_adc_reg, io_group=io_group))
-        ma = self._adc2ma(self.get_reg(self._iddd_adc_reg, io_group=io_group))
-        return mv, ma
+        return self._read_adc(self._vddd_adc_reg, self._iddd_adc_reg, io_group)
 
     def set_vddd(self, vddd_dac=0xD5A3, io_group=None, settling_time=0.1):
         '''
@@ -386,10 +810,7 @@ class PACMAN_IO(IO):
         '''
         if io_group is None:
             return dict([(io_group, self.set_vddd(vddd_dac, io_group=io_group)) for io_group in self._io_group_table])
-        self.set_reg(self._vddd_dac_reg, vddd_dac, io_group=io_group)
-        if settling_time:
-            time.sleep(settling_time)
-        return self.get_vddd(io_group=io_group)
+        return self._set_dac(self._vddd_dac_reg, vddd_dac, self._vddd_adc_reg, self._iddd_adc_reg, io_group, settling_time)
 
     def get_vdda(self, io_group=None):
         '''
@@ -401,9 +822,7 @@ class PACMAN_IO(IO):
         '''
         if io_group is None:
             return dict([(io_group, self.get_vdda(io_group=io_group)) for io_group in self._io_group_table])
-        mv = self._adc2mv(self.get_reg(self._vdda_adc_reg, io_group=io_group))
-        ma = self._adc2ma(self.get_reg(self._idda_adc_reg, io_group=io_group))
-        return mv, ma
+        return self._read_adc(self._vdda_adc_reg, self._idda_adc_reg, io_group)
 
     def set_vdda(self, vdda_dac=0xD5A3, io_group=None, settling_time=0.1):
         '''
@@ -417,10 +836,7 @@ class PACMAN_IO(IO):
         '''
         if io_group is None:
             return dict([(io_group, self.set_vdda(vdda_dac, io_group=io_group)) for io_group in self._io_group_table])
-        self.set_reg(self._vdda_dac_reg, vdda_dac, io_group=io_group)
-        if settling_time:
-            time.sleep(settling_time)
-        return self.get_vdda(io_group=io_group)
+        return self._set_dac(self._vdda_dac_reg, vdda_dac, self._vdda_adc_reg, self._idda_adc_reg, io_group, settling_time)
 
     def get_vplus(self, io_group=None):
         '''
@@ -432,9 +848,7 @@ class PACMAN_IO(IO):
         '''
         if io_group is None:
             return dict([(io_group, self.get_vplus(io_group=io_group)) for io_group in self._io_group_table])
-        mv = self._adc2mv(self.get_reg(self._vplus_adc_reg, io_group=io_group))
-        ma = self._adc2ma(self.get_reg(self._iplus_adc_reg, io_group=io_group))
-        return mv, ma
+        return self._read_adc(self._vplus_adc_reg, self._iplus_adc_reg, io_group)
 
     def enable_tile(self, tile_indices=None, io_group=None):
         '''
@@ -453,8 +867,7 @@ class PACMAN_IO(IO):
         val = self.get_reg(self._base_ctrl_reg, io_group=io_group)
         for idx in tile_indices:
             val = val | (1 << idx)
-        self.set_reg(self._base_ctrl_reg, val, io_group=io_group)
-        return (self.get_reg(self._base_ctrl_reg, io_group=io_group) & 0xFF)
+        return (self.transact([('WRITE',self._base_ctrl_reg,val),('READ',self._base_ctrl_reg)], io_group=io_group)[-1] & 0xFF)
 
     def disable_tile(self, tile_indices=None, io_group=None):
         '''
@@ -473,8 +886,7 @@ class PACMAN_IO(IO):
         val = self.get_reg(self._base_ctrl_reg, io_group=io_group)
         for idx in tile_indices:
             val = val & (0xFFFFFFFF & ~(1 << idx))
-        self.set_reg(self._base_ctrl_reg, val, io_group=io_group)
-        return (self.get_reg(self._base_ctrl_reg, io_group=io_group) & 0xFF)
+        return (self.transact([('WRITE',self._base_ctrl_reg,val),('READ',self._base_ctrl_reg)], io_group=io_group)[-1] & 0xFF)
 
     def set_uart_clock_ratio(self, channel, ratio, io_group=None):
         '''
@@ -490,8 +902,7 @@ class PACMAN_IO(IO):
         if io_group is None:
             return dict([(io_group, self.set_uart_clock_ratio(channel, ratio, io_group=io_group)) for io_group in self._io_group_table])
         reg = self._channel_size*channel + self._uart_clock_ratio_offset + self._channel_offset
-        self.set_reg(reg, ratio, io_group=io_group)
-        return self.get_reg(reg, io_group=io_group)
+        return self.transact([('WRITE',reg,ratio),('READ',reg)], io_group=io_group)[-1]
 
     def reset_larpix(self, length=256, io_group=None):
         '''
@@ -505,10 +916,9 @@ class PACMAN_IO(IO):
         if io_group is None:
             return dict([(io_group, self.reset_larpix(length, io_group=io_group)) for io_group in self._io_group_table])
         # set reset cycles
-        self.set_reg(self._sw_reset_cycles_reg, length, io_group=io_group)
-        # toggle reset bit
-        clk_ctrl = self.get_reg(self._clk_ctrl_reg, io_group=io_group)
-        self.set_reg(self._clk_ctrl_reg, clk_ctrl|4, io_group=io_group)
-        self.set_reg(self._clk_ctrl_reg, clk_ctrl, io_group=io_group)
-        return self.get_reg(self._clk_ctrl_reg, io_group=io_group)
+        clk_ctrl = self.transact([('WRITE',self._sw_reset_cycles_reg,length),('READ',self._clk_ctrl_reg)], io_group=io_group)[-1]
+        # toggle reset bit, asserting and deasserting in separate requests
+        # so that reset is held for at least a full request round trip
+        self.transact([('WRITE',self._clk_ctrl_reg,clk_ctrl|4)], io_group=io_group)
+        return self.transact([('WRITE',self._clk_ctrl_reg,clk_ctrl),('READ',self._clk_ctrl_reg)], io_group=io_group)[-1]
 
@@ -1,3 +1,10 @@
+import numpy as np
+
+__all__ = [
+    'Key',
+    'KeyArray',
+]
+
 class Key(object):
     '''
     A unique specification for routing data to a particular detector sub-system.
@@ -34,28 +41,89 @@ class Key(object):
     Keys are "psuedo-immutable", i.e. you cannot change a Key's io_group,
     io_channel, or chip_id after it has been created.
 
+    Internally, the three fields are packed into a single integer
+    (``io_group << 16 | io_channel << 8 | chip_id``, see ``Key.packed``)
+    which is used to compare keys, and keys are interned so that creating a
+    key that already exists returns the existing object::
+
+        Key(1,1,1) is Key('1-1-1') # True
+        Key(1,1,1).packed # 65793
+
+    The hash of each key is calculated once, when the key is first created.
+
     '''
+    __slots__ = ('_io_group', '_io_channel', '_chip_id', '_packed', '_hash')
+
     key_delimiter = '-'
     key_format = key_delimiter.join(('{io_group}', '{io_channel}', '{chip_id}'))
 
-    def __init__(self, *args):
-        self._initialized = False
+    _interned = dict() # <packed key>: <Key>
+    _interned_keystrings = dict() # <keystring>: <Key>
+
+    def __new__(cls, *args):
         if len(args) == 3:
-            self.io_group = args[0]
-            self.io_channel = args[1]
-            self.chip_id = args[2]
+            return Key.from_packed(Key._pack(*args))
         elif len(args) == 1:
             if isinstance(args[0], Key):
-                self.io_group = args[0].io_group
-                self.io_channel = args[0].io_channel
-                self.chip_id = args[0].chip_id
+                return args[0]
             elif isinstance(args[0], bytes):
-                self.keystring = str(args[0].decode("utf-8"))
+                keystring = str(args[0].decode("utf-8"))
             else:
-                self.keystring = str(args[0])
-        else:
-            raise TypeError('Key() takes 1 or 3 arguments ({} given)'.format(len(args)))
-        self._initialized = True
+                keystring = str(args[0])
+            try:
+                return Key._interned_keystrings[keystring]
+            except KeyError:
+                pass
+            parsed_keystring = keystring.split(Key.key_delimiter)
+            if len(parsed_keystring) != 3:
+                raise ValueError('invalid keystring formatting')
+            key = Key.from_packed(Key._pack(*parsed_keystring))
+            Key._interned_keystrings[keystring] = key
+            return key
+        raise TypeError('Key() takes 1 or 3 arguments ({} given)'.format(len(args)))
+
+    def __reduce__(self):
+        return (Key, (self.io_group, self.io_channel, self.chip_id))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    @staticmethod
+    def _pack(io_group, io_channel, chip_id):
+        packed = 0
+        for name, val in (('io_group', io_group), ('io_channel', io_channel),
+                ('chip_id', chip_id)):
+            val = int(val)
+            if val > 255 or val < 0:
+                raise ValueError('{} must be 1-byte ({} invalid)'.format(name, val))
+            packed = (packed << 8) | val
+        return packed
+
+    @staticmethod
+    def from_packed(packed):
+        '''
+        Convert a packed integer (``io_group << 16 | io_channel << 8 | chip_id``)
+        into a Key object
+
+        :returns: ``Key``
+        '''
+        try:
+            return Key._interned[packed]
+        except KeyError:
+            pass
+        packed = int(packed)
+        if packed > 0xFFFFFF or packed < 0:
+            raise ValueError('packed key must be 3-bytes ({} invalid)'.format(packed))
+        key = object.__new__(Key)
+        key._io_group = packed >> 16
+        key._io_channel = (packed >> 8) & 0xFF
+        key._chip_id = packed & 0xFF
+        key._packed = packed
+        key._hash = hash(key.keystring)
+        return Key._interned.setdefault(packed, key)
 
     def __repr__(self):
         return 'Key(\'{}\')'.format(self.keystring)
@@ -65,9 +133,7 @@ class Key(object):
 
     def __eq__(self, other):
         if isinstance(other, Key):
-            return self.io_group == other.io_group and \
-            self.io_channel == other.io_channel \
-            and self.chip_id == other.chip_id
+            return self._packed == other._packed
         if isinstance(other, tuple):
             return self.io_group == other[0] and self.io_channel == other[1] \
             and self.chip_id == other[2]
@@ -79,7 +145,7 @@ class Key(object):
         return not self == other
 
     def __hash__(self):
-        return hash(str(self))
+        return self._hash
 
     def __getitem__(self, index):
         return (self.io_group, self.io_channel, self.chip_id)[index]
@@ -98,16 +164,15 @@ class Key(object):
 
     @keystring.setter
     def keystring(self, val):
-        if self._initialized:
-            raise AttributeError('keystring cannot be modified')
-        if not isinstance(val, str):
-            raise TypeError('keystring must be str')
-        parsed_keystring = val.split(Key.key_delimiter)
-        if len(parsed_keystring) != 3:
-            raise ValueError('invalid keystring formatting')
-        self.io_group = int(parsed_keystring[0])
-        self.io_channel = int(parsed_keystring[1])
-        self.chip_id = int(parsed_keystring[2])
+        raise AttributeError('keystring cannot be modified')
+
+    @property
+    def packed(self):
+        '''
+        3-byte unsigned integer representing the key as
+        ``io_group << 16 | io_channel << 8 | chip_id``
+        '''
+        return self._packed
 
     @property
     def chip_id(self):
@@ -119,12 +184,7 @@ class Key(object):
 
     @chip_id.setter
     def chip_id(self, val):
-        if self._initialized:
-            raise AttributeError('chipid cannot be modified')
-        chip_id = int(val)
-        if chip_id > 255 or chip_id < 0:
-            raise ValueError('chip_id must be 1-byte ({} invalid)'.format(chip_id))
-        self._chip_id = chip_id
+        raise AttributeError('chipid cannot be modified')
 
     @property
     def io_channel(self):
@@ -137,12 +197,7 @@ class Key(object):
 
     @io_channel.setter
     def io_channel(self, val):
-        if self._initialized:
-            raise AttributeError('io_channel cannot be modified')
-        io_channel = int(val)
-        if io_channel > 255 or io_channel < 0:
-            raise ValueError('io_channel must be 1-byte ({} invalid)'.format(io_channel))
-        self._io_channel = io_channel
+        raise AttributeError('io_channel cannot be modified')
 
     @property
     def io_group(self):
@@ -154,12 +209,7 @@ class Key(object):
 
     @io_group.setter
     def io_group(self, val):
-        if self._initialized:
-            raise AttributeError('io_group cannot be modified')
-        io_group = int(val)
-        if io_group > 255 or io_group < 0:
-            raise ValueError('io_group must be 1-byte ({} invalid)'.format(io_group))
-        self._io_group = io_group
+        raise AttributeError('io_group cannot be modified')
 
     @staticmethod
     def is_valid_keystring(keystring):
@@ -201,3 +251,138 @@ class Key(object):
         if not all([key in d for key in req_keys]):
             raise ValueError('dict must specify {}'.format(req_keys))
         return Key(d['io_group'], d['io_channel'], d['chip_id'])
+
+def _to_key(key):
+    if isinstance(key, tuple):
+        return Key(*key)
+    return Key(key)
+
+class KeyArray(object):
+    '''
+    A vectorized array of ``Key`` objects, stored as a ``numpy`` array of
+    packed keys (see ``Key.packed``). This is useful for grouping or
+    selecting many packets by chip without creating a ``Key`` for each
+    packet::
+
+        keys = KeyArray.from_columns(io_group, io_channel, chip_id)
+        keys == '1-1-12' # boolean numpy array
+        keys.unique() # KeyArray of each key present
+        keys.group() # {Key('1-1-12'): <indices of key 1-1-12>, ...}
+
+    Indexing with an integer returns a ``Key``, any other index returns a new
+    ``KeyArray``.
+
+    :param packed: optional, array-like of packed keys
+
+    '''
+    dtype = np.dtype('u4')
+
+    def __init__(self, packed=None):
+        if packed is None:
+            packed = np.zeros((0,), dtype=self.dtype)
+        self.packed = np.atleast_1d(np.asarray(packed, dtype=self.dtype))
+
+    @classmethod
+    def from_columns(cls, io_group, io_channel, chip_id):
+        '''
+        Create a ``KeyArray`` from arrays of io group, io channel, and chip id
+
+        '''
+        return cls(
+            (np.asarray(io_group, dtype=cls.dtype) << np.uint32(16))
+            | (np.asarray(io_channel, dtype=cls.dtype) << np.uint32(8))
+            | np.asarray(chip_id, dtype=cls.dtype)
+            )
+
+    @classmethod
+    def from_keys(cls, keys):
+        '''
+        Create a ``KeyArray`` from an iterable of keys (``Key`` objects,
+        keystrings, or ``(io_group, io_channel, chip_id)`` tuples)
+
+        '''
+        return cls(np.fromiter((_to_key(key).packed for key in keys), dtype=cls.dtype))
+
+    @property
+    def io_group(self):
+        return (self.packed >> np.uint32(16)).astype(np.uint8)
+
+    @property
+    def io_channel(self):
+        return ((self.packed >> np.uint32(8)) & np.uint32(0xFF)).astype(np.uint8)
+
+    @property
+    def chip_id(self):
+        return (self.packed & np.uint32(0xFF)).astype(np.uint8)
+
+    def __len__(self):
+        return len(self.packed)
+
+    def __iter__(self):
+        for packed in self.packed:
+            yield Key.from_packed(int(packed))
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return Key.from_packed(int(self.packed[index]))
+        return self.__class__(self.packed[index])
+
+    def __eq__(self, other):
+        if isinstance(other, KeyArray):
+            return self.packed == other.packed
+        try:
+            return self.packed == _to_key(other).packed
+        except (ValueError, TypeError):
+            return np.zeros(self.packed.shape, dtype=bool)
+
+    def __ne__(self, other):
+        return ~(self == other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'KeyArray({})'.format([str(key) for key in self])
+
+    def to_keys(self):
+        '''
+        Convert to a ``list`` of ``Key`` objects
+
+        '''
+        return list(self)
+
+    def isin(self, keys):
+        '''
+        :param keys: iterable of keys (``Key`` objects, keystrings, or tuples) or a ``KeyArray``
+
+        :returns: boolean ``numpy`` array, ``True`` where the key is in ``keys``
+
+        '''
+        if not isinstance(keys, KeyArray):
+            keys = KeyArray.from_keys(keys)
+        return np.isin(self.packed, keys.packed)
+
+    def unique(self, return_counts=False):
+        '''
+        Find the unique keys (sorted by packed key)
+
+        :param return_counts: if ``True``, also return the number of occurrences of each unique key
+
+        :returns: ``KeyArray`` of unique keys (and a ``numpy`` array of counts if ``return_counts``)
+
+        '''
+        if return_counts:
+            packed, counts = np.unique(self.packed, return_counts=True)
+            return self.__class__(packed), counts
+        return self.__class__(np.unique(self.packed))
+
+    def group(self):
+        '''
+        Group the indices of the array by key
+
+        :returns: ``dict`` of ``{<Key>: <numpy array of indices with that key>}``
+
+        '''
+        order = np.argsort(self.packed, kind='stable')
+        packed, starts = np.unique(self.packed[order], return_index=True)
+        groups = np.split(order, starts[1:])
+        return dict((Key.from_packed(int(key)), group) for key, group in zip(packed, groups))
@@ -1,18 +1,19 @@
 import time
 import os
 import threading
+import atexit
 import sys
 if sys.version_info[0] >= 3:
-    from queue import Queue, Empty
+    from queue import Queue
 else:
-    from Queue import Queue, Empty
+    from Queue import Queue
 
 import numpy as np
 import h5py
 
 from larpix.logger import Logger
-from larpix import Packet, TimestampPacket, Packet_v1, Packet_v2, SyncPacket, TriggerPacket
-from larpix.format.hdf5format import to_file, latest_version
+from larpix import dedupe, Packet, TimestampPacket, Packet_v1, Packet_v2, CompactPacket_v1, CompactPacket_v2, PacketView, SyncPacket, TriggerPacket
+from larpix.format.hdf5format import to_file, latest_version, HDF5Writer
 
 class HDF5Logger(Logger):
     '''
@@ -36,24 +37,32 @@ class HDF5Logger(Logger):
         default: '')
     :param version: the format version of LArPix+HDF5 to use (optional,
         default: ``larpix.format.hdf5format.latest_version``)
+    :param dedupe: if ``True``, remove duplicate packets (same packet
+        word, ``io_group``, and ``io_channel``) from each call to
+        ``record`` before buffering, e.g. when using
+        ``PACMAN_IO.double_send_packets`` (optional, default: ``False``)
 
     '''
     data_desc_map = {
         Packet_v1: 'packets',
         Packet_v2: 'packets',
+        CompactPacket_v1: 'packets',
+        CompactPacket_v2: 'packets',
+        PacketView: 'packets',
         TimestampPacket: 'packets',
         SyncPacket: 'packets',
         TriggerPacket: 'packets'
     }
 
     def __init__(self, filename=None, buffer_length=10000,
-            directory='', version=latest_version, enabled=False):
+            directory='', version=latest_version, enabled=False, dedupe=False):
         super(HDF5Logger, self).__init__(enabled=enabled)
         self.version = version
         self.filename = filename
         self.directory = directory
         self.datafile = None
         self.buffer_length = buffer_length
+        self.dedupe = dedupe
 
         self._buffer = {'packets': []}
         self._worker_queue = Queue()
@@ -106,6 +115,8 @@ class HDF5Logger(Logger):
             return
         if not isinstance(data, list):
             raise ValueError('data must be a list')
+        if self.dedupe:
+            data = dedupe(data)
 
         for data_obj in data:
             data_obj.direction = direction
@@ -129,7 +140,20 @@ class HDF5Logger(Logger):
         self.flush(block=False)
 
     def flush(self, block=True):
-        self._worker_queue.put(self._buffer['packets'])
+        '''
+        Send the buffered data to the IO thread to be written to the file
+
+        The IO thread keeps the file open across non-blocking flushes, so
+        that the file is only opened (and its metadata read) once while the
+        logger is running. Each write is flushed to disk, but the unused rows
+        at the end of the datasets are only removed and the file closed by a
+        blocking flush (e.g. when the logger is disabled, or at interpreter
+        exit). The file should not be opened by other processes until then.
+
+        :param block: ``True`` to wait until the data is written and the file is closed (optional, default: ``True``)
+
+        '''
+        self._worker_queue.put((self._buffer['packets'], block))
         if self._worker is None:
             self._launch_worker()
         if block:
@@ -137,20 +161,30 @@ class HDF5Logger(Logger):
         self._buffer['packets'] = []
 
     def _launch_worker(self):
-        self._worker = threading.Thread(target=self._writer)
+        self._worker = threading.Thread(target=self._writer, daemon=True)
         self._worker.start()
+        # close the file at exit if the logger is not disabled
+        atexit.register(self.flush)
 
     def _writer(self):
+        writer = None
+        close = False
         try:
-            while True:
-                packets = self._worker_queue.get(timeout=1)
-                to_file(self.filename, packets, version=self.version)
-                self._worker_queue.task_done()
-        except Empty:
-            pass
+            while not close:
+                packets, close = self._worker_queue.get()
+                if writer is None:
+                    writer = HDF5Writer(self.filename, version=self.version)
+                writer.append(packets)
+                if not close:
+                    writer.flush(trim=False)
+                    self._worker_queue.task_done()
         except:
             print('HDF5Logger IO thread error!')
             raise
         finally:
+            if writer is not None:
+                writer.close()
             self._worker = None
-
+            atexit.unregister(self.flush)
+            if close:
+                self._worker_queue.task_done()
@@ -4,6 +4,11 @@ from .timestamp_packet import *
 from .message_packet import *
 from .trigger_packet import *
 from .sync_packet import *
+from .compact_packet_v1 import *
+from .compact_packet_v2 import *
+from .packet_view import *
 Packet = Packet_v2
 
+from .packet_array import *
+
 from .packet_collection import *
@@ -0,0 +1,262 @@
+from bitarray import bitarray
+
+from .. import bitarrayhelper as bah
+from ..key import Key
+from .packet_v1 import Packet_v1
+
+class CompactPacket_v1(object):
+    '''
+    Integer-backed representation of a single 54-bit LArPix UART data packet.
+
+    ``CompactPacket_v1`` objects have the same interface as ``Packet_v1``
+    objects, but store the packet as a python ``int`` in ``__slots__`` rather
+    than as a ``bitarray``. The integer is the little-endian interpretation of
+    the 7 bytes returned by ``bytes()``, so bit ``i`` of ``bits`` corresponds
+    to bit ``53 - i`` of the integer.
+
+    Because there is no ``__dict__``, only the attributes that are used by
+    the larpix-control core (``direction``) can be attached to a
+    ``CompactPacket_v1``.
+
+    .. note:: The ``bits`` property returns a new ``bitarray`` on each access,
+        so modifying the returned bitarray in place does not modify the packet.
+        Assign to ``bits`` instead.
+
+    '''
+    __slots__ = ('_word', '_io_group', '_io_channel', '_chip_key', 'direction')
+
+    asic_version = Packet_v1.asic_version
+    size = Packet_v1.size
+    num_bytes = Packet_v1.num_bytes
+
+    packet_type_bits = Packet_v1.packet_type_bits
+    chipid_bits = Packet_v1.chipid_bits
+    parity_bit = Packet_v1.parity_bit
+    parity_calc_bits = Packet_v1.parity_calc_bits
+    channel_id_bits = Packet_v1.channel_id_bits
+    timestamp_bits = Packet_v1.timestamp_bits
+    dataword_bits = Packet_v1.dataword_bits
+    fifo_half_bit = Packet_v1.fifo_half_bit
+    fifo_full_bit = Packet_v1.fifo_full_bit
+    register_address_bits = Packet_v1.register_address_bits
+    register_data_bits = Packet_v1.register_data_bits
+    config_unused_bits = Packet_v1.config_unused_bits
+    test_counter_bits_11_0 = Packet_v1.test_counter_bits_11_0
+    test_counter_bits_15_12 = Packet_v1.test_counter_bits_15_12
+
+    DATA_PACKET = Packet_v1.DATA_PACKET
+    TEST_PACKET = Packet_v1.TEST_PACKET
+    CONFIG_WRITE_PACKET = Packet_v1.CONFIG_WRITE_PACKET
+    CONFIG_READ_PACKET = Packet_v1.CONFIG_READ_PACKET
+
+    _packet_types = (DATA_PACKET, TEST_PACKET, CONFIG_WRITE_PACKET, CONFIG_READ_PACKET)
+    _parity_calc_mask = (1 << (size - parity_calc_bits.start)) - 1
+
+    def __init__(self, bytestream=None):
+        self._io_group = None
+        self._io_channel = None
+        self._chip_key = None
+        if bytestream is None:
+            self._word = 0
+        elif len(bytestream) == self.num_bytes:
+            self._word = int.from_bytes(bytestream, 'little') & ((1 << self.size) - 1)
+        else:
+            raise ValueError('Invalid number of bytes: %s' %
+                    len(bytestream))
+
+    def __eq__(self, other):
+        return self.bits == other.bits
+
+    def __ne__(self, other):
+        return not (self == other)
+
+    __hash__ = None
+
+    __str__ = Packet_v1.__str__
+
+    def __repr__(self):
+        return 'CompactPacket_v1(' + str(self.bytes()) + ')'
+
+    def bytes(self):
+        '''
+        Construct the bytes that make up the packet.
+
+        Byte 0 is the first byte that would be sent out and contains the
+        first 8 bits of the packet (i.e. packet type and part of the
+        chip ID).
+
+        '''
+        return self._word.to_bytes(self.num_bytes, 'little')
+
+    export = Packet_v1.export
+
+    def from_dict(self, d):
+        ''' Inverse of export - modify packet based on dict '''
+        if not d['asic_version'] == self.asic_version:
+            raise ValueError('invalid asic version {}'.format(d['asic_version']))
+        if 'type' in d and d['type'] not in [bah.touint(packet_type) for packet_type in self._packet_types]:
+            raise ValueError('invalid packet type for CompactPacket_v1')
+        renamed = {
+            'type': 'packet_type',
+            'register': 'register_address',
+            'value': 'register_data',
+            'adc_counts': 'dataword',
+            'parity': 'parity_bit_value',
+            'counter': 'test_counter',
+            'channel': 'channel_id',
+            'fifo_half': 'fifo_half_flag',
+            'fifo_full': 'fifo_full_flag'
+            }
+        for key, value in d.items():
+            if key in ('type_str', 'valid_parity', 'asic_version'):
+                continue
+            elif key == 'bits':
+                self.bits = bitarray(value)
+            else:
+                setattr(self, renamed.get(key, key), value)
+
+    def as_int(self):
+        return self._word
+
+    @property
+    def bits(self):
+        return bah.fromuint(self._word, self.size)
+
+    @bits.setter
+    def bits(self, value):
+        self._word = bah.touint(value)
+        self._chip_key = None
+
+    @property
+    def chip_key(self):
+        if self._chip_key is not None:
+            return self._chip_key
+        if self._io_group is None or self._io_channel is None:
+            return None
+        self._chip_key = Key(self._io_group, self._io_channel, self.chipid)
+        return self._chip_key
+
+    @chip_key.setter
+    def chip_key(self, value):
+        self._chip_key = None
+        if value is None:
+            self.io_channel = None
+            self.io_group = None
+            return
+        if isinstance(value, Key):
+            self.io_group = value.io_group
+            self.io_channel = value.io_channel
+            self.chipid = value.chip_id
+            return
+        # try again by casting as a Key
+        self.chip_key = Key(value)
+
+    @property
+    def io_group(self):
+        return self._io_group
+
+    @io_group.setter
+    def io_group(self, value):
+        # no value validation!
+        self._io_group = value
+        self._chip_key = None
+
+    @property
+    def io_channel(self):
+        return self._io_channel
+
+    @io_channel.setter
+    def io_channel(self, value):
+        # no value validation!
+        self._io_channel = value
+        self._chip_key = None
+
+    @property
+    def packet_type(self):
+        return self._packet_types[self._packet_type].copy()
+
+    @packet_type.setter
+    def packet_type(self, value):
+        if isinstance(value, bitarray):
+            value = bah.touint(value)
+        self._packet_type = value
+
+    @property
+    def chipid(self):
+        return self._chipid
+
+    @chipid.setter
+    def chipid(self, value):
+        self._chipid = value
+        self._chip_key = None
+
+    @property
+    def chip_id(self):
+        # additional handle to match Packet_v2 name
+        return self.chipid
+
+    @chip_id.setter
+    def chip_id(self, value):
+        self.chipid = value
+
+    def compute_parity(self):
+        return 1 - (bin(self._word & self._parity_calc_mask).count('1') % 2)
+
+    def assign_parity(self):
+        self.parity_bit_value = self.compute_parity()
+
+    def has_valid_parity(self):
+        return self.parity_bit_value == self.compute_parity()
+
+    @property
+    def dataword(self):
+        ostensible_value = self._dataword
+        # TODO fix in LArPix v2
+        return ostensible_value - (ostensible_value % 2)
+
+    @dataword.setter
+    def dataword(self, value):
+        self._dataword = value
+
+    @property
+    def test_counter(self):
+        return (self._test_counter_15_12 << 12) + self._test_counter_11_0
+
+    @test_counter.setter
+    def test_counter(self, value):
+        self._test_counter_15_12 = (value >> 12) & 0xF
+        self._test_counter_11_0 = value & 0xFFF
+
+    @classmethod
+    def _basic_getter(cls, bit_slice):
+        # bits are indexed from the most significant bit of the packet
+        shift = cls.size - bit_slice.stop
+        mask = (1 << (bit_slice.stop - bit_slice.start)) - 1
+        def basic_getter_func(self):
+            return (self._word >> shift) & mask
+        return basic_getter_func
+
+    @classmethod
+    def _basic_setter(cls, bit_slice):
+        shift = cls.size - bit_slice.stop
+        mask = (1 << (bit_slice.stop - bit_slice.start)) - 1
+        clear_mask = ~(mask << shift)
+        def basic_setter_func(self, value):
+            self._word = (self._word & clear_mask) | ((int(value) & mask) << shift)
+        return basic_setter_func
+
+for _name, _bit_slice in (
+        ('_packet_type', CompactPacket_v1.packet_type_bits),
+        ('_chipid', CompactPacket_v1.chipid_bits),
+        ('parity_bit_value', slice(CompactPacket_v1.parity_bit, CompactPacket_v1.parity_bit+1)),
+        ('channel_id', CompactPacket_v1.channel_id_bits),
+        ('timestamp', CompactPacket_v1.timestamp_bits),
+        ('_dataword', CompactPacket_v1.dataword_bits),
+        ('fifo_half_flag', slice(CompactPacket_v1.fifo_half_bit, CompactPacket_v1.fifo_half_bit+1)),
+        ('fifo_full_flag', slice(CompactPacket_v1.fifo_full_bit, CompactPacket_v1.fifo_full_bit+1)),
+        ('register_address', CompactPacket_v1.register_address_bits),
+        ('register_data', CompactPacket_v1.register_data_bits),
+        ('_test_counter_11_0', CompactPacket_v1.test_counter_bits_11_0),
+        ('_test_counter_15_12', CompactPacket_v1.test_counter_bits_15_12)):
+    setattr(CompactPacket_v1, _name, property(CompactPacket_v1._basic_getter(_bit_slice), CompactPacket_v1._basic_setter(_bit_slice)))
+del _name, _bit_slice
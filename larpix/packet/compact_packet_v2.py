@@ -0,0 +1,346 @@
+from bitarray import bitarray
+
+from .. import bitarrayhelper as bah
+from ..key import Key
+from .packet_v2 import Packet_v2
+
+class _FifoDiagnosticsDefault(type):
+    '''
+    Metaclass that makes ``fifo_diagnostics_enabled`` a class attribute that
+    can also be set on a single instance, as for ``Packet_v2``. A class
+    attribute of the same name cannot be used directly since the instances
+    have no ``__dict__``.
+
+    '''
+    @property
+    def fifo_diagnostics_enabled(cls):
+        return cls._default_fifo_diagnostics_enabled
+
+    @fifo_diagnostics_enabled.setter
+    def fifo_diagnostics_enabled(cls, value):
+        cls._default_fifo_diagnostics_enabled = value
+
+class CompactPacket_v2(object, metaclass=_FifoDiagnosticsDefault):
+    '''
+    Integer-backed representation of a 64 bit LArPix v2 (or LightPix v1) UART
+    data packet.
+
+    ``CompactPacket_v2`` objects have the same interface as ``Packet_v2``
+    objects, but store the packet word as a python ``int`` in ``__slots__``
+    rather than as a ``bitarray``. Each field is extracted from the word with
+    a precomputed shift and mask, so field access and per-packet memory are
+    much smaller than for ``Packet_v2``. E.g.::
+
+        p = CompactPacket_v2() # initialize a packet of zeros
+        p.packet_type = 2 # set the packet type to a config write packet
+        p.chip_id = 12
+        p.bytes() # b'\x32\x00\x00\x00\x00\x00\x00\x00'
+
+    Because there is no ``__dict__``, only the attributes that are used by
+    the larpix-control core (``direction``, ``receipt_timestamp``, and
+    ``valid_parity``) can be attached to a ``CompactPacket_v2``.
+
+    .. note:: The ``bits`` property returns a new ``bitarray`` on each access,
+        so modifying the returned bitarray in place does not modify the packet.
+        Assign to ``bits`` instead.
+
+    As with ``Packet_v2``, FIFO diagnostics mode can be enabled for all
+    packets by setting ``CompactPacket_v2.fifo_diagnostics_enabled = True``,
+    or for a single packet by setting ``packet.fifo_diagnostics_enabled = True``.
+
+    '''
+    __slots__ = ('_word', '_io_group', '_io_channel', '_chip_key',
+        '_fifo_diagnostics_enabled', 'direction', 'receipt_timestamp',
+        'valid_parity')
+
+    asic_version = Packet_v2.asic_version
+    size = Packet_v2.size
+    num_bytes = Packet_v2.num_bytes
+
+    packet_type_bits = Packet_v2.packet_type_bits
+    chip_id_bits = Packet_v2.chip_id_bits
+    downstream_marker_bits = Packet_v2.downstream_marker_bits
+    parity_bits = Packet_v2.parity_bits
+    parity_calc_bits = Packet_v2.parity_calc_bits
+
+    channel_id_bits = Packet_v2.channel_id_bits
+    timestamp_bits = Packet_v2.timestamp_bits
+    first_packet_bits = Packet_v2.first_packet_bits
+    dataword_bits = Packet_v2.dataword_bits
+    trigger_type_bits = Packet_v2.trigger_type_bits
+    local_fifo_bits = Packet_v2.local_fifo_bits
+    shared_fifo_bits = Packet_v2.shared_fifo_bits
+    fifo_diagnostics_timestamp_bits = Packet_v2.fifo_diagnostics_timestamp_bits
+    local_fifo_events_bits = Packet_v2.local_fifo_events_bits
+    shared_fifo_events_bits = Packet_v2.shared_fifo_events_bits
+
+    register_address_bits = Packet_v2.register_address_bits
+    register_data_bits = Packet_v2.register_data_bits
+
+    _default_fifo_diagnostics_enabled = False
+
+    DATA_PACKET = Packet_v2.DATA_PACKET
+    TEST_PACKET = Packet_v2.TEST_PACKET
+    CONFIG_WRITE_PACKET = Packet_v2.CONFIG_WRITE_PACKET
+    CONFIG_READ_PACKET = Packet_v2.CONFIG_READ_PACKET
+
+    NORMAL_TRIG = Packet_v2.NORMAL_TRIG
+    EXT_TRIG = Packet_v2.EXT_TRIG
+    CROSS_TRIG = Packet_v2.CROSS_TRIG
+    PERIODIC_TRIG = Packet_v2.PERIODIC_TRIG
+
+    endian = Packet_v2.endian
+
+    _parity_calc_mask = (1 << parity_calc_bits.stop) - 1
+
+    def __init__(self, bytestream=None):
+        self._io_group = None
+        self._io_channel = None
+        self._chip_key = None
+        self._fifo_diagnostics_enabled = None
+        if bytestream is None:
+            self._word = 0
+        elif len(bytestream) == self.num_bytes:
+            self._word = int.from_bytes(bytestream, 'little')
+        else:
+            raise ValueError('Invalid number of bytes: %s' %
+                    len(bytestream))
+
+    @classmethod
+    def from_int(cls, word):
+        '''
+        Create a new packet from a 64-bit unsigned integer packet word
+
+        '''
+        p = cls()
+        p._word = int(word)
+        return p
+
+    def __eq__(self, other):
+        try:
+            return self._word == other.as_int()
+        except AttributeError:
+            return NotImplemented
+
+    def __ne__(self, other):
+        return not (self == other)
+
+    def __hash__(self):
+        return hash(self._word)
+
+    __str__ = Packet_v2.__str__
+
+    def __repr__(self):
+        return 'CompactPacket_v2(' + str(self.bytes()) + ')'
+
+    def bytes(self):
+        '''
+        Create bytes that represent the packet.
+
+        Byte 0 is still the first byte to send out and contains bits [0:7]
+
+        '''
+        return self._word.to_bytes(self.num_bytes, 'little')
+
+    export = Packet_v2.export
+
+    def from_dict(self, d):
+        '''
+        Load from a dict of values, inverse of ``CompactPacket_v2.export``
+
+        .. note:: If there is a disagreement between the bits specified and any of the values, this method has undefined results.
+
+        '''
+        if not d['asic_version'] == self.asic_version:
+            raise ValueError('invalid asic version {}'.format(d['asic_version']))
+        if 'type' in d and d['type'] not in (self.DATA_PACKET, self.TEST_PACKET, self.CONFIG_WRITE_PACKET, self.CONFIG_READ_PACKET):
+            raise ValueError('invalid packet type for CompactPacket_v2')
+        if 'local_fifo_events' in d or 'shared_fifo_events' in d:
+            self.fifo_diagnostics_enabled = True
+        for key, value in d.items():
+            if key in ('type_str', 'valid_parity', 'asic_version'):
+                continue
+            elif key == 'bits':
+                self.bits = bitarray(value)
+            else:
+                setattr(self, key, value)
+
+    def as_int(self):
+        return self._word
+
+    @property
+    def bits(self):
+        bits = bitarray(endian=self.endian)
+        bits.frombytes(self.bytes())
+        return bits
+
+    @bits.setter
+    def bits(self, value):
+        self._word = bah.touint(value, endian=self.endian)
+        self._chip_key = None
+
+    @property
+    def fifo_diagnostics_enabled(self):
+        if self._fifo_diagnostics_enabled is None:
+            return type(self)._default_fifo_diagnostics_enabled
+        return self._fifo_diagnostics_enabled
+
+    @fifo_diagnostics_enabled.setter
+    def fifo_diagnostics_enabled(self, value):
+        self._fifo_diagnostics_enabled = value
+
+    @property
+    def chip_key(self):
+        if self._chip_key is not None:
+            return self._chip_key
+        if self._io_group is None or self._io_channel is None:
+            return None
+        self._chip_key = Key(self._io_group, self._io_channel, self.chip_id)
+        return self._chip_key
+
+    @chip_key.setter
+    def chip_key(self, value):
+        self._chip_key = None
+        if value is None:
+            self.io_channel = None
+            self.io_group = None
+            return
+        if isinstance(value, Key):
+            self.io_group = value.io_group
+            self.io_channel = value.io_channel
+            self.chip_id = value.chip_id
+            return
+        # try again by casting as a Key
+        self.chip_key = Key(value)
+
+    @property
+    def io_group(self):
+        return self._io_group
+
+    @io_group.setter
+    def io_group(self, value):
+        # no value validation!
+        self._io_group = value
+        self._chip_key = None
+
+    @property
+    def io_channel(self):
+        return self._io_channel
+
+    @io_channel.setter
+    def io_channel(self, value):
+        # no value validation!
+        self._io_channel = value
+        self._chip_key = None
+
+    @property
+    def timestamp(self):
+        if self.fifo_diagnostics_enabled:
+            return self._fifo_diagnostics_timestamp
+        return self._timestamp
+
+    @timestamp.setter
+    def timestamp(self, value):
+        if self.fifo_diagnostics_enabled:
+            self._fifo_diagnostics_timestamp = value
+        else:
+            self._timestamp = value
+
+    @property
+    def local_fifo_half(self):
+        return self.local_fifo%2
+
+    @local_fifo_half.setter
+    def local_fifo_half(self, value):
+        self.local_fifo = self.local_fifo_full*2 + value
+
+    @property
+    def local_fifo_full(self):
+        return self.local_fifo//2
+
+    @local_fifo_full.setter
+    def local_fifo_full(self, value):
+        self.local_fifo = value*2 + self.local_fifo_half
+
+    @property
+    def shared_fifo_half(self):
+        return self.shared_fifo%2
+
+    @shared_fifo_half.setter
+    def shared_fifo_half(self, value):
+        self.shared_fifo = self.shared_fifo_full*2 + value
+
+    @property
+    def shared_fifo_full(self):
+        return self.shared_fifo//2
+
+    @shared_fifo_full.setter
+    def shared_fifo_full(self, value):
+        self.shared_fifo = value*2 + self.shared_fifo_half
+
+    def compute_parity(self):
+        return 1 - (bin(self._word & self._parity_calc_mask).count('1') % 2)
+
+    def assign_parity(self):
+        self.parity = self.compute_parity()
+
+    def has_valid_parity(self):
+        return self.parity == self.compute_parity()
+
+    @property
+    def local_fifo_events(self):
+        if self.fifo_diagnostics_enabled:
+            return self._local_fifo_events
+        return None
+
+    @local_fifo_events.setter
+    def local_fifo_events(self, value):
+        if self.fifo_diagnostics_enabled:
+            self._local_fifo_events = value
+
+    @property
+    def shared_fifo_events(self):
+        if self.fifo_diagnostics_enabled:
+            return self._shared_fifo_events
+        return None
+
+    @shared_fifo_events.setter
+    def shared_fifo_events(self, value):
+        if self.fifo_diagnostics_enabled:
+            self._shared_fifo_events = value
+
+    @property
+    def chip_id(self):
+        return (self._word >> 2) & 0xFF
+
+    @chip_id.setter
+    def chip_id(self, value):
+        self._word = (self._word & ~0x3FC) | ((int(value) & 0xFF) << 2)
+        self._chip_key = None
+
+    @classmethod
+    def _basic_getter(cls, bit_slice):
+        shift = bit_slice.start
+        mask = (1 << (bit_slice.stop - bit_slice.start)) - 1
+        def basic_getter_func(self):
+            return (self._word >> shift) & mask
+        return basic_getter_func
+
+    @classmethod
+    def _basic_setter(cls, bit_slice):
+        shift = bit_slice.start
+        mask = (1 << (bit_slice.stop - bit_slice.start)) - 1
+        clear_mask = ~(mask << shift)
+        def basic_setter_func(self, value):
+            self._word = (self._word & clear_mask) | ((int(value) & mask) << shift)
+        return basic_setter_func
+
+for _name in ('packet_type', 'downstream_marker', 'parity', 'channel_id',
+        'dataword', 'first_packet', 'trigger_type', 'register_address',
+        'register_data', 'local_fifo', 'shared_fifo'):
+    _bit_slice = getattr(CompactPacket_v2, _name + '_bits')
+    setattr(CompactPacket_v2, _name, property(CompactPacket_v2._basic_getter(_bit_slice), CompactPacket_v2._basic_setter(_bit_slice)))
+for _name in ('timestamp', 'fifo_diagnostics_timestamp', 'local_fifo_events', 'shared_fifo_events'):
+    _bit_slice = getattr(CompactPacket_v2, _name + '_bits')
+    setattr(CompactPacket_v2, '_' + _name, property(CompactPacket_v2._basic_getter(_bit_slice), CompactPacket_v2._basic_setter(_bit_slice)))
+del _name, _bit_slice
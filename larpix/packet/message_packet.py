@@ -12,10 +12,13 @@ class MessagePacket(object):
     :param timestamp: the timestamp of the message
 
     '''
+    __slots__ = ('packet_type', 'message', 'timestamp', 'io_group', 'direction',
+        'chip_key')
+
     size=72
-    chip_key = None
     def __init__(self, message, timestamp):
         self.packet_type = 5
+        self.chip_key = None
         self.message = message
         self.timestamp = timestamp
 
@@ -0,0 +1,579 @@
+import numpy as np
+
+from ..key import KeyArray
+from .packet_v2 import Packet_v2
+from .compact_packet_v2 import CompactPacket_v2
+from .timestamp_packet import TimestampPacket
+from .sync_packet import SyncPacket
+from .trigger_packet import TriggerPacket
+
+__all__ = [
+    'PacketArray',
+    'compute_parity',
+    'has_valid_parity',
+    'parity_errors',
+    'dedupe',
+]
+
+_parity_calc_mask = np.uint64((1 << Packet_v2.parity_calc_bits.stop) - 1)
+
+# packet type codes and word layout for timestamp, sync, and trigger packets within a PacketArray
+_timestamp_packet_type = TimestampPacket().packet_type
+_sync_packet_type = SyncPacket.packet_type
+_aux_timestamp_mask = (1 << TimestampPacket.size) - 1
+_aux_short_timestamp_mask = (1 << 32) - 1
+_aux_type_shift = 32
+_aux_clk_source_shift = 40
+
+def _aux_byte(value):
+    if value is None:
+        return 0
+    if isinstance(value, bytes):
+        return value[0]
+    return int(value)
+
+def _encode_aux_packet(packet):
+    '''
+    Encode a timestamp, sync, or trigger packet as a 64-bit word
+
+    '''
+    if isinstance(packet, TimestampPacket):
+        return (packet.timestamp or 0) & _aux_timestamp_mask
+    if isinstance(packet, SyncPacket):
+        return ((packet.timestamp or 0) & _aux_short_timestamp_mask) \
+            | (_aux_byte(packet.sync_type) << _aux_type_shift) \
+            | (_aux_byte(packet.clk_source) << _aux_clk_source_shift)
+    if isinstance(packet, TriggerPacket):
+        return ((packet.timestamp or 0) & _aux_short_timestamp_mask) \
+            | (_aux_byte(packet.trigger_type) << _aux_type_shift)
+    raise TypeError('{} cannot be stored in a PacketArray'.format(
+        packet.__class__.__name__))
+
+def _decode_aux_packet(aux_type, word, io_group):
+    '''
+    Inverse of ``_encode_aux_packet``
+
+    '''
+    if aux_type == _timestamp_packet_type:
+        packet = TimestampPacket(timestamp=word & _aux_timestamp_mask)
+        packet.io_group = io_group
+        return packet
+    if aux_type == _sync_packet_type:
+        return SyncPacket(
+            sync_type=bytes([(word >> _aux_type_shift) & 0xFF]),
+            clk_source=(word >> _aux_clk_source_shift) & 0x01,
+            timestamp=word & _aux_short_timestamp_mask,
+            io_group=io_group)
+    return TriggerPacket(
+        trigger_type=bytes([(word >> _aux_type_shift) & 0xFF]),
+        timestamp=word & _aux_short_timestamp_mask,
+        io_group=io_group)
+
+def _encode_aux_words(aux_type, timestamp, type_byte=0, clk_source=0):
+    '''
+    Vectorized equivalent of ``_encode_aux_packet``, from arrays of the
+    packet type code, timestamp, sync or trigger type byte, and clock source
+
+    '''
+    aux_type = np.asarray(aux_type)
+    timestamp = np.asarray(timestamp, dtype=np.uint64)
+    short_words = (timestamp & np.uint64(_aux_short_timestamp_mask)) \
+        | (np.asarray(type_byte, dtype=np.uint64) << np.uint64(_aux_type_shift)) \
+        | ((np.asarray(clk_source, dtype=np.uint64) & np.uint64(0x01)) << np.uint64(_aux_clk_source_shift))
+    return np.where(aux_type == _timestamp_packet_type,
+        timestamp & np.uint64(_aux_timestamp_mask), short_words).astype(np.uint64)
+
+def _xor_fold(words):
+    '''
+    Fold each 64-bit word onto its least significant bit with xor, i.e.
+    return the number of set bits in each word modulo 2
+
+    '''
+    words = words.copy()
+    for shift in (32, 16, 8, 4, 2, 1):
+        words ^= words >> np.uint64(shift)
+    return words & np.uint64(1)
+
+def compute_parity(words):
+    '''
+    Compute the odd parity bit for each word in an array of LArPix v2
+    packet words. Vectorized equivalent of ``Packet_v2.compute_parity``.
+
+    :param words: array-like of 64-bit packet words
+
+    :returns: ``numpy`` array of ``uint8`` parity bits
+
+    '''
+    words = np.asarray(words, dtype=np.uint64)
+    return (np.uint64(1) ^ _xor_fold(words & _parity_calc_mask)).astype(np.uint8)
+
+def has_valid_parity(words):
+    '''
+    Check the parity of each word in an array of LArPix v2 packet words.
+    Vectorized equivalent of ``Packet_v2.has_valid_parity``.
+
+    :param words: array-like of 64-bit packet words
+
+    :returns: boolean ``numpy`` array, ``True`` where the packet has valid (odd) parity
+
+    '''
+    words = np.asarray(words, dtype=np.uint64)
+    return _xor_fold(words) == np.uint64(1)
+
+def parity_errors(packets):
+    '''
+    Check the parity of a ``PacketArray`` and count the packets with invalid
+    parity from each chip
+
+    :param packets: ``PacketArray`` to check
+
+    :returns: ``tuple`` of boolean ``numpy`` array (``True`` where the packet has valid parity) and ``dict`` of ``{<chip key>: <number of packets with invalid parity>}``
+
+    '''
+    valid = packets.has_valid_parity()
+    keys, counts = packets[~valid].chip_key.unique(return_counts=True)
+    return valid, dict((key, int(count)) for key, count in zip(keys, counts))
+
+def _packet_identity(packet):
+    '''
+    Hashable identity of a packet object, including its routing information
+
+    '''
+    if hasattr(packet, 'bytes'):
+        content = packet.bytes()
+    else:
+        content = repr(packet)
+    return (packet.__class__, content, getattr(packet, 'io_group', None),
+        getattr(packet, 'io_channel', None))
+
+def dedupe(packets, return_index=False):
+    '''
+    Remove duplicate packets (e.g. from ``PACMAN_IO.double_send_packets`` or
+    from repeated configuration reads), keeping the first occurrence of each
+    packet. Two packets are duplicates if they have the same packet word and
+    the same ``io_group`` and ``io_channel``; the ``receipt_timestamp`` is
+    ignored.
+
+    A ``PacketArray`` is de-duplicated with a vectorized sort on the packet
+    word and routing columns, any other iterable of packets with a ``set``.
+
+    :param packets: ``PacketArray`` or iterable of packet objects
+
+    :param return_index: if ``True``, also return the indices of the kept packets (optional, default: ``False``)
+
+    :returns: de-duplicated packets in their original order, as a ``PacketArray`` if ``packets`` is a ``PacketArray`` and a ``list`` otherwise. If ``return_index`` is ``True``, a ``tuple`` of the packets and a ``numpy`` array of their indices in ``packets``
+
+    '''
+    if isinstance(packets, PacketArray):
+        return packets.unique(return_index=return_index)
+    packets = list(packets)
+    seen = set()
+    index = []
+    for i, packet in enumerate(packets):
+        identity = _packet_identity(packet)
+        if identity not in seen:
+            seen.add(identity)
+            index.append(i)
+    unique_packets = [packets[i] for i in index]
+    if return_index:
+        return unique_packets, np.array(index, dtype=int)
+    return unique_packets
+
+class PacketArray(object):
+    '''
+    A columnar container of many LArPix v2 UART packets.
+
+    Rather than creating a ``Packet_v2`` object for each packet, the
+    ``PacketArray`` stores the 64-bit packet words in a single
+    ``numpy.uint64`` array along with parallel arrays for the ``io_group``,
+    ``io_channel``, and ``receipt_timestamp`` of each packet. Each of the
+    ``Packet_v2`` fields is available as a property that is extracted from
+    the words with a vectorized shift-and-mask, e.g.::
+
+        pa = PacketArray(words, io_group=1, io_channel=channels)
+        pa.chip_id # numpy array of the chip id of each packet
+        pa.timestamp[pa.packet_type == Packet_v2.DATA_PACKET] # timestamps of data packets
+
+    ``Packet_v2`` objects are only created when indexing with an integer (or
+    when iterating)::
+
+        pa[0] # Packet_v2(b'...')
+        pa[:10] # PacketArray with the first 10 packets
+        pa[pa.chip_id == 12] # PacketArray with packets from chip 12
+
+    As with ``Packet_v2``, the bit layout of the data packets depends on if
+    FIFO diagnostics are enabled. This can be set for all ``PacketArray``
+    objects with ``PacketArray.fifo_diagnostics_enabled = True`` or for
+    a single object with ``pa.fifo_diagnostics_enabled = True``.
+
+    Missing routing information (e.g. a packet with an ``io_group`` of
+    ``None``) is stored as ``0``.
+
+    ``TimestampPacket``, ``SyncPacket``, and ``TriggerPacket`` objects can
+    also be stored in a ``PacketArray``. These are marked by their packet
+    type code (``4``, ``6``, or ``7``, as in the HDF5 format) in the
+    ``aux_type`` column, which is ``0`` for LArPix packets, and are returned
+    as their own type when indexing. As in the HDF5 format,
+    ``pa.packet_type`` gives the type code, ``pa.timestamp`` the timestamp,
+    ``pa.trigger_type`` the sync or trigger type, and ``pa.dataword`` the
+    clock source of these packets, while the other fields are ``0``.
+    ``MessagePacket`` objects cannot be stored in a ``PacketArray``.
+
+    :param words: optional, array-like of 64-bit packet words (as unsigned ints)
+
+    :param io_group: optional, array-like or scalar ``io_group`` of each packet
+
+    :param io_channel: optional, array-like or scalar ``io_channel`` of each packet
+
+    :param receipt_timestamp: optional, array-like or scalar ``receipt_timestamp`` of each packet
+
+    :param aux_type: optional, array-like or scalar packet type code of each packet that is not a LArPix packet (``0`` for LArPix packets)
+
+    '''
+    fifo_diagnostics_enabled = False
+
+    #: Packet fields available as ``numpy`` arrays
+    fields = ('packet_type', 'chip_id', 'downstream_marker', 'parity',
+        'channel_id', 'timestamp', 'first_packet', 'dataword',
+        'trigger_type', 'local_fifo', 'shared_fifo', 'register_address',
+        'register_data', 'local_fifo_events', 'shared_fifo_events')
+
+    words_dtype = np.dtype('u8')
+    io_group_dtype = np.dtype('u1')
+    io_channel_dtype = np.dtype('u1')
+    receipt_timestamp_dtype = np.dtype('u4')
+    aux_type_dtype = np.dtype('u1')
+
+    def __init__(self, words=None, io_group=None, io_channel=None, receipt_timestamp=None, aux_type=None):
+        if words is None:
+            words = np.zeros((0,), dtype=self.words_dtype)
+        self.words = np.atleast_1d(np.asarray(words, dtype=self.words_dtype))
+        self.io_group = self._column(io_group, self.io_group_dtype)
+        self.io_channel = self._column(io_channel, self.io_channel_dtype)
+        self.receipt_timestamp = self._column(receipt_timestamp, self.receipt_timestamp_dtype)
+        self.aux_type = self._column(aux_type, self.aux_type_dtype)
+
+    def _column(self, value, dtype):
+        '''
+        Broadcast a scalar or array-like value to a column of the same length
+        as ``self.words``
+
+        '''
+        if value is None:
+            return np.zeros(self.words.shape, dtype=dtype)
+        column = np.asarray(value, dtype=dtype)
+        if column.ndim == 0:
+            return np.full(self.words.shape, column, dtype=dtype)
+        if column.shape != self.words.shape:
+            raise ValueError('column length mismatch: expected {}, got {}'.format(
+                len(self.words), len(column)))
+        return column
+
+    def __len__(self):
+        return len(self.words)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._packet(i)
+
+    def __getitem__(self, key):
+        '''
+        If ``key`` is an integer, return a ``Packet_v2`` (or
+        ``TimestampPacket``, ``SyncPacket``, ``TriggerPacket``) object, otherwise
+        return a new ``PacketArray`` with the selected packets (``key`` can
+        be a slice, an index array, or a boolean mask).
+
+        '''
+        if isinstance(key, (int, np.integer)):
+            if key < 0:
+                key += len(self)
+            if key < 0 or key >= len(self):
+                raise IndexError('PacketArray index out of range')
+            return self._packet(key)
+        return self._subset(key)
+
+    def __eq__(self, other):
+        if not isinstance(other, PacketArray):
+            return NotImplemented
+        return (np.array_equal(self.words, other.words)
+            and np.array_equal(self.io_group, other.io_group)
+            and np.array_equal(self.io_channel, other.io_channel)
+            and np.array_equal(self.aux_type, other.aux_type))
+
+    def __ne__(self, other):
+        return not (self == other)
+
+    def __repr__(self):
+        return '<{} with {} packets>'.format(self.__class__.__name__, len(self))
+
+    def __str__(self):
+        if len(self) < 20:
+            return '\n'.join(str(packet) for packet in self)
+        beginning = '\n'.join(str(self[i]) for i in range(10))
+        middle = '\n'.join(['   .', '   . omitted %d packets' %
+            (len(self)-20), '   .'])
+        end = '\n'.join(str(self[i]) for i in range(len(self)-10, len(self)))
+        return '\n'.join([beginning, middle, end])
+
+    def _subset(self, key):
+        pa = self.__class__.__new__(self.__class__)
+        for name in self._columns():
+            setattr(pa, name, np.atleast_1d(getattr(self, name)[key]))
+        if 'fifo_diagnostics_enabled' in self.__dict__:
+            pa.fifo_diagnostics_enabled = self.fifo_diagnostics_enabled
+        return pa
+
+    def _columns(self):
+        return ('words', 'io_group', 'io_channel', 'receipt_timestamp', 'aux_type')
+
+    def _packet(self, index):
+        if self.aux_type[index]:
+            return _decode_aux_packet(int(self.aux_type[index]),
+                int(self.words[index]), int(self.io_group[index]))
+        p = Packet_v2(self.words[index:index+1].astype('<u8').tobytes())
+        p.io_group = int(self.io_group[index])
+        p.io_channel = int(self.io_channel[index])
+        p.receipt_timestamp = int(self.receipt_timestamp[index])
+        if self.fifo_diagnostics_enabled:
+            p.fifo_diagnostics_enabled = True
+        return p
+
+    def to_packets(self):
+        '''
+        Convert to a ``list`` of ``Packet_v2`` (and ``TimestampPacket``,
+        ``SyncPacket``, or ``TriggerPacket``) objects
+
+        '''
+        return list(self)
+
+    @classmethod
+    def from_packets(cls, packets):
+        '''
+        Create a new ``PacketArray`` from an iterable of ``Packet_v2`` (and
+        ``TimestampPacket``, ``SyncPacket``, or ``TriggerPacket``) objects
+
+        '''
+        packets = list(packets)
+        words = np.zeros((len(packets),), dtype=cls.words_dtype)
+        aux_type = np.zeros((len(packets),), dtype=cls.aux_type_dtype)
+        for i, p in enumerate(packets):
+            if isinstance(p, (Packet_v2, CompactPacket_v2)):
+                words[i] = p.as_int()
+            else:
+                words[i] = _encode_aux_packet(p)
+                aux_type[i] = p.packet_type
+        return cls(
+            words,
+            io_group=[getattr(p, 'io_group', None) or 0 for p in packets],
+            io_channel=[getattr(p, 'io_channel', None) or 0 for p in packets],
+            receipt_timestamp=[getattr(p, 'receipt_timestamp', 0) for p in packets],
+            aux_type=aux_type
+            )
+
+    @classmethod
+    def concatenate(cls, packet_arrays):
+        '''
+        Join a sequence of ``PacketArray`` objects into a single ``PacketArray``
+
+        '''
+        packet_arrays = list(packet_arrays)
+        pa = cls()
+        for name in pa._columns():
+            if packet_arrays:
+                setattr(pa, name, np.concatenate([getattr(other, name) for other in packet_arrays]))
+        return pa
+
+    def unique(self, return_index=False):
+        '''
+        Remove duplicate packets, keeping the first occurrence of each. Two
+        packets are duplicates if they have the same packet word,
+        ``io_group``, ``io_channel``, and ``aux_type``. See ``dedupe``.
+
+        :param return_index: if ``True``, also return the indices of the kept packets (optional, default: ``False``)
+
+        :returns: new ``PacketArray`` with the unique packets in their original order (and a ``numpy`` array of their indices if ``return_index`` is ``True``)
+
+        '''
+        routing = (self.aux_type.astype(np.uint32) << np.uint32(16)) \
+            | (self.io_group.astype(np.uint32) << np.uint32(8)) \
+            | self.io_channel.astype(np.uint32)
+        order = np.lexsort((routing, self.words))
+        first = np.ones(order.shape, dtype=bool)
+        first[1:] = (self.words[order[1:]] != self.words[order[:-1]]) \
+            | (routing[order[1:]] != routing[order[:-1]])
+        index = np.sort(order[first])
+        if return_index:
+            return self[index], index
+        return self[index]
+
+    @classmethod
+    def from_fields(cls, io_group=None, io_channel=None, receipt_timestamp=None,
+            assign_parity=True, **fields):
+        '''
+        Create a new ``PacketArray`` from arrays of packet field values, e.g.::
+
+            PacketArray.from_fields(
+                packet_type=Packet_v2.CONFIG_WRITE_PACKET,
+                chip_id=12,
+                register_address=np.arange(10),
+                register_data=data,
+                io_group=1,
+                io_channel=1
+                )
+
+        All values are broadcast to a common length, so scalars can be used
+        for fields that are the same for every packet. Unspecified fields are
+        set to ``0``.
+
+        :param io_group: optional, array-like or scalar ``io_group`` of each packet
+
+        :param io_channel: optional, array-like or scalar ``io_channel`` of each packet
+
+        :param receipt_timestamp: optional, array-like or scalar ``receipt_timestamp`` of each packet
+
+        :param assign_parity: if ``True`` (and ``parity`` is not specified), set the parity bit of each packet to the correct value
+
+        :param fields: array-like or scalar value of each packet field, e.g. ``chip_id=...``
+
+        :returns: ``PacketArray``
+
+        '''
+        for name in fields:
+            if name not in cls.fields:
+                raise ValueError('invalid packet field {}'.format(name))
+        columns = dict(io_group=io_group, io_channel=io_channel, receipt_timestamp=receipt_timestamp)
+        columns.update(fields)
+        values = [np.asarray(value) for value in columns.values() if value is not None]
+        shape = np.broadcast(*values).shape if values else tuple()
+        if shape == tuple():
+            shape = (1,)
+        pa = cls(
+            np.zeros(shape, dtype=cls.words_dtype),
+            **dict((name, value if value is None else np.broadcast_to(value, shape))
+                for name, value in columns.items() if name not in fields)
+            )
+        for name, value in fields.items():
+            setattr(pa, name, np.broadcast_to(value, shape))
+        if assign_parity and 'parity' not in fields:
+            pa.assign_parity()
+        return pa
+
+    def to_bytes_array(self):
+        '''
+        Convert to the little-endian bytes of each packet, as they are sent
+        out (see ``Packet_v2.bytes``). Only meaningful for LArPix packets. Use ``to_bytes_array().tobytes()`` to
+        get a single bytestring of all of the packets.
+
+        :returns: ``numpy`` array of ``uint8`` with shape ``(len(self), 8)``
+
+        '''
+        return self.words.astype('<u8').view(np.uint8).reshape(-1, Packet_v2.num_bytes)
+
+    def _field_bits(self, name):
+        if name == 'timestamp' and self.fifo_diagnostics_enabled:
+            return Packet_v2.fifo_diagnostics_timestamp_bits
+        return getattr(Packet_v2, name + '_bits')
+
+    def _aux_values(self, name, values):
+        '''
+        Replace the field values of the timestamp, sync, and trigger packets
+
+        '''
+        aux = self.aux_type != 0
+        if not np.any(aux):
+            return values
+        values = values.copy()
+        words = self.words[aux]
+        aux_type = self.aux_type[aux]
+        if name == 'packet_type':
+            values[aux] = aux_type
+        elif name == 'timestamp':
+            values[aux] = np.where(aux_type == _timestamp_packet_type,
+                words & np.uint64(_aux_timestamp_mask),
+                words & np.uint64(_aux_short_timestamp_mask))
+        elif name == 'trigger_type':
+            values[aux] = np.where(aux_type == _timestamp_packet_type, 0,
+                (words >> np.uint64(_aux_type_shift)) & np.uint64(0xFF))
+        elif name == 'dataword':
+            values[aux] = np.where(aux_type == _sync_packet_type,
+                (words >> np.uint64(_aux_clk_source_shift)) & np.uint64(0x01), 0)
+        else:
+            values[aux] = 0
+        return values
+
+    @classmethod
+    def _basic_getter(cls, name, fifo_diagnostics_only=False):
+        def basic_getter_func(self):
+            if fifo_diagnostics_only and not self.fifo_diagnostics_enabled:
+                return None
+            bit_slice = self._field_bits(name)
+            mask = np.uint64((1 << (bit_slice.stop - bit_slice.start)) - 1)
+            return self._aux_values(name, (self.words >> np.uint64(bit_slice.start)) & mask)
+        return basic_getter_func
+
+    @classmethod
+    def _basic_setter(cls, name, fifo_diagnostics_only=False):
+        def basic_setter_func(self, value):
+            if fifo_diagnostics_only and not self.fifo_diagnostics_enabled:
+                return
+            bit_slice = self._field_bits(name)
+            mask = np.uint64((1 << (bit_slice.stop - bit_slice.start)) - 1)
+            shift = np.uint64(bit_slice.start)
+            value = np.asarray(value).astype(self.words_dtype) & mask
+            # only the LArPix packets have this field
+            self.words = np.where(self.aux_type == 0,
+                (self.words & ~(mask << shift)) | (value << shift), self.words)
+        return basic_setter_func
+
+    @property
+    def chip_key(self):
+        '''
+        ``KeyArray`` of the chip key of each packet
+
+        '''
+        return KeyArray.from_columns(self.io_group, self.io_channel, self.chip_id)
+
+    def compute_parity(self):
+        '''
+        :returns: ``numpy`` array of the correct parity bit for each packet
+
+        '''
+        return compute_parity(self.words)
+
+    def assign_parity(self):
+        '''
+        Set the parity bit of each LArPix packet to the correct value
+
+        '''
+        shift = np.uint64(Packet_v2.parity_bits.start)
+        parity_words = (self.words & ~(np.uint64(1) << shift)) \
+            | (self.compute_parity().astype(self.words_dtype) << shift)
+        self.words = np.where(self.aux_type == 0, parity_words, self.words)
+
+    def has_valid_parity(self):
+        '''
+        :returns: boolean ``numpy`` array, ``True`` where the packet has valid parity (or is not a LArPix packet)
+
+        '''
+        return has_valid_parity(self.words) | (self.aux_type != 0)
+
+    @property
+    def local_fifo_half(self):
+        return self.local_fifo % 2
+
+    @property
+    def local_fifo_full(self):
+        return self.local_fifo // 2
+
+    @property
+    def shared_fifo_half(self):
+        return self.shared_fifo % 2
+
+    @property
+    def shared_fifo_full(self):
+        return self.shared_fifo // 2
+
+for _name in PacketArray.fields:
+    _fifo_diagnostics_only = _name in ('local_fifo_events', 'shared_fifo_events')
+    setattr(PacketArray, _name, property(PacketArray._basic_getter(_name, _fifo_diagnostics_only), PacketArray._basic_setter(_name, _fifo_diagnostics_only)))
+del _name, _fifo_diagnostics_only
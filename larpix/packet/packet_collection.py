@@ -1,9 +1,84 @@
 from bitarray import bitarray
 import struct
+import numpy as np
 
 from .. import bitarrayhelper as bah
-from ..key import Key
+from ..key import Key, KeyArray
 from . import Packet
+from .packet_array import PacketArray
+
+#: Fields of a columnar ``PacketCollection`` that are also defined for
+#: timestamp, sync, and trigger packets
+_aux_fields = ('packet_type', 'timestamp', 'io_group')
+
+def _as_key(value):
+    '''
+    Convert a chip key selection (``Key``, keystring, or tuple) to a ``Key``,
+    leaving values that are not valid keys unchanged
+
+    '''
+    try:
+        if isinstance(value, tuple):
+            return Key(*value)
+        return Key(value)
+    except (TypeError, ValueError):
+        return value
+
+class _PacketList(list):
+    '''
+    A ``list`` of packets that counts the modifications made to it, so that
+    the field indexes of a ``PacketCollection`` can be rebuilt
+
+    '''
+    version = 0
+
+    def __setitem__(self, key, value):
+        self.version += 1
+        super(_PacketList, self).__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self.version += 1
+        super(_PacketList, self).__delitem__(key)
+
+    def __iadd__(self, other):
+        self.version += 1
+        return super(_PacketList, self).__iadd__(other)
+
+    def __imul__(self, n):
+        self.version += 1
+        return super(_PacketList, self).__imul__(n)
+
+    def append(self, packet):
+        self.version += 1
+        super(_PacketList, self).append(packet)
+
+    def extend(self, packets):
+        self.version += 1
+        super(_PacketList, self).extend(packets)
+
+    def insert(self, index, packet):
+        self.version += 1
+        super(_PacketList, self).insert(index, packet)
+
+    def pop(self, *args):
+        self.version += 1
+        return super(_PacketList, self).pop(*args)
+
+    def remove(self, packet):
+        self.version += 1
+        super(_PacketList, self).remove(packet)
+
+    def clear(self):
+        self.version += 1
+        super(_PacketList, self).clear()
+
+    def sort(self, *args, **kwargs):
+        self.version += 1
+        super(_PacketList, self).sort(*args, **kwargs)
+
+    def reverse(self):
+        self.version += 1
+        super(_PacketList, self).reverse()
 
 class PacketCollection(object):
     '''
@@ -30,8 +105,28 @@ class PacketCollection(object):
         >>> type(bits_format_first_10[0])
         str
 
+    The packets can either be stored as a ``list`` of packet objects or as
+    a ``PacketArray`` (a "columnar" collection, see ``to_columnar()``). In
+    a columnar collection, the selections in ``extract``, ``with_chip_key``,
+    ``by_chip_key``, and ``by_chipid`` are performed with ``numpy`` boolean
+    masks, and ``extract(..., as_array=True)`` returns ``numpy`` arrays.
+
+    For a ``list`` of packets, an index of the packets with each value of a
+    field (e.g. ``{<chip key>: [<row>, ...]}``) is built the first time the
+    field is used in a selection and is reused for subsequent selections
+    (see ``index()``). Indexes are only used for the low-cardinality fields
+    listed in ``PacketCollection.indexed_fields``, other selections scan
+    the packets. The indexes assume that the packets are not modified after
+    they are built, so a ``list`` of packets is stored as a ``list``
+    subclass that rebuilds the indexes when it is modified. Call
+    ``clear_indexes()`` if any of the packets themselves are modified.
 
     '''
+    #: Fields that are indexed when used in a selection
+    indexed_fields = ('chip_key', 'chip_id', 'io_group', 'io_channel',
+        'packet_type', 'channel_id', 'register_address', 'trigger_type',
+        'downstream_marker')
+
     def __init__(self, packets, bytestream=None, message='',
             read_id=None, skipped=None):
         self.packets = packets
@@ -41,6 +136,139 @@ class PacketCollection(object):
         self.read_id = read_id
         self.parent = None
 
+    @property
+    def packets(self):
+        return self._packets
+
+    @packets.setter
+    def packets(self, value):
+        if isinstance(value, list) and not isinstance(value, _PacketList):
+            value = _PacketList(value)
+        self._packets = value
+        self.clear_indexes()
+
+    def _packets_version(self):
+        return (len(self.packets), getattr(self.packets, 'version', None))
+
+    @property
+    def columnar(self):
+        '''
+        ``True`` if the packets are stored in a ``PacketArray``
+
+        '''
+        return isinstance(self.packets, PacketArray)
+
+    def to_columnar(self):
+        '''
+        Return a new ``PacketCollection`` with the same packets stored in a
+        ``PacketArray``. Only ``Packet_v2`` (and timestamp, sync, and trigger)
+        packets can be stored in a ``PacketArray``.
+
+        '''
+        packets = self.packets
+        if not self.columnar:
+            packets = PacketArray.from_packets(packets)
+        new_collection = PacketCollection(packets, bytestream=self.bytestream,
+            message=self.message, read_id=self.read_id, skipped=self.skipped)
+        new_collection.parent = self.parent
+        return new_collection
+
+    def clear_indexes(self):
+        '''
+        Remove the cached field indexes
+
+        '''
+        self._indexes = dict()
+        self._indexes_version = None
+
+    def index(self, field):
+        '''
+        Return an index of the packets with each value of ``field``::
+
+            >>> collection.index('chip_key')
+            {Key('1-1-12'): array([0, 5, ...]), ...}
+
+        Packets without ``field`` are not included. The index is built on
+        the first call and cached.
+
+        :returns: ``dict`` of ``{<value>: <numpy array of row indices>}`` or ``None`` if the field values are not hashable
+
+        '''
+        if self._indexes_version != self._packets_version():
+            self._indexes = dict()
+            self._indexes_version = self._packets_version()
+        if field not in self._indexes:
+            if self.columnar:
+                self._indexes[field] = self._build_columnar_index(field)
+            else:
+                self._indexes[field] = self._build_index(field)
+        return self._indexes[field]
+
+    def _build_index(self, field):
+        index = dict()
+        try:
+            for i, packet in enumerate(self.packets):
+                try:
+                    value = getattr(packet, field)
+                except AttributeError:
+                    continue
+                index.setdefault(value, []).append(i)
+        except TypeError:
+            # unhashable value
+            return None
+        return dict((value, np.array(rows, dtype=int)) for value, rows in index.items())
+
+    def _build_columnar_index(self, field):
+        rows = self._columnar_rows(field)
+        if field == 'chip_key':
+            groups = self.packets.chip_key[rows].group()
+            return dict((key, rows[group]) for key, group in groups.items())
+        values = getattr(self.packets, field)[rows]
+        unique_values, inverse = np.unique(values, return_inverse=True)
+        order = np.argsort(inverse, kind='stable')
+        starts = np.searchsorted(inverse[order], np.arange(len(unique_values)))
+        return dict((value.item(), rows[group]) for value, group in
+            zip(unique_values, np.split(order, starts[1:])))
+
+    def _columnar_rows(self, *fields):
+        '''
+        Indices of the rows of a columnar collection that have all of the
+        fields (LArPix packet fields are not defined for timestamp, sync,
+        and trigger packets)
+
+        '''
+        if all(field in _aux_fields for field in fields):
+            return np.arange(len(self.packets))
+        return np.flatnonzero(self.packets.aux_type == 0)
+
+    def _selected_rows(self, selection):
+        '''
+        Find the rows of a list-backed collection that may match the
+        selection using the field indexes
+
+        :returns: tuple of (``numpy`` array of candidate rows or ``None`` for all rows, ``dict`` of the selection that still needs to be checked)
+
+        '''
+        rows = None
+        remaining = dict()
+        for field, value in selection.items():
+            if field not in self.indexed_fields:
+                remaining[field] = value
+                continue
+            if field == 'chip_key':
+                value = _as_key(value)
+            index = self.index(field)
+            try:
+                if index is None:
+                    raise TypeError
+                field_rows = index.get(value, np.zeros((0,), dtype=int))
+            except TypeError:
+                # unhashable index or value
+                remaining[field] = value
+                continue
+            rows = field_rows if rows is None else np.intersect1d(rows, field_rows)
+        return rows, remaining
+
     def __eq__(self, other):
         '''
         Return True if the packets, message and bytestream compare equal.
@@ -89,7 +317,10 @@ class PacketCollection(object):
 
         '''
         if isinstance(key, slice):
-            items = PacketCollection([p for p in self.packets[key]])
+            if self.columnar:
+                items = PacketCollection(self.packets[key])
+            else:
+                items = PacketCollection([p for p in self.packets[key]])
             items.message = '%s | subset %s' % (self.message, key)
             items.parent = self
             items.read_id = self.read_id
@@ -147,7 +378,7 @@ class PacketCollection(object):
             packet.bits = bitarray(bits)
             self.packets.append(packet)
 
-    def extract(self, *attrs, **selection):
+    def extract(self, *attrs, as_array=False, **selection):
         '''
         Extract the given attribute(s) from packets specified by selection
         and return a list.
@@ -164,22 +395,64 @@ class PacketCollection(object):
         >>> threshold = collection.extract('register_value', register_address=32, packet_type=3, chip_id=5)[-1]
         >>> # Return multiple attributes
         >>> chip_keys, channel_ids = zip(*collection.extract('chip_key','channel_id'))
+        >>> # Return a numpy array of adc counts
+        >>> dataword = collection.extract('dataword', packet_type=0, as_array=True)
+
+        If ``as_array`` is ``True``, a ``numpy`` array is returned for each
+        attribute rather than a list of values (or list of lists of values
+        for multiple attributes), e.g.::
+
+        >>> timestamps, datawords = collection.extract('timestamp', 'dataword', as_array=True)
+
+        In a columnar collection, ``chip_key`` is returned as a ``KeyArray``
+        when ``as_array`` is ``True``, and timestamp, sync, and trigger
+        packets are only selected if all of the attributes and selections
+        are ``packet_type``, ``timestamp``, or ``io_group``.
 
         .. note:: selecting on ``timestamp`` will also select
             TimestampPacket values.
         '''
+        if self.columnar:
+            return self._extract_columnar(attrs, selection, as_array)
+        rows, remaining = self._selected_rows(selection)
+        packets = self.packets if rows is None else [self.packets[row] for row in rows]
         values = []
-        for p in self.packets:
+        for p in packets:
             try:
-                if all(getattr(p,key) == value for key, value in selection.items()):
+                if all(getattr(p,key) == value for key, value in remaining.items()):
                     if len(attrs) > 1:
                         values.append([getattr(p,attr) for attr in attrs])
                     else:
                         values.append(getattr(p,attrs[0]))
             except AttributeError:
                 continue
+        if as_array:
+            if len(attrs) > 1:
+                return tuple(np.array([value[i] for value in values]) for i in range(len(attrs)))
+            return np.array(values)
         return values
 
+    def _extract_columnar(self, attrs, selection, as_array):
+        rows = self._columnar_rows(*(tuple(attrs) + tuple(selection.keys())))
+        mask = np.ones(rows.shape, dtype=bool)
+        for field, value in selection.items():
+            if field == 'chip_key':
+                mask &= self.packets.chip_key[rows] == value
+            else:
+                mask &= getattr(self.packets, field)[rows] == value
+        rows = rows[mask]
+        columns = [self.packets.chip_key[rows] if attr == 'chip_key'
+            else getattr(self.packets, attr)[rows] for attr in attrs]
+        if as_array:
+            if len(attrs) > 1:
+                return tuple(columns)
+            return columns[0]
+        columns = [column.to_keys() if isinstance(column, KeyArray)
+            else column.tolist() for column in columns]
+        if len(attrs) > 1:
+            return [list(row) for row in zip(*columns)]
+        return columns[0]
+
     def origin(self):
         '''
         Return the original PacketCollection that this PacketCollection
@@ -206,26 +479,18 @@ class PacketCollection(object):
         Return packets with the specified chip key.
 
         '''
-        return [packet for packet in self.packets \
-            if packet.chip_key == chip_key]
+        rows = self.index('chip_key').get(_as_key(chip_key), tuple())
+        return [self.packets[int(row)] for row in rows]
 
     def by_chip_key(self):
         '''
         Return a dict of { chip_key: PacketCollection }.
 
         '''
-        chip_groups = {}
-        for packet in self.packets:
-            # append packet to list if list exists, else append to empty
-            # list as a default
-            key = packet.chip_key
-            chip_groups.setdefault(key, []).append(packet)
         to_return = {}
-        for chip_key in chip_groups:
-            new_collection = PacketCollection(chip_groups[chip_key])
+        for chip_key, rows in self._sorted_index('chip_key'):
+            new_collection = self._subcollection(rows)
             new_collection.message = self.message + ' | chip {}'.format(chip_key)
-            new_collection.read_id = self.read_id
-            new_collection.parent = self
             to_return[chip_key] = new_collection
         return to_return
 
@@ -241,16 +506,26 @@ class PacketCollection(object):
         Return a dict of { chipid: PacketCollection }.
 
         '''
-        chip_groups = {}
-        for packet in self.packets:
-            # append packet to list if list exists, else append to empty
-            # list as a default
-            chip_groups.setdefault(packet.chip_id, []).append(packet)
         to_return = {}
-        for chipid in chip_groups:
-            new_collection = PacketCollection(chip_groups[chipid])
+        for chipid, rows in self._sorted_index('chip_id'):
+            new_collection = self._subcollection(rows)
             new_collection.message = self.message + ' | chip %s' % chipid
-            new_collection.read_id = self.read_id
-            new_collection.parent = self
             to_return[chipid] = new_collection
         return to_return
+
+    def _sorted_index(self, field):
+        '''
+        Return the items of the index of ``field``, ordered by the first
+        packet with each value
+
+        '''
+        return sorted(self.index(field).items(), key=lambda item: item[1][0])
+
+    def _subcollection(self, rows):
+        if self.columnar:
+            new_collection = PacketCollection(self.packets[rows])
+        else:
+            new_collection = PacketCollection([self.packets[row] for row in rows])
+        new_collection.read_id = self.read_id
+        new_collection.parent = self
+        return new_collection
@@ -49,6 +49,12 @@ class Packet_v2(object):
     for a single packet. Just remember that if you modify ``packet.fifo_diagnostics_enabled``,
     it will no longer use the default.
 
+    Packets are hashable so that they can be used in sets or as dict keys.
+    Like ``==``, the hash only depends on the packet bits (not on the
+    ``io_group`` or ``io_channel``), so don't modify packets that are stored
+    in a set. Use ``larpix.packet.dedupe`` to remove duplicate packets
+    taking into account the routing information.
+
     '''
 
     asic_version = 2
@@ -112,6 +118,9 @@ class Packet_v2(object):
     def __ne__(self, other):
         return not (self == other)
 
+    def __hash__(self):
+        return hash(self.as_int())
+
     def __str__(self):
         strings = []
         if hasattr(self, 'direction'):
@@ -245,6 +254,29 @@ class Packet_v2(object):
             else:
                 setattr(self, key, value)
 
+    @staticmethod
+    def from_arrays(**kwargs):
+        '''
+        Create many packets at once from arrays of packet field values, e.g.::
+
+            Packet_v2.from_arrays(
+                packet_type=Packet_v2.CONFIG_WRITE_PACKET,
+                chip_id=chip_ids,
+                register_address=addresses,
+                register_data=data,
+                io_group=1,
+                io_channel=io_channels
+                )
+
+        The parity bit of each packet is filled automatically. See
+        ``PacketArray.from_fields`` for the accepted arguments.
+
+        :returns: ``PacketArray``
+
+        '''
+        from .packet_array import PacketArray
+        return PacketArray.from_fields(**kwargs)
+
     def as_int(self):
         if self._int is None:
             self._int = bah.touint(self.bits, endian=self.endian)
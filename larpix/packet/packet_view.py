@@ -0,0 +1,90 @@
+import struct
+
+from .compact_packet_v2 import CompactPacket_v2
+
+__all__ = ['PacketView']
+
+_word_struct = struct.Struct('<Q')
+
+class PacketView(CompactPacket_v2):
+    '''
+    A read-on-demand view of a 64 bit LArPix v2 UART data packet within a
+    larger buffer (e.g. a received PACMAN message).
+
+    ``PacketView`` objects have the same interface as ``CompactPacket_v2``
+    objects, but rather than copying the packet bytes out of the buffer, each
+    view only keeps a reference to a ``memoryview`` of the buffer and the
+    offset of the packet within it. Each field is decoded from the buffer
+    when it is accessed::
+
+        msg_view = memoryview(msg)
+        p = PacketView(msg_view, offset=16)
+        p.chip_id # decoded from msg[16:24]
+
+    Many views can share the same ``memoryview``. The packet word is only
+    copied out of the buffer when the packet is modified (or when
+    ``detach()`` is called), after which the view no longer references the
+    buffer. The buffer should therefore not be modified while any views
+    of it are still in use.
+
+    :param buffer: optional, object supporting the buffer protocol (e.g. ``bytes`` or ``memoryview``) that contains the packet. If ``None``, create a packet of zeros that does not reference any buffer.
+
+    :param offset: optional, byte offset of the packet within ``buffer``
+
+    '''
+    __slots__ = ('_buffer', '_offset', '_own_word')
+
+    def __init__(self, buffer=None, offset=0):
+        self._io_group = None
+        self._io_channel = None
+        self._chip_key = None
+        self._fifo_diagnostics_enabled = None
+        self._offset = offset
+        if buffer is None:
+            self._buffer = None
+            self._own_word = 0
+            return
+        if not isinstance(buffer, memoryview):
+            buffer = memoryview(buffer)
+        if len(buffer) < offset + self.num_bytes:
+            raise ValueError('Invalid number of bytes: %s' %
+                    (len(buffer) - offset))
+        self._buffer = buffer
+
+    def __repr__(self):
+        return 'PacketView(' + str(self.bytes()) + ')'
+
+    def __reduce__(self):
+        state = dict()
+        for name in CompactPacket_v2.__slots__:
+            if name != '_word' and hasattr(self, name):
+                state[name] = getattr(self, name)
+        return (PacketView, (self.bytes(),), (None, state))
+
+    @property
+    def _word(self):
+        if self._buffer is None:
+            return self._own_word
+        return _word_struct.unpack_from(self._buffer, self._offset)[0]
+
+    @_word.setter
+    def _word(self, value):
+        self._own_word = value
+        self._buffer = None
+        self._offset = 0
+
+    @property
+    def is_view(self):
+        '''
+        ``True`` if the packet is still read from the underlying buffer
+
+        '''
+        return self._buffer is not None
+
+    def detach(self):
+        '''
+        Copy the packet word out of the underlying buffer and release the
+        reference to the buffer
+
+        '''
+        self._word = self._word
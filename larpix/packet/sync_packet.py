@@ -19,6 +19,8 @@ class SyncPacket(object):
     :param io_group: optional, an 8-bit io_group id
 
     '''
+    __slots__ = ('sync_type', 'clk_source', 'timestamp', 'io_group', 'direction')
+
     packet_type = 6
     
     pretty_sync_type = defaultdict(lambda:'OTHER')
@@ -20,10 +20,12 @@ class TimestampPacket(object):
         obtainable from calling the ``bytes`` method.
 
     '''
+    __slots__ = ('packet_type', 'timestamp', 'io_group', 'direction', 'chip_key')
+
     size = 56
-    chip_key = None
     def __init__(self, timestamp=None, code=None):
         self.packet_type = 4
+        self.chip_key = None
         if code:
             self.timestamp = struct.unpack('<Q', code + b'\x00')[0]
         else:
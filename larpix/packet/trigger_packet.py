@@ -16,6 +16,8 @@ class TriggerPacket(object):
     :param io_group: optional, an 8-bit io_group id
 
     '''
+    __slots__ = ('trigger_type', 'timestamp', 'io_group', 'direction')
+
     packet_type = 7
     
     def __init__(self, trigger_type=None, timestamp=None, io_group=None):
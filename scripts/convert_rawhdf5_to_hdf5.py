@@ -1,32 +1,115 @@
 import argparse
 import time
+import os
+import collections
+import multiprocessing
+from multiprocessing import shared_memory, resource_tracker
+
+import h5py
+import numpy as np
 
-import larpix
-import larpix.format.rawhdf5format
-import larpix.format.pacman_msg_format
-import larpix.format.hdf5format
 from larpix.format.rawhdf5format import from_rawfile, len_rawfile
-from larpix.format.pacman_msg_format import parse
-from larpix.format.hdf5format import to_file
+from larpix.format.pacman_msg_format import parse_to_array, HEADER_LEN, WORD_LEN
+from larpix.format.hdf5format import HDF5Writer, dtypes, latest_version, _encode_packet_array
+
+def _convert_block(input_filename, start, end, version):
+    '''
+    Parse a block of messages from the raw file and encode them as rows of
+    the packets dataset
+
+    '''
+    rd = from_rawfile(input_filename, start=start, end=end, copy=False)
+    packets = parse_to_array(rd['msgs'], rd['msg_headers']['io_groups'])
+    return _encode_packet_array(packets, version)
+
+def _convert_block_to_shm(input_filename, start, end, version):
+    '''
+    Worker process target, converts a block of messages and returns the
+    encoded rows through a shared memory segment. The segment is unlinked by
+    the writer process once the rows have been written.
+
+    :returns: tuple of shared memory segment name and number of rows
+
+    '''
+    rows = _convert_block(input_filename, start, end, version)
+    shm = shared_memory.SharedMemory(create=True, size=max(rows.nbytes, 1))
+    np.ndarray(rows.shape, dtype=rows.dtype, buffer=shm.buf)[:] = rows
+    shm.close()
+    return shm.name, len(rows)
+
+def _read_shm(name, n_rows, version):
+    '''
+    Copy the rows out of a shared memory segment and unlink it
 
-def main(input_filename, output_filename, block_size):
+    '''
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        return np.ndarray((n_rows,), dtype=dtypes[version]['packets'], buffer=shm.buf).copy()
+    finally:
+        shm.close()
+        shm.unlink()
+
+def _max_packets(input_filename, total_messages):
+    '''
+    Upper bound on the number of packets in the raw file (one per message
+    header and one per message word), used to preallocate the output file.
+    Returns ``None`` if this cannot be found without reading the messages.
+
+    '''
+    with h5py.File(input_filename, 'r', swmr=True, libver='latest') as f:
+        if 'msg_offsets' not in f:
+            return None
+        total_bytes = f['msgs'].shape[0]
+    return total_messages + max(total_bytes - HEADER_LEN * total_messages, 0) // WORD_LEN
+
+def main(input_filename, output_filename, block_size, workers=None):
     total_messages = len_rawfile(input_filename)
-    total_blocks = total_messages // block_size + 1
+    blocks = [(start, min(start + block_size, total_messages))
+        for start in range(0, total_messages, block_size)]
+    total_blocks = len(blocks)
+    workers = os.cpu_count() if workers is None else workers
+    workers = max(min(workers, total_blocks), 1)
+    version = latest_version
     last = time.time()
-    for i_block in range(total_blocks):
-        start = i_block * block_size
-        end = min(start + block_size, total_messages)
-        if start == end: return
-
-        if time.time() > last + 1:
-            print('reading block {} of {}...\r'.format(i_block+1,total_blocks),end='')
-            last = time.time()
-        rd = from_rawfile(input_filename, start=start, end=end)
-        pkts = list()
-        for i_msg,data in enumerate(zip(rd['msg_headers']['io_groups'], rd['msgs'])):
-            io_group,msg = data
-            pkts.extend(parse(msg, io_group=io_group))
-        to_file(output_filename, packet_list=pkts)
+
+    with HDF5Writer(output_filename, version=version) as writer:
+        max_packets = _max_packets(input_filename, total_messages)
+        if max_packets is not None:
+            writer.reserve(max_packets)
+
+        if workers == 1:
+            for i_block, (start, end) in enumerate(blocks):
+                if time.time() > last + 1:
+                    print('reading block {} of {}...\r'.format(i_block+1,total_blocks),end='')
+                    last = time.time()
+                writer.append(_convert_block(input_filename, start, end, version))
+            print()
+            return
+
+        # make sure the worker processes share the parent's resource tracker,
+        # so the shared memory segments are only cleaned up by the writer
+        resource_tracker.ensure_running()
+        pending = collections.deque()
+        with multiprocessing.Pool(workers) as pool:
+            try:
+                for i_block, (start, end) in enumerate(blocks):
+                    pending.append(pool.apply_async(_convert_block_to_shm,
+                        (input_filename, start, end, version)))
+                    # keep a bounded number of blocks in flight, and write
+                    # them in order
+                    while len(pending) > 2 * workers or (i_block == total_blocks - 1 and pending):
+                        writer.append(_read_shm(*pending.popleft().get(), version))
+                        if time.time() > last + 1:
+                            print('writing block {} of {}...\r'.format(i_block+1-len(pending),total_blocks),end='')
+                            last = time.time()
+            finally:
+                # clean up any blocks that were converted but not written
+                for result in pending:
+                    try:
+                        name, _ = result.get()
+                        shared_memory.SharedMemory(name=name).unlink()
+                    except Exception:
+                        pass
     print()
 
 if __name__ == '__main__':
@@ -34,6 +117,7 @@ if __name__ == '__main__':
     parser.add_argument('--input_filename', '-i', type=str, help='''Input hdf5 file, formatted with larpix.format.rawhdf5format using the larpix.io.PACMAN_IO class''')
     parser.add_argument('--output_filename', '-o', type=str, help='''Output hdf5 file,
         to be formatted with larpix.format.hdf5format''')
-    parser.add_argument('--block_size', default=10240, type=int, help='''Max number of messages to store in working memory (default=%(default)s)''')
+    parser.add_argument('--block_size', default=10240, type=int, help='''Max number of messages to convert in each worker at a time (default=%(default)s)''')
+    parser.add_argument('--workers', '-j', default=None, type=int, help='''Number of worker processes to parse messages with (default=number of cpus)''')
     args = parser.parse_args()
-    c = main(**vars(args))
+    main(**vars(args))
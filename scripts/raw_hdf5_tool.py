@@ -20,8 +20,11 @@ To split a single larpix raw-formatted hdf5 file into many::
 
 '''
 import h5py
+import numpy as np
 import warnings
 import os
+
+from larpix.format.rawhdf5format import from_rawfile, len_rawfile, RawFileWriter
 try:
     from tqdm import tqdm
     _has_tqdm = True
@@ -32,85 +35,98 @@ except Exception as e:
 _default_max_length = -1
 _default_block_size = 102400
 
+def _open_writer(input_file, output_filename):
+    '''
+    Open a ``RawFileWriter`` with the same version as an open input file
+
+    '''
+    meta = input_file['meta'].attrs
+    return RawFileWriter(output_filename, version=meta['version'],
+        io_version=meta.get('io_version', None))
+
+def _copy_messages(input_file, writer, start, end):
+    '''
+    Copy messages ``start`` to ``end`` of an open input file to a
+    ``RawFileWriter``. For v0.1 files, the message bytes are copied as a
+    single block.
+
+    '''
+    if input_file['meta'].attrs['version'] == '0.0':
+        rd = from_rawfile(input_file.filename, start=start, end=end)
+        writer.append(rd['msgs'], msg_headers=rd['msg_headers'])
+        return
+    msg_ends = input_file['msg_offsets'][start:end]
+    if not len(msg_ends):
+        return
+    byte_start = int(input_file['msg_offsets'][start-1]) if start > 0 else 0
+    msg_bytes = input_file['msgs'][byte_start:int(msg_ends[-1])]
+    msg_headers = input_file['msg_headers'][start:end]
+    writer.append_bytes(msg_bytes, msg_ends - np.uint64(byte_start),
+        msg_headers=dict((name, msg_headers[name]) for name in msg_headers.dtype.names))
+
+def _copy_metadata(input_filename, output_filename):
+    with h5py.File(input_filename, 'r', libver='latest', swmr=True) as fi:
+        with h5py.File(output_filename, 'a', libver='latest') as fo:
+            for attr,value in fi['meta'].attrs.items():
+                fo['meta'].attrs[attr] = value
+
+def _blocks(length, block_size):
+    blocks = range(0, length, block_size)
+    return tqdm(blocks) if _has_tqdm else blocks
+
 def merge_files(input_filenames, output_filename, block_size):
-    with h5py.File(output_filename, 'w', libver='latest') as fo:
-        curr_idx = 0
-        prev_idx = 0
+    if os.path.exists(output_filename):
+        os.remove(output_filename)
+    writer = None
+    try:
         for i,input_filename in enumerate(input_filenames):
             print(input_filename, '{}/{}'.format(i+1, len(input_filenames)))
+            length = len_rawfile(input_filename)
             with h5py.File(input_filename, 'r', libver='latest', swmr=True) as fi:
-                if i == 0:
-                    # create datasets and groups
-                    fo.create_group('meta')
-                    fo.create_dataset('msgs', shape=(0,), maxshape=(None,), compression='gzip', dtype=fi['msgs'].dtype)
-                    fo.create_dataset('msg_headers', shape=(0,), maxshape=(None,), compression='gzip', dtype=fi['msg_headers'].dtype)
-
-                    # copy meta data
-                    for attr,value in fi['meta'].attrs.items():
-                        fo['meta'].attrs[attr] = value
-
-                # resize datasets
-                fo['msgs'].resize((len(fo['msgs']) + len(fi['msgs']),))
-                fo['msg_headers'].resize((len(fo['msg_headers']) + len(fi['msg_headers']),))
+                if writer is None:
+                    # create file with the same version as the first file
+                    writer = _open_writer(fi, output_filename)
 
                 # copy data in chunks
-                for start in tqdm(range(0, len(fi['msgs']), block_size)) if _has_tqdm else range(0, len(fi['msgs']), block_size):
-                    end = min(start+block_size, len(fi['msgs']))
-                    prev_idx = curr_idx
-                    curr_idx += end - start
-                    fo['msgs'][prev_idx:curr_idx] = [fi['msgs'][i] for i in range(start,end)] # loop needed because h5py was giving an error
-                    fo['msg_headers'][prev_idx:curr_idx] = fi['msg_headers'][start:end]
+                for start in _blocks(length, block_size):
+                    end = min(start+block_size, length)
+                    _copy_messages(fi, writer, start, end)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    # copy meta data
+    if input_filenames:
+        _copy_metadata(input_filenames[0], output_filename)
     return
 
 def split_file(input_filename, output_directory, max_length, block_size):
-    with h5py.File(input_filename, 'r', libver='latest', swmr=True) as fi:
-        output_filename_fmt = os.path.join(output_directory, os.path.basename(input_filename)[:-2]) + '{}.h5'
-
-        i = 0
-        curr_idx, prev_idx = 0, 0
-        fo = None
-        output_filename = output_filename_fmt.format(i)
-        try:
-            for start in tqdm(range(0, len(fi['msgs']), block_size)) if _has_tqdm else range(0, len(fi['msgs']), block_size):
-                end = min(start+block_size, len(fi['msgs']))
-
-                if fo is None or (os.stat(output_filename).st_size >= max_length and max_length > 0):
+    output_filename_fmt = os.path.join(output_directory, os.path.basename(input_filename)[:-2]) + '{}.h5'
+    length = len_rawfile(input_filename)
+
+    i = 0
+    output_filenames = []
+    writer = None
+    try:
+        with h5py.File(input_filename, 'r', libver='latest', swmr=True) as fi:
+            for start in _blocks(length, block_size):
+                end = min(start+block_size, length)
+
+                if writer is None or (os.stat(writer.filename).st_size >= max_length and max_length > 0):
                     # open next file
-                    if fo is not None:
-                        fo.close()
-                    output_filename = output_filename_fmt.format(i)
-                    fo = h5py.File(output_filename, 'a', libver='latest')
+                    if writer is not None:
+                        writer.close()
+                    writer = _open_writer(fi, output_filename_fmt.format(i))
+                    output_filenames.append(writer.filename)
                     i += 1
-                    curr_idx, prev_idx = 0, 0
-
-                    # create datasets and groups
-                    fo.create_group('meta')
-                    fo.create_dataset('msgs', shape=(0,), maxshape=(None,), compression='gzip', dtype=fi['msgs'].dtype)
-                    fo.create_dataset('msg_headers', shape=(0,), maxshape=(None,), compression='gzip', dtype=fi['msg_headers'].dtype)
-
-                    # copy meta data
-                    for attr,value in fi['meta'].attrs.items():
-                        fo['meta'].attrs[attr] = value
-
-                    fo.swmr_mode = True
-
-                # resize datasets
-                prev_idx = curr_idx
-                curr_idx += end - start
-                fo['msgs'].resize((curr_idx,))
-                fo['msg_headers'].resize((curr_idx,))
 
                 # copy data
-                fo['msgs'][prev_idx:curr_idx] = [fi['msgs'][i] for i in range(start,end)] # loop needed because h5py was giving an error
-                fo['msg_headers'][prev_idx:curr_idx] = fi['msg_headers'][start:end]
-
-                fo['msgs'].flush()
-                fo['msg_headers'].flush()
-        except:
-            raise
-        finally:
-            if fo is not None:
-                fo.close()
+                _copy_messages(fi, writer, start, end)
+    finally:
+        if writer is not None:
+            writer.close()
+    for output_filename in output_filenames:
+        _copy_metadata(input_filename, output_filename)
     return
 
 def main(input_filenames, output_filename, max_length=_default_max_length, block_size=_default_block_size, **kwargs):
@@ -38,7 +38,7 @@ setup(
         'bitarray >=0.8',
         'pyzmq >= 18.0',
         'sphinx_rtd_theme >= 0.5',
-        'numpy >= 1.16',
+        'numpy >= 1.17',
         'h5py >= 3.1',
         'bidict >= 0.18.0',
         'networkx >= 2.2'
@@ -0,0 +1,48 @@
+import pytest
+import random
+import numpy as np
+from bitarray import bitarray
+
+import larpix.bitarrayhelper as bah
+
+def _fromuint_str(val, nbits, endian):
+    if endian == 'big':
+        return bitarray(bin(val)[2:].zfill(nbits))
+    return bitarray(bin(val)[-1:1:-1].ljust(nbits,'0'))
+
+@pytest.mark.parametrize('endian', ['big', 'little'])
+def test_fromuint_touint(endian):
+    rng = random.Random(1234)
+    for _ in range(1000):
+        nbits = rng.randint(1, 130)
+        val = rng.getrandbits(nbits)
+        bits = bah.fromuint(val, nbits, endian=endian)
+        assert bits == _fromuint_str(val, nbits, endian)
+        assert bah.touint(bits, endian=endian) == val
+        for bits_endian in ('big', 'little'):
+            assert bah.touint(bitarray(bits, endian=bits_endian), endian=endian) == val
+
+def test_fromuint_slice():
+    assert bah.fromuint(5, slice(2, 6)) == bitarray('0101')
+    assert bah.fromuint(5, slice(2, 6), endian='little') == bitarray('1010')
+
+def test_fromuint_overflow():
+    assert bah.fromuint(5, 2) == bitarray('101')
+    assert bah.fromuint(1 << 64, 64) == bitarray('1' + '0' * 64)
+    assert bah.fromuint(6, 2, endian='little') == bitarray('011')
+
+def test_fromuint_copy():
+    bits = bah.fromuint(3, 2)
+    bits[0] = 0
+    assert bah.fromuint(3, 2) == bitarray('11')
+
+@pytest.mark.parametrize('endian', ['big', 'little'])
+def test_many(endian):
+    vals = np.arange(0, 1 << 12, 37, dtype='u8')
+    bits = bah.fromuint_many(vals, 12, endian=endian)
+    assert bits.shape == (len(vals), 12)
+    for row, val in zip(bits, vals):
+        assert bitarray(row.tolist()) == bah.fromuint(int(val), 12, endian=endian)
+    assert np.all(bah.touint_many(bits, endian=endian) == vals)
+    bitarrays = [bah.fromuint(int(val), 12, endian=endian) for val in vals]
+    assert np.all(bah.touint_many(bitarrays, endian=endian) == vals)
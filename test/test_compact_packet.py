@@ -0,0 +1,164 @@
+import pytest
+import random
+import pickle
+
+from larpix import Packet_v1, Packet_v2, CompactPacket_v1, CompactPacket_v2
+import larpix.format.pacman_msg_format as pacman_msg_format
+from larpix.format.hdf5format import to_file, from_file
+
+v2_fields = ['packet_type', 'chip_id', 'downstream_marker', 'parity',
+    'channel_id', 'timestamp', 'first_packet', 'dataword', 'trigger_type',
+    'local_fifo', 'shared_fifo', 'register_address', 'register_data',
+    'local_fifo_half', 'local_fifo_full', 'shared_fifo_half', 'shared_fifo_full']
+v1_fields = ['chipid', 'chip_id', 'parity_bit_value', 'channel_id',
+    'timestamp', 'dataword', 'fifo_half_flag', 'fifo_full_flag',
+    'register_address', 'register_data', 'test_counter']
+
+@pytest.fixture
+def random_bytes():
+    rng = random.Random(1234)
+    return [bytes(rng.getrandbits(8) for _ in range(8)) for _ in range(100)]
+
+def test_v2_matches_packet(random_bytes):
+    for bs in random_bytes:
+        p = Packet_v2(bs)
+        cp = CompactPacket_v2(bs)
+        assert cp == p
+        assert p == cp
+        assert cp.bytes() == p.bytes()
+        assert cp.bits == p.bits
+        assert cp.as_int() == p.as_int()
+        for field in v2_fields:
+            assert getattr(cp, field) == getattr(p, field), field
+        assert cp.compute_parity() == p.compute_parity()
+        assert cp.has_valid_parity() == p.has_valid_parity()
+        assert str(cp) == str(p)
+        assert cp.export() == p.export()
+
+        p.fifo_diagnostics_enabled = True
+        cp.fifo_diagnostics_enabled = True
+        for field in ('timestamp', 'local_fifo_events', 'shared_fifo_events'):
+            assert getattr(cp, field) == getattr(p, field), field
+
+def test_v2_setters():
+    p = Packet_v2()
+    cp = CompactPacket_v2()
+    for i, field in enumerate(v2_fields):
+        setattr(p, field, i % 2)
+        setattr(cp, field, i % 2)
+        assert cp.bytes() == p.bytes(), field
+    p.assign_parity()
+    cp.assign_parity()
+    assert cp.bytes() == p.bytes()
+    assert cp.has_valid_parity()
+
+    cp.chip_key = '1-2-3'
+    assert cp.chip_key == '1-2-3'
+    assert cp.chip_id == 3
+    cp.chip_id = 4
+    assert cp.chip_key == '1-2-4'
+    cp.io_group = None
+    assert cp.chip_key is None
+
+    cp.bits = p.bits
+    assert cp == p
+
+def test_v2_from_dict():
+    p = Packet_v2()
+    p.packet_type = Packet_v2.CONFIG_READ_PACKET
+    p.chip_key = '1-2-3'
+    p.register_address = 10
+    p.register_data = 20
+    p.direction = 1
+    p.receipt_timestamp = 5
+    cp = CompactPacket_v2()
+    cp.from_dict(p.export())
+    assert cp == p
+    assert cp.export() == p.export()
+
+def test_v2_fifo_diagnostics_enabled(random_bytes):
+    from larpix import PacketView
+    assert CompactPacket_v2.fifo_diagnostics_enabled == Packet_v2.fifo_diagnostics_enabled == False
+    try:
+        CompactPacket_v2.fifo_diagnostics_enabled = True
+        Packet_v2.fifo_diagnostics_enabled = True
+        cp = CompactPacket_v2(random_bytes[0])
+        p = Packet_v2(random_bytes[0])
+        assert cp.fifo_diagnostics_enabled
+        assert PacketView(random_bytes[0]).fifo_diagnostics_enabled
+        for field in ('timestamp', 'local_fifo_events', 'shared_fifo_events'):
+            assert getattr(cp, field) == getattr(p, field), field
+
+        # a single packet can still be switched back
+        cp.fifo_diagnostics_enabled = False
+        assert not cp.fifo_diagnostics_enabled
+        assert CompactPacket_v2.fifo_diagnostics_enabled
+        assert CompactPacket_v2().fifo_diagnostics_enabled
+    finally:
+        CompactPacket_v2.fifo_diagnostics_enabled = False
+        Packet_v2.fifo_diagnostics_enabled = False
+    assert not CompactPacket_v2(random_bytes[0]).fifo_diagnostics_enabled
+
+def test_v2_no_dict():
+    cp = CompactPacket_v2()
+    with pytest.raises(AttributeError):
+        cp.other_attribute = 1
+    cp.direction = 1
+    cp.receipt_timestamp = 12
+    cp2 = pickle.loads(pickle.dumps(cp))
+    assert cp2 == cp
+    assert cp2.receipt_timestamp == 12
+
+def test_v2_pacman_msg_format():
+    packets = [CompactPacket_v2() for _ in range(10)]
+    for i, p in enumerate(packets):
+        p.io_channel = i
+        p.chip_id = i
+    msg = pacman_msg_format.format(packets, msg_type='DATA')
+    assert pacman_msg_format.parse(msg)[1:] == packets
+
+def test_v2_hdf5format(tmpdir):
+    filename = str(tmpdir.join('test.h5'))
+    p = CompactPacket_v2()
+    p.chip_key = '1-2-3'
+    p.timestamp = 123456
+    p.receipt_timestamp = 100
+    p.assign_parity()
+    to_file(filename, [p])
+    new_p = from_file(filename)['packets'][0]
+    assert new_p == p
+    assert new_p.chip_key == p.chip_key
+    assert new_p.receipt_timestamp == p.receipt_timestamp
+
+def test_v1_matches_packet(random_bytes):
+    for bs in random_bytes:
+        bs = bs[:7]
+        p = Packet_v1(bs)
+        cp = CompactPacket_v1(bs)
+        assert cp == p
+        assert cp.bytes() == p.bytes()
+        assert cp.bits == p.bits
+        assert cp.packet_type == p.packet_type
+        for field in v1_fields:
+            assert getattr(cp, field) == getattr(p, field), field
+        assert cp.compute_parity() == p.compute_parity()
+        assert str(cp) == str(p)
+        assert cp.export() == p.export()
+
+def test_v1_setters():
+    p = Packet_v1()
+    cp = CompactPacket_v1()
+    p.packet_type = Packet_v1.CONFIG_WRITE_PACKET
+    cp.packet_type = Packet_v1.CONFIG_WRITE_PACKET
+    assert cp.bytes() == p.bytes()
+    for i, field in enumerate(v1_fields):
+        setattr(p, field, i % 2 + 2 * (field == 'test_counter') * 0x1001)
+        setattr(cp, field, i % 2 + 2 * (field == 'test_counter') * 0x1001)
+        assert cp.bytes() == p.bytes(), field
+    p.assign_parity()
+    cp.assign_parity()
+    assert cp.bytes() == p.bytes()
+
+    cp2 = CompactPacket_v1()
+    cp2.from_dict(p.export())
+    assert cp2 == p
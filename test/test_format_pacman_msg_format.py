@@ -1,5 +1,5 @@
 from larpix.format.pacman_msg_format import *
-from larpix import Packet_v2, TimestampPacket, SyncPacket, TriggerPacket
+from larpix import Packet_v2, TimestampPacket, SyncPacket, TriggerPacket, PacketArray
 
 def test_header():
     print('test_header')
@@ -46,3 +46,87 @@ def test_packets():
 
     assert packets[1:] == new_packets[1:]
     assert isinstance(new_packets[0], TimestampPacket)
+
+def test_parse_to_array():
+    packets = []
+    for i in range(100):
+        packets.append(Packet_v2())
+        packets[-1].chip_id = i
+        packets[-1].io_channel = i % 4
+        packets[-1].receipt_timestamp = 10 * i
+        if i % 30 == 0:
+            packets.append(SyncPacket(timestamp=i, sync_type=b'H', clk_source=1))
+            packets.append(TriggerPacket(timestamp=i, trigger_type=b'\x01'))
+    msgs = [format(packets[:50], msg_type='DATA'), format([], msg_type='DATA'),
+        format(packets[50:], msg_type='DATA')]
+    expected = parse(msgs[0], io_group=1) + parse(msgs[1], io_group=2) \
+        + parse(msgs[2], io_group=3)
+
+    packet_array = parse_to_array(msgs, io_groups=[1, 2, 3])
+    assert packet_array.to_packets() == expected
+    assert list(packet_array.receipt_timestamp) == [
+        getattr(p, 'receipt_timestamp', 0) for p in expected]
+    assert list(packet_array.io_group) == [p.io_group for p in expected]
+    assert list(parse_to_array(msgs[0], io_groups=1)) == expected[:len(parse(msgs[0]))]
+
+    req = parse_to_array(format(packets[:10], msg_type='REQ'))
+    assert req.to_packets()[1:] == [p for p in packets[:10] if isinstance(p, Packet_v2)]
+
+def test_parse_to_array_check_parity():
+    packets = [Packet_v2() for _ in range(10)]
+    for i, p in enumerate(packets):
+        p.chip_id = i
+        p.assign_parity()
+    packets[3].parity = 1 - packets[3].parity
+    msg = format(packets + [SyncPacket(timestamp=1, sync_type=b'H', clk_source=1)], msg_type='DATA')
+
+    packet_array, valid = parse_to_array(msg, io_groups=1, check_parity=True)
+    assert packet_array == parse_to_array(msg, io_groups=1)
+    assert list(valid) == [True] + [p.has_valid_parity() for p in packets] + [True]
+
+    chunks = list(iter_parse([msg] * 3, io_groups=1, chunk_size=5, check_parity=True))
+    assert all(list(chunk_valid) == list(chunk.has_valid_parity()) for chunk, chunk_valid in chunks)
+    assert sum((~chunk_valid).sum() for _, chunk_valid in chunks) == 3
+
+def test_format_array():
+    packets = []
+    for i in range(100):
+        packets.append(Packet_v2())
+        packets[-1].chip_id = i
+        packets[-1].io_channel = i % 4
+        packets[-1].receipt_timestamp = 10 * i
+    words = [p.as_int() for p in packets]
+    io_channels = [p.io_channel for p in packets]
+
+    msg = format_array(words, io_channels)
+    expected = format_msg('REQ', [('TX', p.io_channel, p.bytes()) for p in packets])
+    assert parse_header(msg)[::2] == parse_header(expected)[::2]
+    assert msg[HEADER_LEN:] == expected[HEADER_LEN:]
+    assert format(packets)[HEADER_LEN:] == expected[HEADER_LEN:]
+
+    msg = format_array(words, io_channels, msg_type='DATA',
+        receipt_timestamps=[p.receipt_timestamp for p in packets])
+    assert msg[HEADER_LEN:] == format(packets, msg_type='DATA')[HEADER_LEN:]
+    assert parse(msg)[1:] == packets
+    assert parse_header(format_array([]))[-1] == 0
+
+def test_iter_parse():
+    packets = []
+    for i in range(500):
+        packets.append(Packet_v2())
+        packets[-1].chip_id = i % 256
+        packets[-1].io_channel = i % 4
+        if i % 20 == 0:
+            packets.append(SyncPacket(timestamp=i, sync_type=b'H', clk_source=1))
+    msgs = [format(packets[i:i+37], msg_type='DATA') for i in range(0, len(packets), 37)]
+    expected = parse_to_array(msgs, io_groups=1)
+
+    chunks = list(iter_parse(iter(msgs), io_groups=1, chunk_size=100))
+    assert all(len(chunk) == 100 for chunk in chunks[:-1])
+    assert 0 < len(chunks[-1]) <= 100
+    assert PacketArray.concatenate(chunks) == expected
+
+    data = PacketArray.concatenate(iter_parse(msgs, io_groups=[1] * len(msgs),
+        types=('DATA',), headers=False))
+    assert data.to_packets() == [p for p in packets if isinstance(p, Packet_v2)]
+    assert list(iter_parse([])) == []
@@ -6,6 +6,7 @@ from __future__ import print_function
 import pytest
 import os
 import numpy as np
+import h5py
 from larpix.larpix import Packet_v1, Packet_v2, Controller, Chip, TimestampPacket
 from larpix.io.fakeio import FakeIO
 from larpix.logger.h5_logger import HDF5Logger
@@ -64,3 +65,30 @@ def test_controller_read_capture(tmpdir):
     controller.logger.enable()
     controller.run(0.1,'test')
     assert len(controller.logger._buffer['packets']) == 1
+
+def test_writer_kept_open(tmpdir, monkeypatch):
+    from larpix.format.hdf5format import from_file, HDF5Writer
+    opened = []
+    open_writer = HDF5Writer.open
+    def counted_open(writer):
+        opened.append(writer)
+        open_writer(writer)
+    monkeypatch.setattr(HDF5Writer, 'open', counted_open)
+    logger = HDF5Logger(directory=str(tmpdir), buffer_length=5, enabled=True)
+    for _ in range(30):
+        logger.record([Packet_v2()]*6)
+        logger._worker_queue.join()
+    # file is opened once across non-blocking flushes
+    assert len(opened) == 1
+    assert opened[0].is_open
+    logger.flush()
+    assert not opened[0].is_open
+    assert len(from_file(logger.filename)['packets']) == 180
+    logger.record([Packet_v2()]*6)
+    logger.record([Packet_v2()])
+    logger.disable()
+    assert len(opened) == 2
+    assert not opened[1].is_open
+    assert len(from_file(logger.filename)['packets']) == 187
+    with h5py.File(logger.filename, 'r') as f:
+        assert f['packets'].shape == (187,)
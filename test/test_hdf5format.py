@@ -5,9 +5,10 @@ import h5py
 import copy
 
 from larpix.larpix import (Packet_v1, Packet_v2, PacketCollection, TimestampPacket,
-                           MessagePacket, Key, SyncPacket, TriggerPacket, Chip)
-from larpix.format.hdf5format import (to_file, from_file,
-        dtype_property_index_lookup)
+                           MessagePacket, Key, SyncPacket, TriggerPacket, Chip,
+                           PacketArray)
+from larpix.format.hdf5format import (to_file, from_file, iter_file,
+        HDF5Writer, select, dtype_property_index_lookup)
 
 @pytest.fixture
 def tmpfile(tmpdir):
@@ -434,6 +435,141 @@ def test_from_file_v2_3_many_packets(tmpfile, data_packet_v2,
     assert new_packets[4] == sync_packet
     assert new_packets[5] == trigger_packet
 
+@pytest.mark.parametrize('version', ['2.2', '2.3', '2.4'])
+def test_to_file_packet_array(tmpdir, version, data_packet_v2,
+                              config_read_packet_v2, timestamp_packet,
+                              sync_packet, trigger_packet):
+    packets = [data_packet_v2, config_read_packet_v2, timestamp_packet,
+               sync_packet, trigger_packet]
+    packet_array = PacketArray.from_packets(packets)
+    list_file = str(tmpdir.join('list.h5'))
+    array_file = str(tmpdir.join('array.h5'))
+    to_file(list_file, packet_array.to_packets(), version=version)
+    to_file(array_file, packet_array, version=version)
+    to_file(array_file, packet_array[:2], version=version)
+    with h5py.File(list_file, 'r') as f_list, h5py.File(array_file, 'r') as f_array:
+        assert len(f_array['packets']) == len(packets) + 2
+        assert f_array['packets'][:len(packets)].tolist() == f_list['packets'][:].tolist()
+    assert from_file(array_file)['packets'] == packets + packets[:2]
+
+@pytest.mark.parametrize('version', ['2.3', '2.4'])
+def test_to_file_packet_list_batch(tmpdir, version, data_packet_v2,
+                                   config_read_packet_v2, timestamp_packet,
+                                   sync_packet, trigger_packet):
+    from larpix.format.hdf5format import _encode_packet
+    bad_parity_packet = copy.deepcopy(data_packet_v2)
+    bad_parity_packet.parity = 1 - bad_parity_packet.parity
+    bad_parity_packet.direction = 0
+    packets = [data_packet_v2, config_read_packet_v2, timestamp_packet,
+               bad_parity_packet, sync_packet, trigger_packet]
+    to_file(str(tmpdir.join('list.h5')), packets, version=version)
+    with h5py.File(str(tmpdir.join('list.h5')), 'r') as f:
+        rows = f['packets'][:].tolist()
+    assert rows == [tuple(_encode_packet(p, version, 'packets')) for p in packets]
+    assert [row[dtype_property_index_lookup[version]['packets']['valid_parity']]
+        for row in rows] == [1, 1, 0, 0, 0, 0]
+
+    fifo_packet = copy.deepcopy(data_packet_v2)
+    fifo_packet.fifo_diagnostics_enabled = True
+    to_file(str(tmpdir.join('mixed.h5')), packets + [fifo_packet], version=version)
+    with h5py.File(str(tmpdir.join('mixed.h5')), 'r') as f:
+        assert f['packets'][:].tolist() == [tuple(_encode_packet(p, version, 'packets'))
+            for p in packets + [fifo_packet]]
+
+def test_iter_file(tmpfile, data_packet_v2, config_read_packet_v2,
+                   timestamp_packet, message_packet, sync_packet,
+                   trigger_packet):
+    packets = [data_packet_v2, config_read_packet_v2, timestamp_packet,
+               message_packet, sync_packet, trigger_packet] * 5
+    to_file(tmpfile, packets)
+    expected = from_file(tmpfile)['packets']
+
+    chunks = list(iter_file(tmpfile, chunk_size=4, output='packets'))
+    assert len(chunks) == 8
+    assert [p for chunk in chunks for p in chunk] == expected
+
+    chunks = list(iter_file(tmpfile, chunk_size=4, output='packet_array'))
+    assert PacketArray.concatenate(chunks) == PacketArray.from_packets(
+        [p for p in expected if not isinstance(p, MessagePacket)])
+
+    rows = list(iter_file(tmpfile, chunk_size=4))
+    with h5py.File(tmpfile, 'r') as f:
+        assert [row for chunk in rows for row in chunk.tolist()] == f['packets'][:].tolist()
+
+    rows = list(iter_file(tmpfile, chunk_size=4, fields=('chip_id', 'timestamp'),
+        where=lambda rows: rows['packet_type'] == Packet_v2.CONFIG_READ_PACKET,
+        start=6))
+    assert rows[0].dtype.names == ('chip_id', 'timestamp')
+    assert sum(len(chunk) for chunk in rows) == 4
+
+def test_hdf5_writer(tmpfile, data_packet_v2, config_read_packet_v2,
+                     timestamp_packet, message_packet, sync_packet,
+                     trigger_packet, chip):
+    packets = [data_packet_v2, config_read_packet_v2, timestamp_packet,
+               message_packet, sync_packet, trigger_packet]
+    with HDF5Writer(tmpfile, chunk_size=4, compression='gzip') as writer:
+        for i in range(5):
+            writer.append(packets)
+            assert writer._datasets['packets'].shape[0] >= 6 * (i + 1)
+        writer.append(PacketArray.from_packets(packets[:2]))
+        writer.append_configs([chip])
+        assert writer._datasets['packets'].shape[0] == 48
+    assert not writer.is_open
+
+    with h5py.File(tmpfile, 'r') as f:
+        assert f['packets'].shape == (32,)
+        assert f['packets'].chunks == (4,)
+        assert f['packets'].compression == 'gzip'
+        assert f['messages'].shape == (5,)
+        assert list(f['messages']['index']) == list(range(5))
+        assert f['configs'].shape == (1,)
+    new_packets = from_file(tmpfile)['packets']
+    assert new_packets == packets * 5 + packets[:2]
+
+    writer = HDF5Writer(tmpfile)
+    writer.reserve(100)
+    assert writer._datasets['packets'].shape[0] == 132
+    writer.append(packets)
+    assert writer._datasets['packets'].shape[0] == 132
+    writer.flush()
+    assert writer._datasets['packets'].shape[0] == 38
+    writer.close()
+    with pytest.raises(RuntimeError):
+        HDF5Writer(tmpfile, version='2.0')
+
+def test_select(tmpdir):
+    packets = PacketArray.from_fields(
+        chip_id=[i % 5 + 10 for i in range(1000)],
+        timestamp=list(range(1000)),
+        io_group=1,
+        io_channel=[i // 250 + 1 for i in range(1000)],
+        receipt_timestamp=[i // 10 for i in range(1000)])
+    chip_keys = [Key(1, 2, 12), '1-3-13']
+    selected_packets = packets[
+        ((packets.chip_key == Key(1, 2, 12)) | (packets.chip_key == Key(1, 3, 13)))
+        & (packets.timestamp >= 300) & (packets.timestamp < 600)]
+
+    unindexed_file = str(tmpdir.join('unindexed.h5'))
+    indexed_file = str(tmpdir.join('indexed.h5'))
+    to_file(unindexed_file, packets)
+    to_file(indexed_file, packets[:400])
+    with HDF5Writer(indexed_file, index=True, index_block_size=100) as writer:
+        writer.append(packets[400:700])
+    to_file(indexed_file, packets[700:])
+    with h5py.File(indexed_file, 'r') as f:
+        assert len(f['_index/ranges']) == 10
+        assert f['_index/ranges']['stop'][-1] == 1000
+        assert set(f['_index/chip_keys']['io_channel'][f['_index/chip_keys']['range'] == 0]) == {1}
+
+    for filename in (unindexed_file, indexed_file):
+        assert select(filename, output='packet_array') == packets
+        assert select(filename, chip_keys=chip_keys, t_range=(300, 600),
+            output='packet_array') == selected_packets
+        rows = select(filename, t_range=(None, 10), t_field='receipt_timestamp')
+        assert list(rows['timestamp']) == list(range(100))
+        assert select(filename, chip_keys=['1-4-10'], t_range=(0, 100),
+            output='packets') == []
+
 def test_to_file_v2_4_chips(tmpfile, chip):
     chips = [copy.deepcopy(chip) for i in range(10)]
     for i,chip in enumerate(chips):
@@ -4,13 +4,14 @@ Use the pytest framework to write tests for the larpix module.
 '''
 from __future__ import print_function
 import pytest
-from larpix import (Chip, Packet_v1, Packet_v2, Packet, Key, Configuration, Configuration_v1, Controller,
+from larpix import (Chip, Packet_v1, Packet_v2, Packet, PacketArray, Key, KeyArray, Configuration, Configuration_v1, Controller,
         PacketCollection, _Smart_List, TimestampPacket, MessagePacket)
 from larpix.io import FakeIO
 #from bitstring import BitArray
 from bitarray import bitarray
 import larpix.bitarrayhelper as bah
 import json
+import pickle
 import os
 
 @pytest.fixture
@@ -1849,6 +1850,59 @@ def test_packetcollection_v2_extract():
     expected = [[10,36],[9,38]]
     assert pc.extract('chip_id','dataword', packet_type=Packet_v2.DATA_PACKET) == expected
 
+def test_packetcollection_v2_columnar():
+    packets = [TimestampPacket(5)]
+    for i in range(20):
+        p = Packet_v2()
+        p.chip_key = Key(1, i % 2 + 1, i % 3 + 10)
+        p.packet_type = i % 4
+        p.dataword = i
+        p.timestamp = 100 + i
+        packets.append(p)
+    pc = PacketCollection(packets, message='test')
+    pc_columnar = pc.to_columnar()
+    assert pc_columnar.columnar and not pc.columnar
+    for collection in (pc, pc_columnar):
+        for attrs, selection in (
+                (('dataword',), dict(packet_type=0)),
+                (('chip_key', 'dataword'), dict(chip_id=10)),
+                (('dataword',), dict(chip_key='1-2-11', packet_type=1)),
+                (('dataword',), dict(chip_key=(1,1,10), timestamp=106)),
+                (('timestamp',), dict())):
+            expected = [[getattr(p, attr) for attr in attrs] if len(attrs) > 1 else getattr(p, attrs[0])
+                for p in packets if all(getattr(p, key, None) == value for key, value in selection.items())]
+            assert collection.extract(*attrs, **selection) == expected, (attrs, selection)
+            assert collection.extract(*attrs, **selection) == expected, (attrs, selection)
+        assert list(collection.extract('dataword', packet_type=0, as_array=True)) == [0, 4, 8, 12, 16]
+        assert collection.with_chip_key('1-2-11') == [p for p in packets if p.chip_key == '1-2-11']
+        by_chipid = collection.by_chipid()
+        assert list(by_chipid.keys()) == [10, 11, 12]
+        assert list(by_chipid[11]) == [p for p in packets[1:] if p.chip_id == 11]
+        assert by_chipid[11].parent is collection
+        by_chip_key = collection.by_chip_key()
+        assert list(by_chip_key[Key('1-1-10')]) == [p for p in packets[1:] if p.chip_key == '1-1-10']
+    assert list(pc.index('chip_id')[10]) == [1, 4, 7, 10, 13, 16, 19]
+    assert list(pc_columnar.index('chip_id')[10]) == [1, 4, 7, 10, 13, 16, 19]
+    assert isinstance(pc_columnar[:5].packets, PacketArray)
+
+    # indexes are rebuilt when packets are added
+    pc.extract('dataword', chip_id=10)
+    pc.packets.append(packets[1])
+    assert pc.extract('dataword', chip_id=10) == [0, 3, 6, 9, 12, 15, 18, 0]
+
+    # and when packets are replaced
+    pc.packets[1] = packets[2]
+    assert pc.extract('dataword', chip_id=10) == [3, 6, 9, 12, 15, 18, 0]
+    assert pc.extract('dataword', chip_id=11) == [1, 1, 4, 7, 10, 13, 16, 19]
+    del pc.packets[-1]
+    assert pc.extract('dataword', chip_id=10) == [3, 6, 9, 12, 15, 18]
+
+    # chip keys can be given as a Key, keystring, or tuple
+    chip_key = pc.packets[3].chip_key
+    assert pc.with_chip_key(str(chip_key)) == pc.with_chip_key(chip_key) \
+        == pc.with_chip_key(tuple(chip_key)) == [p for p in pc.packets if p.chip_key == chip_key]
+    assert pc.extract('dataword', chip_key=str(chip_key)) == pc.extract('dataword', chip_key=chip_key)
+
 def test_packetcollection_to_dict():
     packet = Packet()
     packet.chip_id = 246
@@ -2005,3 +2059,35 @@ def test_key():
     d = {}
     d[k] = 'test'
     assert d[k] == 'test'
+    assert d['1-2-3'] == 'test'
+
+def test_key_packed():
+    k = Key(1,2,3)
+    assert k.packed == (1 << 16) | (2 << 8) | 3
+    assert Key.from_packed(k.packed) is k
+    assert Key('1-2-3') is k
+    assert Key(b'1-2-3') is k
+    assert Key(k) is k
+    assert k == Key(1,2,3) and k != Key(1,2,4)
+    assert k == (1,2,3)
+    assert hash(k) == hash('1-2-3')
+    assert pickle.loads(pickle.dumps(k)) is k
+    with pytest.raises(ValueError):
+        Key.from_packed(1 << 24)
+
+def test_key_array():
+    keys = KeyArray.from_columns([1,1,2,1], [2,2,1,2], [3,4,3,3])
+    assert len(keys) == 4
+    assert keys[0] is Key('1-2-3')
+    assert keys.to_keys() == ['1-2-3', '1-2-4', '2-1-3', '1-2-3']
+    assert list(keys == '1-2-3') == [True, False, False, True]
+    assert list(keys != Key(2,1,3)) == [True, True, False, True]
+    assert list(keys.isin(['1-2-4', (2,1,3)])) == [False, True, True, False]
+    assert list(keys.chip_id) == [3,4,3,3]
+    unique, counts = keys.unique(return_counts=True)
+    assert unique.to_keys() == ['1-2-3', '1-2-4', '2-1-3']
+    assert list(counts) == [2, 1, 1]
+    groups = keys.group()
+    assert list(groups[Key('1-2-3')]) == [0, 3]
+    assert list(groups['2-1-3']) == [2]
+    assert KeyArray.from_keys(keys)[1:].to_keys() == keys.to_keys()[1:]
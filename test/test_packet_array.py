@@ -0,0 +1,205 @@
+import pytest
+import numpy as np
+
+from larpix import (Packet_v2, PacketArray, Chip, TimestampPacket, SyncPacket,
+        TriggerPacket, MessagePacket, CompactPacket_v2, parity_errors,
+        has_valid_parity, dedupe)
+
+@pytest.fixture
+def packets():
+    pkts = []
+    for i in range(10):
+        p = Packet_v2()
+        p.packet_type = i % 4
+        p.chip_id = i + 10
+        p.channel_id = i
+        p.timestamp = 1000 * i
+        p.dataword = 2 * i
+        p.register_address = i
+        p.io_group = 1
+        p.io_channel = i % 3
+        p.receipt_timestamp = 100 + i
+        p.assign_parity()
+        pkts.append(p)
+    return pkts
+
+def test_from_packets(packets):
+    pa = PacketArray.from_packets(packets)
+    assert len(pa) == len(packets)
+    assert pa.to_packets() == packets
+    for p, new_p in zip(packets, pa):
+        assert new_p.chip_key == p.chip_key
+        assert new_p.receipt_timestamp == p.receipt_timestamp
+    assert pa.chip_key.to_keys() == [p.chip_key for p in packets]
+
+def test_fields(packets):
+    pa = PacketArray.from_packets(packets)
+    for field in ('packet_type', 'chip_id', 'downstream_marker', 'parity',
+            'channel_id', 'timestamp', 'first_packet', 'dataword',
+            'trigger_type', 'local_fifo', 'shared_fifo', 'register_address',
+            'register_data', 'local_fifo_half', 'shared_fifo_full'):
+        assert list(getattr(pa, field)) == [getattr(p, field) for p in packets], field
+    assert pa.local_fifo_events is None
+
+    pa.fifo_diagnostics_enabled = True
+    for p in packets:
+        p.fifo_diagnostics_enabled = True
+    for field in ('timestamp', 'local_fifo_events', 'shared_fifo_events'):
+        assert list(getattr(pa, field)) == [getattr(p, field) for p in packets], field
+    assert all(p.fifo_diagnostics_enabled for p in pa)
+
+def test_setters():
+    pa = PacketArray(np.zeros(5, dtype='u8'), io_group=2, io_channel=[1,2,3,4,5])
+    pa.chip_id = np.arange(5)
+    pa.packet_type = Packet_v2.CONFIG_WRITE_PACKET
+    pa.register_data = 255
+    for i, p in enumerate(pa):
+        assert p.chip_id == i
+        assert p.packet_type == Packet_v2.CONFIG_WRITE_PACKET
+        assert p.register_data == 255
+        assert p.io_group == 2
+        assert p.io_channel == i + 1
+
+def test_setters_skip_aux_packets():
+    aux_packets = [TimestampPacket(timestamp=123456),
+        SyncPacket(sync_type=b'S', timestamp=99, clk_source=1, io_group=1),
+        TriggerPacket(trigger_type=b'\x02', timestamp=200, io_group=1)]
+    aux_packets[0].io_group = 1
+    pa = PacketArray.from_packets([Packet_v2()] + aux_packets)
+    words = pa.words.copy()
+    pa.chip_id = 7
+    pa.timestamp = [1, 2, 3, 4]
+    pa.trigger_type = 3
+    assert list(pa.words[1:]) == list(words[1:])
+    assert pa.to_packets()[1:] == aux_packets
+    assert list(pa.timestamp) == [1, 123456, 99, 200]
+    assert pa[0].chip_id == 7
+
+def test_indexing(packets):
+    pa = PacketArray.from_packets(packets)
+    assert pa[0] == packets[0]
+    assert pa[-1] == packets[-1]
+    with pytest.raises(IndexError):
+        pa[len(packets)]
+    assert isinstance(pa[:3], PacketArray)
+    assert pa[:3].to_packets() == packets[:3]
+    sel = pa[pa.chip_id > 15]
+    assert sel.to_packets() == [p for p in packets if p.chip_id > 15]
+    assert np.all(sel.receipt_timestamp == [p.receipt_timestamp for p in packets if p.chip_id > 15])
+
+def test_concatenate(packets):
+    pa = PacketArray.concatenate([PacketArray.from_packets(packets[:5]), PacketArray.from_packets(packets[5:])])
+    assert pa == PacketArray.from_packets(packets)
+    assert len(PacketArray.concatenate([])) == 0
+
+def test_parity(packets):
+    packets[3].parity = 1 - packets[3].parity
+    packets[5].parity = 1 - packets[5].parity
+    pa = PacketArray.from_packets(packets)
+    assert list(pa.compute_parity()) == [p.compute_parity() for p in packets]
+    assert list(pa.has_valid_parity()) == [p.has_valid_parity() for p in packets]
+
+    valid, errors = parity_errors(pa)
+    assert list(valid) == [p.has_valid_parity() for p in packets]
+    assert errors == {packets[3].chip_key: 1, packets[5].chip_key: 1}
+
+    pa.assign_parity()
+    assert np.all(pa.has_valid_parity())
+    assert np.all(has_valid_parity(pa.words))
+    assert parity_errors(pa)[1] == dict()
+
+def test_from_arrays(packets):
+    pa = Packet_v2.from_arrays(
+        packet_type=[p.packet_type for p in packets],
+        chip_id=[p.chip_id for p in packets],
+        channel_id=[p.channel_id for p in packets],
+        timestamp=[p.timestamp for p in packets],
+        dataword=[p.dataword for p in packets],
+        register_address=[p.register_address for p in packets],
+        io_group=1,
+        io_channel=[p.io_channel for p in packets],
+        receipt_timestamp=[p.receipt_timestamp for p in packets]
+        )
+    assert pa == PacketArray.from_packets(packets)
+    assert np.all(pa.receipt_timestamp == [p.receipt_timestamp for p in packets])
+    assert pa.to_bytes_array().tobytes() == b''.join(p.bytes() for p in packets)
+    assert pa.to_bytes_array().shape == (len(packets), 8)
+
+    pa = Packet_v2.from_arrays(chip_id=3, parity=0)
+    assert len(pa) == 1
+    assert pa[0].chip_id == 3
+    assert not pa[0].has_valid_parity()
+    with pytest.raises(ValueError):
+        Packet_v2.from_arrays(not_a_field=1)
+
+def test_chip_configuration_packet_array():
+    chip = Chip('1-2-3')
+    chip.config.pixel_trim_dac = [i % 32 for i in range(64)]
+    for packet_type in (Packet_v2.CONFIG_WRITE_PACKET, Packet_v2.CONFIG_READ_PACKET):
+        assert chip.get_configuration_packet_array(packet_type).to_packets() == chip.get_configuration_packets(packet_type)
+        assert chip.get_configuration_packet_array(packet_type, registers=[0, 64]).to_packets() == chip.get_configuration_packets(packet_type, registers=[0, 64])
+    assert list(chip.get_configuration_packet_array(Packet_v2.CONFIG_READ_PACKET).chip_key) == [chip.chip_key] * chip.config.num_registers
+
+def test_aux_packets(packets):
+    packets = [TimestampPacket(12345)] + packets[:3] + [
+        SyncPacket(sync_type=b'H', clk_source=1, timestamp=100, io_group=1)] + packets[3:] + [
+        TriggerPacket(trigger_type=b'\x02', timestamp=200, io_group=1)]
+    packets[0].io_group = 1
+    pa = PacketArray.from_packets(packets)
+    assert pa.to_packets() == packets
+    assert [type(p) for p in pa] == [type(p) for p in packets]
+    assert list(pa.aux_type) == [4, 0, 0, 0, 6] + [0] * 7 + [7]
+    assert list(pa.packet_type) == [getattr(p, 'packet_type') for p in packets]
+    assert list(pa.timestamp) == [p.timestamp for p in packets]
+    assert list(pa.trigger_type[[4, 12]]) == [ord('H'), 2]
+    assert pa.dataword[4] == 1
+    assert list(pa[pa.aux_type == 0].chip_id) == [p.chip_id for p in packets[1:4] + packets[5:12]]
+    assert pa.chip_key[4] == packets[4].chip_key
+    assert np.all(pa.has_valid_parity())
+    pa.assign_parity()
+    assert pa.to_packets() == packets
+    with pytest.raises(TypeError):
+        PacketArray.from_packets([MessagePacket('test', 0)])
+
+def test_aux_packet_slots():
+    for p in (TimestampPacket(0), MessagePacket('test', 0), SyncPacket(), TriggerPacket()):
+        assert not hasattr(p, '__dict__')
+        p.io_group = 1
+        p.direction = 0
+        p.chip_key = '1-0-0'
+        assert p.chip_key == '1-0-0'
+        with pytest.raises(AttributeError):
+            p.other_attribute = 1
+    assert TimestampPacket(0).chip_key is None
+    assert MessagePacket('test', 0).chip_key is None
+
+def test_packet_hash(packets):
+    compact = CompactPacket_v2(packets[0].bytes())
+    assert hash(packets[0]) == hash(Packet_v2(packets[0].bytes()))
+    assert hash(compact) == hash(packets[0])
+    assert len(set(packets + [Packet_v2(p.bytes()) for p in packets])) == len(packets)
+
+def test_dedupe(packets):
+    resent = [Packet_v2(p.bytes()) for p in packets[:4]]
+    for p, orig in zip(resent, packets):
+        p.io_group = orig.io_group
+        p.io_channel = orig.io_channel
+    rerouted = Packet_v2(packets[4].bytes())
+    rerouted.io_group = 2
+    rerouted.io_channel = packets[4].io_channel
+    duplicates = packets + resent + [rerouted,
+        SyncPacket(sync_type=b'S', timestamp=5, io_group=1),
+        SyncPacket(sync_type=b'S', timestamp=5, io_group=1)]
+    expected_index = list(range(10)) + [14, 15]
+
+    unique, index = dedupe(duplicates, return_index=True)
+    assert list(index) == expected_index
+    assert unique == [duplicates[i] for i in expected_index]
+    assert dedupe(duplicates) == unique
+
+    pa = PacketArray.from_packets(duplicates)
+    unique_pa, pa_index = dedupe(pa, return_index=True)
+    assert list(pa_index) == expected_index
+    assert unique_pa == pa[pa_index]
+    assert pa.unique() == unique_pa
+    assert len(dedupe(PacketArray())) == 0
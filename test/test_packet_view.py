@@ -0,0 +1,77 @@
+import pytest
+import pickle
+
+from larpix import Packet_v2, PacketView, SyncPacket, TriggerPacket
+import larpix.format.pacman_msg_format as pacman_msg_format
+from larpix.format.hdf5format import to_file, from_file
+
+@pytest.fixture
+def packets():
+    pkts = []
+    for i in range(5):
+        p = Packet_v2()
+        p.chip_id = i + 10
+        p.channel_id = i
+        p.timestamp = 1000 * i
+        p.io_group = 1
+        p.io_channel = i % 2 + 1
+        p.receipt_timestamp = 100 + i
+        p.assign_parity()
+        pkts.append(p)
+    return pkts
+
+def test_view(packets):
+    buffer = bytearray(b''.join(p.bytes() for p in packets))
+    views = [PacketView(buffer, offset=8*i) for i in range(len(packets))]
+    for p, view in zip(packets, views):
+        assert view == p
+        assert view.is_view
+        assert view.chip_id == p.chip_id
+        assert view.timestamp == p.timestamp
+        assert view.bytes() == p.bytes()
+
+    # views reflect the underlying buffer
+    buffer[0:8] = packets[1].bytes()
+    assert views[0] == packets[1]
+
+    # mutating a view copies the word out of the buffer
+    views[2].chip_id = 20
+    assert not views[2].is_view
+    assert views[2].chip_id == 20
+    assert buffer[16:24] == packets[2].bytes()
+    views[3].detach()
+    assert not views[3].is_view
+    assert views[3] == packets[3]
+
+    with pytest.raises(ValueError):
+        PacketView(buffer, offset=len(buffer) - 4)
+
+def test_view_pickle(packets):
+    view = PacketView(packets[0].bytes())
+    view.io_group = 1
+    view.receipt_timestamp = 5
+    new_view = pickle.loads(pickle.dumps(view))
+    assert new_view == view
+    assert new_view.chip_key == view.chip_key
+    assert new_view.receipt_timestamp == 5
+
+def test_parse_lazy(packets):
+    packets = list(packets)
+    packets.insert(2, SyncPacket(sync_type=b'S', clk_source=1, timestamp=5))
+    packets.insert(4, TriggerPacket(trigger_type=b'\x02', timestamp=7))
+    msg = pacman_msg_format.format(packets, msg_type='DATA')
+    expected = pacman_msg_format.parse(msg, io_group=1)
+    parsed = pacman_msg_format.parse(msg, io_group=1, lazy=True)
+    assert parsed == expected
+    for p, expected_p in zip(parsed[1:], expected[1:]):
+        if isinstance(expected_p, Packet_v2):
+            assert isinstance(p, PacketView)
+            assert p.chip_key == expected_p.chip_key
+            assert p.receipt_timestamp == expected_p.receipt_timestamp
+
+def test_view_hdf5format(packets, tmpdir):
+    filename = str(tmpdir.join('test.h5'))
+    msg = pacman_msg_format.format(packets, msg_type='DATA')
+    views = pacman_msg_format.parse(msg, io_group=1, lazy=True)[1:]
+    to_file(filename, views)
+    assert from_file(filename)['packets'] == packets
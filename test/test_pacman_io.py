@@ -0,0 +1,382 @@
+'''
+Tests for larpix.io.pacman_io module
+
+'''
+import pytest
+import json
+import time
+import zmq
+from collections import defaultdict
+import threading
+import asyncio
+import weakref
+import gc
+
+from larpix import Packet_v2
+from larpix.io.pacman_io import PACMAN_IO, _SharedMessageRing
+import larpix.format.rawhdf5format as rawhdf5format
+from larpix.io.async_pacman_io import AsyncPACMAN_IO
+import larpix.format.pacman_msg_format as pacman_msg_format
+
+def _write_config(tmpdir, io_group_table):
+    filename = str(tmpdir.join('test_conf.json'))
+    config_dict = {
+            "_config_type": "io",
+            "io_class": "PACMAN_IO",
+            "io_group": io_group_table
+        }
+    with open(filename,'w') as of:
+        json.dump(config_dict, of)
+    return filename
+
+@pytest.fixture
+def io_config(tmpdir):
+    return _write_config(tmpdir, [[1, "127.0.0.1"]])
+
+@pytest.fixture
+def pacman_io_obj(io_config, tmpdir):
+    io = PACMAN_IO(io_config, timeout=1000, raw_directory=str(tmpdir))
+    yield io
+    io.cleanup()
+    io.join()
+
+@pytest.fixture
+def dataserver(pacman_io_obj):
+    context = zmq.Context()
+    socket = context.socket(zmq.PUB)
+    socket.bind('tcp://127.0.0.1:' + PACMAN_IO.dataserver_port)
+    yield socket
+    socket.close(linger=0)
+    context.term()
+
+def _wait_for_subscriber(io, dataserver, msg, timeout=5):
+    '''
+    Publish ``msg`` until it is received, to get past the zmq subscription
+    handshake. Returns the packets from the first message that is received
+
+    '''
+    start = time.time()
+    while time.time() < start + timeout:
+        dataserver.send(msg)
+        time.sleep(0.05)
+        packets, _ = io.empty_queue()
+        if packets:
+            return packets
+    pytest.fail('no messages received')
+
+def test_receiver_thread(pacman_io_obj, dataserver):
+    io = pacman_io_obj
+    io.enable_receiver_thread = True
+    io.receiver_buffer_size = 10
+    packets = [Packet_v2(bytes([i]*8)) for i in range(4)]
+    msg = pacman_msg_format.format(packets, msg_type='DATA')
+
+    io.start_listening()
+    assert io._receiver_thread.is_alive()
+    _wait_for_subscriber(io, dataserver, msg)
+    time.sleep(0.1)
+    io.empty_queue()
+
+    for _ in range(5):
+        dataserver.send(msg)
+    start = time.time()
+    while io.backlogged_msgs < 5 and time.time() < start + 5:
+        time.sleep(0.01)
+    assert io.backlogged_msgs == 5
+    assert io.dropped_msgs == 0
+    received_packets, bytestream = io.empty_queue()
+    assert io.backlogged_msgs == 0
+    assert bytestream == msg * 5
+    assert received_packets == pacman_msg_format.parse(msg, io_group=1) * 5
+
+    # overfill the ring buffer, oldest messages are discarded
+    for i in range(15):
+        dataserver.send(pacman_msg_format.format(packets[i%4:i%4+1], msg_type='DATA'))
+    start = time.time()
+    while io.dropped_msgs < 5 and time.time() < start + 5:
+        time.sleep(0.01)
+    assert io.dropped_msgs == 5
+    assert io.backlogged_msgs == 10
+    received_packets, _ = io.empty_queue()
+    assert [p for p in received_packets if isinstance(p, Packet_v2)] \
+        == [packets[i%4] for i in range(5,15)]
+
+    io.stop_listening()
+    assert io._receiver_thread is None
+
+class _Cmdserver(object):
+    '''
+    Minimal pacman-cmdserver stand-in that records each request and replies
+    after ``delay`` seconds. Replies with the request, or with the result of
+    ``handler(request)`` if specified
+
+    '''
+    def __init__(self, context, address, delay=0, handler=None):
+        self.socket = context.socket(zmq.REP)
+        self.socket.bind('tcp://' + address + ':' + PACMAN_IO.cmdserver_port)
+        self.delay = delay
+        self.handler = handler
+        self.requests = []
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.start()
+
+    def run(self):
+        while not self.stop.is_set():
+            if self.socket.poll(10):
+                msg = self.socket.recv()
+                self.requests.append(msg)
+                time.sleep(self.delay)
+                self.socket.send(self.handler(msg) if self.handler else msg)
+
+    def close(self):
+        self.stop.set()
+        self.thread.join()
+        self.socket.close(linger=0)
+
+def test_concurrent_send(tmpdir):
+    io_groups = [1, 2, 3]
+    io = PACMAN_IO(_write_config(tmpdir, [[io_group, '127.0.0.{}'.format(io_group)] for io_group in io_groups]),
+        timeout=1000, raw_directory=str(tmpdir))
+    context = zmq.Context()
+    # no server for io group 3
+    servers = dict([(io_group, _Cmdserver(context, '127.0.0.{}'.format(io_group), delay=0.1)) for io_group in io_groups[:2]])
+    try:
+        io.concurrent_send = True
+        io.double_send_packets = True
+        packets = []
+        for io_group in io_groups:
+            for i in range(2):
+                packet = Packet_v2()
+                packet.io_group = io_group
+                packet.io_channel = i + 1
+                packet.chip_id = io_group
+                packets.append(packet)
+
+        start = time.time()
+        with pytest.raises(RuntimeError):
+            io.send(packets)
+        # io groups 1 and 2 are sent to concurrently, and are not held up
+        # by the timeout on io group 3
+        assert time.time() - start < 1.5
+        assert list(io.send_errors) == [3]
+        for io_group, server in servers.items():
+            address = io._io_group_table[io_group]
+            # compare without the message header timestamp
+            expected = pacman_msg_format.format([p for p in packets if p.io_group == io_group], msg_type='REQ')[8:]
+            assert [msg[8:] for msg in server.requests] == [expected] * 2
+            assert [msg[8:] for msg in io._sender_replies[address]] == [expected] * 2
+    finally:
+        for server in servers.values():
+            server.close()
+        context.term()
+        io.cleanup()
+        io.join()
+
+class _Registers(object):
+    '''
+    Request handler for ``_Cmdserver`` that emulates the pacman registers
+
+    '''
+    bad_reg = 0xDEAD
+
+    def __init__(self):
+        self.regs = defaultdict(int)
+
+    def __call__(self, msg):
+        reply_words = []
+        for word in pacman_msg_format.parse_msg(msg)[1]:
+            if word[0] in ('READ', 'WRITE') and word[1] == self.bad_reg:
+                reply_words.append(('ERR', 1, b'bad register'))
+            elif word[0] == 'WRITE':
+                self.regs[word[1]] = word[2]
+                reply_words.append(word)
+            elif word[0] == 'READ':
+                reply_words.append(('READ', word[1], self.regs[word[1]]))
+            elif word[0] == 'PING':
+                reply_words.append(('PONG',))
+        if not reply_words:
+            return msg
+        return pacman_msg_format.format_msg('REP', reply_words)
+
+def test_async_pacman_io(tmpdir):
+    io_groups = [1, 2, 3]
+    io = AsyncPACMAN_IO(_write_config(tmpdir, [[io_group, '127.0.0.{}'.format(io_group)] for io_group in io_groups]),
+        timeout=1000)
+    context = zmq.Context()
+    # no server for io group 3
+    servers = dict([(io_group, _Cmdserver(context, '127.0.0.{}'.format(io_group), delay=0.02, handler=_Registers()))
+        for io_group in io_groups[:2]])
+
+    async def run():
+        assert await io.ping() == {1: True, 2: True, 3: False}
+
+        # requests to each io group run concurrently, and stay in order
+        # within each io group
+        start = time.time()
+        await asyncio.gather(*[io.set_reg(reg, reg * io_group, io_group=io_group)
+            for reg in range(10) for io_group in io_groups[:2]])
+        values = await asyncio.gather(*[io.get_reg(reg, io_group=io_group)
+            for reg in range(10) for io_group in io_groups[:2]])
+        assert time.time() - start < 0.02 * 40
+        assert values == [reg * io_group for reg in range(10) for io_group in io_groups[:2]]
+
+        packets = []
+        for io_group in io_groups:
+            packet = Packet_v2()
+            packet.io_group = io_group
+            packet.io_channel = 1
+            packets.append(packet)
+        with pytest.raises(RuntimeError):
+            await io.send(packets)
+        assert list(io.send_errors) == [3]
+        assert [msg[8:] for msg in servers[2].requests[-1:]] \
+            == [pacman_msg_format.format(packets[1:2], msg_type='REQ')[8:]]
+
+    try:
+        asyncio.run(run())
+    finally:
+        for server in servers.values():
+            server.close()
+        context.term()
+        io.cleanup()
+
+def test_async_pacman_io_receive(tmpdir):
+    io = AsyncPACMAN_IO(_write_config(tmpdir, [[1, '127.0.0.1']]), timeout=1000)
+    context = zmq.Context()
+    dataserver = context.socket(zmq.PUB)
+    dataserver.bind('tcp://127.0.0.1:' + AsyncPACMAN_IO.dataserver_port)
+    packets = [Packet_v2(bytes([i]*8)) for i in range(4)]
+    msg = pacman_msg_format.format(packets, msg_type='DATA')
+
+    async def run():
+        io.start_listening()
+        # wait for the subscription to be made
+        start = time.time()
+        while time.time() < start + 5:
+            dataserver.send(msg)
+            await asyncio.sleep(0.05)
+            received_packets, bytestream = await io.empty_queue()
+            if received_packets:
+                break
+        assert received_packets == pacman_msg_format.parse(msg, io_group=1) * (len(bytestream) // len(msg))
+
+        for _ in range(3):
+            dataserver.send(msg)
+        received = [received async for received in io.iter_messages(timeout=0.2)]
+        assert received == [(msg, 1)] * 3
+        io.stop_listening()
+
+    try:
+        asyncio.run(run())
+    finally:
+        dataserver.close(linger=0)
+        context.term()
+        io.cleanup()
+
+def test_transact(tmpdir):
+    io_groups = [1, 2]
+    io = PACMAN_IO(_write_config(tmpdir, [[io_group, '127.0.0.{}'.format(io_group)] for io_group in io_groups]),
+        timeout=1000, raw_directory=str(tmpdir))
+    context = zmq.Context()
+    servers = dict([(io_group, _Cmdserver(context, '127.0.0.{}'.format(io_group), handler=_Registers()))
+        for io_group in io_groups])
+    try:
+        assert io.transact([('WRITE', 1, 10), ('READ', 1), ('WRITE', 2, 20), ('READ', 2), ('PING',)], io_group=1) \
+            == [10, 10, 20, 20, True]
+        assert len(servers[1].requests) == 1
+        assert io.transact([('READ', 1), ('READ', 2)]) == {1: [10, 20], 2: [0, 0]}
+        with pytest.raises(RuntimeError):
+            io.transact([('READ', _Registers.bad_reg)], io_group=1)
+        with pytest.raises(ValueError):
+            io.transact([('TX', 1)], io_group=1)
+
+        # helpers use a single round trip where possible
+        for server in servers.values():
+            del server.requests[:]
+        assert io.set_uart_clock_ratio(1, 4, io_group=1) == 4
+        assert len(servers[1].requests) == 1
+        assert io.enable_tile([0, 2], io_group=1) == 0b101
+        assert io.disable_tile(0, io_group=1) == 0b100
+        assert len(servers[1].requests) == 5
+        assert io.reset_larpix(length=64, io_group=2) == 0
+        assert servers[2].handler.regs[io._sw_reset_cycles_reg] == 64
+        assert len(servers[2].requests) == 3
+        assert io.set_vddd(0x1234, io_group=2, settling_time=0) == (0, 0)
+        assert servers[2].handler.regs[io._vddd_dac_reg] == 0x1234
+        assert len(servers[2].requests) == 4
+        # set_reg does not check the reply
+        assert io.set_reg(_Registers.bad_reg, 1, io_group=2) is None
+        assert io.get_reg(io._base_ctrl_reg) == {1: 0b100, 2: 0}
+        assert io.ping() == {1: True, 2: True}
+    finally:
+        for server in servers.values():
+            server.close()
+        context.term()
+        io.cleanup()
+        io.join()
+
+def test_shared_message_ring():
+    ring = _SharedMessageRing(32, 4)
+    try:
+        ring.put([b'a'*10, b'b'*10], [1, 2])
+        msg_bytes, msg_ends, io_groups = ring.get()
+        assert msg_bytes.tobytes() == b'a'*10 + b'b'*10
+        assert list(msg_ends) == [10, 20]
+        assert list(io_groups) == [1, 2]
+
+        # wraps around the end of the ring
+        ring.put([b'c'*20], [3])
+        msg_bytes, msg_ends, io_groups = ring.get()
+        assert msg_bytes.tobytes() == b'c'*20
+        assert list(msg_ends) == [20]
+        assert ring.get()[0].tobytes() == b''
+
+        # messages that do not fit are dropped
+        assert ring.put([b'd'*33, b'e'*8], [1, 2]) == 1
+        assert ring.put([b'e'*8]*4, [1]*4, timeout=0.1) == 1
+        msg_bytes, msg_ends, io_groups = ring.get()
+        assert msg_bytes.tobytes() == b'e'*32
+        assert list(io_groups) == [2, 1, 1, 1]
+    finally:
+        ring.unlink()
+
+def test_cleanup_releases_io(io_config, tmpdir):
+    io = PACMAN_IO(io_config, timeout=1000, raw_directory=str(tmpdir))
+    io_ref = weakref.ref(io)
+    io.cleanup()
+    del io
+    gc.collect()
+    assert io_ref() is None
+
+def test_raw_file_writing(pacman_io_obj, dataserver):
+    io = pacman_io_obj
+    io.enable_raw_file_writing = True
+    io.disable_packet_parsing = True
+    io.raw_buffer_size = 4096
+    packets = [Packet_v2(bytes([i]*8)) for i in range(4)]
+    msg = pacman_msg_format.format(packets, msg_type='DATA')
+
+    io.start_listening()
+    start = time.time()
+    while time.time() < start + 5 and io._raw_file_worker is None:
+        dataserver.send(msg)
+        time.sleep(0.05)
+        io.empty_queue()
+    # more data than fits in the buffer
+    n_msgs = 10 * io.raw_buffer_size // len(msg)
+    for _ in range(n_msgs):
+        dataserver.send(msg)
+    # read until no more messages arrive
+    io.empty_queue()
+    while io.poller.poll(200):
+        io.empty_queue()
+    io.stop_listening()
+    worker = io._raw_file_worker
+    io.join()
+    assert not worker.is_alive()
+
+    rd = rawhdf5format.from_rawfile(io.raw_filename)
+    assert len(rd['msgs']) >= n_msgs
+    assert all([m == msg for m in rd['msgs']])
+    assert set(rd['msg_headers']['io_groups']) == {1}
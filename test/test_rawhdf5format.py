@@ -4,7 +4,13 @@ import pytest
 import h5py
 import numpy as np
 
-from larpix.format.rawhdf5format import (to_rawfile, from_rawfile, len_rawfile)
+import time
+import multiprocessing
+
+from larpix.format.rawhdf5format import (to_rawfile, from_rawfile, len_rawfile,
+    RawFileTailer, RawFileWriter)
+from larpix.format import pacman_msg_format
+from larpix import Packet_v2, SyncPacket, PacketArray
 
 @pytest.fixture
 def tmpfile(tmpdir):
@@ -112,3 +118,90 @@ def test_file_append_v0_0(tmpfile, testdata):
     assert set(rd['msg_headers']['io_groups']) == set(io_groups)
 
 
+
+def test_file_v0_1(tmpfile, testdata):
+    io_groups, msgs = testdata
+    to_rawfile(tmpfile, msgs=msgs, msg_headers={'io_groups':io_groups})
+    to_rawfile(tmpfile, msgs=msgs[0:1] + [b''], msg_headers={'io_groups':io_groups[0:1] + [3]})
+    assert len_rawfile(tmpfile) == len(msgs)+2
+    with h5py.File(tmpfile, 'r') as f:
+        assert f['meta'].attrs['version'] == '0.1'
+        assert f['msgs'].shape == (sum([len(msg) for msg in msgs + msgs[0:1]]),)
+        assert list(f['msg_offsets'][-2:]) == [f['msgs'].shape[0]]*2
+
+    rd = from_rawfile(tmpfile)
+    assert rd['msgs'] == msgs + msgs[0:1] + [b'']
+    assert rd['msg_headers']['io_groups'] == io_groups + io_groups[0:1] + [3]
+
+    rd = from_rawfile(tmpfile, start=1, end=3)
+    assert rd['msgs'] == msgs[1:3]
+    rd = from_rawfile(tmpfile, start=-2)
+    assert rd['msgs'] == msgs[0:1] + [b'']
+    rd = from_rawfile(tmpfile, start=2, end=2)
+    assert rd['msgs'] == []
+    rd = from_rawfile(tmpfile, mask=np.array([0,1,0,1,0]).astype(bool))
+    assert rd['msgs'] == [msgs[1], msgs[0]]
+    assert rd['msg_headers']['io_groups'] == [io_groups[1], io_groups[0]]
+
+    rd = from_rawfile(tmpfile, copy=False)
+    assert all([isinstance(msg, memoryview) for msg in rd['msgs']])
+    assert [msg.tobytes() for msg in rd['msgs']] == msgs + msgs[0:1] + [b'']
+
+    with pytest.raises(AssertionError):
+        to_rawfile(tmpfile, version='0.0')
+
+def _delayed_write(filename, msgs, io_groups, delay):
+    time.sleep(delay)
+    to_rawfile(filename, msgs=msgs, msg_headers={'io_groups':io_groups})
+
+@pytest.mark.parametrize('version', ['0.0','0.1'])
+def test_raw_file_tailer(tmpfile, testdata, version):
+    io_groups, msgs = testdata
+    to_rawfile(tmpfile, version=version, msgs=msgs, msg_headers={'io_groups':io_groups})
+
+    with RawFileTailer(tmpfile, max_msgs=2) as tailer:
+        assert tailer.available() == 3
+        rd = tailer.read()
+        assert rd['msgs'] == msgs[:2]
+        assert rd['msg_headers']['io_groups'] == io_groups[:2]
+        rd = tailer.read()
+        assert rd['msgs'] == msgs[2:]
+        assert tailer.read()['msgs'] == []
+
+        # spawn, so that the writer does not inherit the open file handle
+        writer = multiprocessing.get_context('spawn').Process(target=_delayed_write, args=(tmpfile, msgs, io_groups, 0.2))
+        writer.start()
+        rds = list(tailer.follow(timeout=2))
+        writer.join()
+        assert sum([rd['msgs'] for rd in rds], []) == msgs
+        assert tailer.position == 6
+
+    with RawFileTailer(tmpfile, start=-1) as tailer:
+        assert tailer.read()['msgs'] == msgs[-1:]
+
+def test_raw_file_tailer_parse(tmpfile):
+    msg = pacman_msg_format.format([Packet_v2(b'\x01'*8), SyncPacket(timestamp=12)])
+    to_rawfile(tmpfile, msgs=[msg, msg], msg_headers={'io_groups':[1, 2]})
+    with RawFileTailer(tmpfile, parse=True, copy=False) as tailer:
+        packets = tailer.read()
+        assert isinstance(packets, PacketArray)
+        assert packets == pacman_msg_format.parse_to_array([msg, msg], io_groups=[1, 2])
+        assert len(tailer.read()) == 0
+
+@pytest.mark.parametrize('version', ['0.0','0.1'])
+def test_raw_file_writer(tmpfile, testdata, version):
+    io_groups, msgs = testdata
+    with RawFileWriter(tmpfile, version=version, io_version='0.0', compression=None) as writer:
+        writer.append(msgs, msg_headers={'io_groups':io_groups})
+        assert len_rawfile(tmpfile) == 3
+        writer.append_bytes(b''.join(msgs[:2]), [len(msgs[0]), len(msgs[0]) + len(msgs[1])],
+            msg_headers={'io_groups':io_groups[:2]})
+        assert from_rawfile(tmpfile, start=3)['msgs'] == msgs[:2]
+    assert not writer.is_open
+
+    rd = from_rawfile(tmpfile)
+    assert rd['msgs'] == msgs + msgs[:2]
+    assert rd['msg_headers']['io_groups'] == io_groups + io_groups[:2]
+    assert rd['io_version'] == '0.0'
+    with h5py.File(tmpfile, 'r') as f:
+        assert f['msgs'].compression is None
@@ -41,10 +41,11 @@ def packet_hdf5_tmpfile(tmpdir, test_packets):
         )
     return test_filename
 
-def test_convert_rawhdf5_to_hdf5(tmpdir, raw_hdf5_tmpfile):
+@pytest.mark.parametrize('workers', ['1', '2'])
+def test_convert_rawhdf5_to_hdf5(tmpdir, raw_hdf5_tmpfile, workers):
     out_filename = os.path.join(tmpdir, 'datalog_convert_test.h5')
     proc = subprocess.run(
-        ['python', os.path.join(_dir_,'../scripts/convert_rawhdf5_to_hdf5.py'), '-i', raw_hdf5_tmpfile, '-o', out_filename, '--block_size', '10'],
+        ['python', os.path.join(_dir_,'../scripts/convert_rawhdf5_to_hdf5.py'), '-i', raw_hdf5_tmpfile, '-o', out_filename, '--block_size', '7', '--workers', workers],
         check=True
         )
 